@@ -1,9 +1,12 @@
 # api/__init__.py
 
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .kb_router import router as kb_router
+from .ext import embedding_model
+from .kb_router import document_manager, router as kb_router
 
 
 # from .memo_router import router as memo_router
@@ -25,6 +28,16 @@ def create_app() -> FastAPI:
         allow_headers=["*"],  # 允许所有请求头
     )
 
+    @app.on_event("startup")
+    async def check_embedding_service():
+        # 启动时检查一次嵌入服务连接，API 与向量数据库管理器共用该模型实例
+        await embedding_model.check_connection()
+
+    @app.on_event("startup")
+    async def requeue_unfinished_documents():
+        # 启动时重新入队上次运行中断的文档处理任务
+        await asyncio.to_thread(document_manager.requeue_unfinished_tasks)
+
     # Include the API router
     # app.include_router(memo_router, prefix="/api/memory")
     app.include_router(kb_router, prefix="/api/kb")
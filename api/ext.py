@@ -4,10 +4,10 @@ from typing import Callable
 from fastapi import Request
 
 from api.model import QueryResponseModel
-from config import OLLAMA_API_URL, OLLAMA_MODEL_NAME
-from utils.embedding import AsyncOllamaEmbeddingModel
+from core.ext import get_default_embedding_model
 
-embedding_model = AsyncOllamaEmbeddingModel(OLLAMA_API_URL, OLLAMA_MODEL_NAME)
+# 与 core 中的向量数据库管理器共用同一个嵌入模型实例
+embedding_model = get_default_embedding_model()
 
 
 def require_authorization(func: Callable):
@@ -1,3 +1,4 @@
+import asyncio
 from typing import List, Dict, Any, Optional
 
 from fastapi import APIRouter, HTTPException, Request, Form
@@ -14,7 +15,7 @@ from core.document_queue import (
     DocumentProcessingManager,
     TaskStatus,
 )
-from core.ext import default_kb_db, file_manager
+from core.ext import file_manager, get_default_kb_db
 from utils.user_database import KBUploadRecord
 
 router = APIRouter()
@@ -26,7 +27,8 @@ def convert_function(filepath: str) -> str:
     return convertor.convert()
 
 
-# 初始化文件管理器和文档处理管理器
+# 初始化数据库和文档处理管理器
+default_kb_db = get_default_kb_db()
 document_manager = DocumentProcessingManager(
     kb_database=default_kb_db,
     file_manager=file_manager,
@@ -72,15 +74,17 @@ async def upload_document(
 
         # 如果提供了collection_id，验证集合是否存在
         if collection_id:
-            collection_info = default_kb_db.get_collection_info(collection_id)
+            collection_info = await asyncio.to_thread(
+                default_kb_db.get_collection_info, collection_id
+            )
             if not collection_info:
                 raise HTTPException(status_code=404, detail="指定的集合不存在")
         else:
             collection_id = f"default_{user_token}"
 
-        # 提交任务到处理队列
-        doc_id = document_manager.submit_task(
-            user_token, file, collection_id=collection_id
+        # 提交任务到处理队列（在线程中运行，避免阻塞事件循环）
+        doc_id = await asyncio.to_thread(
+            document_manager.submit_task, user_token, file, collection_id=collection_id
         )
 
         # 注意：collection_id 已经在 submit_task 中处理了，不需要额外的 update_upload_record 调用
@@ -124,7 +128,10 @@ async def get_task_status(request: Request, doc_id: str):
 
             if not processed_file_path.exists():
                 raise HTTPException(status_code=404, detail="处理后的文件不存在")
-            content = file_manager.get_processed_file_content(user_token, doc_id)
+            # 处理后的文本可能很大，读取放到线程中进行，避免阻塞事件循环
+            content = await asyncio.to_thread(
+                file_manager.get_processed_file_content, user_token, doc_id
+            )
         else:
             content = None
 
@@ -185,7 +192,9 @@ async def get_tasks(request: Request):
     """
     try:
         user_token = getattr(request.state, "authorization", None)
-        tasks: list[KBUploadRecord] = default_kb_db.get_user_uploads(user_token)
+        tasks: list[KBUploadRecord] = await asyncio.to_thread(
+            default_kb_db.get_user_uploads, user_token
+        )
 
         tasks_list = []
         for task in tasks:
@@ -232,7 +241,7 @@ async def delete_document(request: Request, doc_id: str):
             raise HTTPException(status_code=401, detail="未找到授权信息")
 
         # 获取上传记录，验证文档是否存在且属于当前用户
-        upload_record = default_kb_db.get_upload_record(doc_id)
+        upload_record = await asyncio.to_thread(default_kb_db.get_upload_record, doc_id)
         if not upload_record:
             raise HTTPException(status_code=404, detail="文档不存在")
 
@@ -240,12 +249,14 @@ async def delete_document(request: Request, doc_id: str):
             raise HTTPException(status_code=403, detail="无权删除此文档")
 
         # 删除数据库记录
-        db_deleted = default_kb_db.delete_upload_record(doc_id)
+        db_deleted = await asyncio.to_thread(default_kb_db.delete_upload_record, doc_id)
         if not db_deleted:
             raise HTTPException(status_code=500, detail="删除数据库记录失败")
 
         # 删除文件系统中的文件
-        file_deleted = file_manager.delete_user_doc(user_token, doc_id)
+        file_deleted = await asyncio.to_thread(
+            file_manager.delete_user_doc, user_token, doc_id
+        )
         if not file_deleted:
             logger.warning(f"删除文件失败，但数据库记录已删除: {doc_id}")
 
@@ -289,12 +300,16 @@ async def get_collection_documents(
             raise HTTPException(status_code=401, detail="未找到授权信息")
 
         # 验证集合是否存在
-        collection_info = default_kb_db.get_collection_info(collection_id)
+        collection_info = await asyncio.to_thread(
+            default_kb_db.get_collection_info, collection_id
+        )
         if not collection_info:
             raise HTTPException(status_code=404, detail="集合不存在")
 
         # 获取集合中的文档
-        documents = default_kb_db.get_collection(user_token, collection_id)
+        documents = await asyncio.to_thread(
+            default_kb_db.get_collection, user_token, collection_id
+        )
 
         # 根据状态过滤（如果提供了status参数）
         if status:
@@ -349,7 +364,9 @@ async def get_user_collections(request: Request):
             raise HTTPException(status_code=401, detail="未找到授权信息")
 
         # 获取用户的所有集合
-        collections = default_kb_db.list_collections(user_token)
+        collections = await asyncio.to_thread(
+            default_kb_db.list_collections, user_token
+        )
 
         logger.info(f"获取用户集合列表: {user_token}, 集合数量: {len(collections)}")
 
@@ -386,7 +403,8 @@ async def create_collection(
         collection_id = str(uuid.uuid4())
 
         # 创建集合
-        success = default_kb_db.create_collection(
+        success = await asyncio.to_thread(
+            default_kb_db.create_collection,
             collection_id=collection_id,
             collection_name=collection_name,
             created_by=user_token,
@@ -445,7 +463,9 @@ async def search_vector_documents(
             raise HTTPException(status_code=401, detail="未找到授权信息")
 
         # 验证集合是否存在
-        collection_info = default_kb_db.get_collection_info(collection_id)
+        collection_info = await asyncio.to_thread(
+            default_kb_db.get_collection_info, collection_id
+        )
         if not collection_info:
             raise HTTPException(status_code=404, detail="指定的集合不存在")
 
@@ -498,7 +518,9 @@ async def list_vector_documents(
             raise HTTPException(status_code=401, detail="未找到授权信息")
 
         # 验证集合是否存在
-        collection_info = default_kb_db.get_collection_info(collection_id)
+        collection_info = await asyncio.to_thread(
+            default_kb_db.get_collection_info, collection_id
+        )
         if not collection_info:
             raise HTTPException(status_code=404, detail="指定的集合不存在")
 
@@ -555,7 +577,9 @@ async def delete_vector_document(
             raise HTTPException(status_code=401, detail="未找到授权信息")
 
         # 验证集合是否存在
-        collection_info = default_kb_db.get_collection_info(collection_id)
+        collection_info = await asyncio.to_thread(
+            default_kb_db.get_collection_info, collection_id
+        )
         if not collection_info:
             raise HTTPException(status_code=404, detail="指定的集合不存在")
 
@@ -603,7 +627,9 @@ async def get_vector_collection_stats(
             raise HTTPException(status_code=401, detail="未找到授权信息")
 
         # 验证集合是否存在
-        collection_info = default_kb_db.get_collection_info(collection_id)
+        collection_info = await asyncio.to_thread(
+            default_kb_db.get_collection_info, collection_id
+        )
         if not collection_info:
             raise HTTPException(status_code=404, detail="指定的集合不存在")
 
@@ -613,7 +639,9 @@ async def get_vector_collection_stats(
         )
 
         # 获取上传记录统计
-        upload_records = default_kb_db.get_collection(user_token, collection_id)
+        upload_records = await asyncio.to_thread(
+            default_kb_db.get_collection, user_token, collection_id
+        )
 
         stats = {
             "collection_id": collection_id,
@@ -652,7 +680,9 @@ async def list_vector_collections(request: Request):
             raise HTTPException(status_code=401, detail="未找到授权信息")
 
         # 获取用户的集合列表
-        collections = default_kb_db.list_collections(user_token)
+        collections = await asyncio.to_thread(
+            default_kb_db.list_collections, user_token
+        )
 
         # 为每个集合添加向量库统计信息
         collection_stats = []
@@ -49,7 +49,9 @@ async def l1_list_memories(request: Request):
     try:
         # authorization = request.headers.get("authorization", "").replace("Bearer ", "")
         with MemoryDB() as db:
-            results = db.get_layer1_records_by_apikey(authorization)
+            results = [
+                row._asdict() for row in db.get_layer1_records_by_apikey(authorization)
+            ]
 
         return OK(data=results)
     except Exception as e:
@@ -149,7 +151,9 @@ async def l3_list_memories(request: Request):
         # authorization = request.headers.get("authorization", "").replace("Bearer ", "")
 
         with MemoryDB() as db:
-            results = db.get_layer3_records_by_apikey(authorization)
+            results = [
+                row._asdict() for row in db.get_layer3_records_by_apikey(authorization)
+            ]
 
         return OK(data=results)
 
@@ -192,8 +196,12 @@ async def search_memories(request: Request, text: str) -> OK[QueryResponseModel]
         layer2 = vector_store.search_by_embedding(embeddings)
 
         with MemoryDB() as db:
-            layer1 = db.get_layer1_records_by_apikey(authorization)
-            layer3 = db.get_layer3_records_by_apikey(authorization)
+            layer1 = [
+                row._asdict() for row in db.get_layer1_records_by_apikey(authorization)
+            ]
+            layer3 = [
+                row._asdict() for row in db.get_layer3_records_by_apikey(authorization)
+            ]
 
         results = QueryResponseModel(layer1=layer1, layer2=layer2, layer3=layer3)
         return OK(data=results)
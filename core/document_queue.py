@@ -7,16 +7,19 @@
 """
 
 import asyncio
+import functools
 import logging
-import queue
+import os
 import threading
 import time
 import uuid
-from concurrent.futures import ThreadPoolExecutor, Future
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
-from typing import Dict, List, Optional, Callable, Any
+from typing import Dict, Iterable, List, Optional, Callable, Any, Set, Union
 
 from fastapi import UploadFile
 from pydantic import BaseModel
@@ -25,6 +28,9 @@ from core.vdb_manager import UserKBVDBManager
 from utils.user_database import KnowledgeBase, KBUploadRecord
 from utils.user_file_manager import UserFileManager
 
+# 转换结果写入文件时的缓冲区大小
+CONVERTED_WRITE_BUFFER_SIZE = 1 << 20
+
 
 class TaskStatus(str, Enum):
     """任务状态枚举"""
@@ -39,14 +45,54 @@ class DocumentTask(BaseModel):
     """文档处理任务模型"""
 
     doc_id: Optional[str] = None
+    user_token: str
+    filename: str
+    file_extension: Optional[str] = None
+    staged_path: Optional[str] = None
+    status: TaskStatus
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    err_msg: Optional[str] = None
+
+
+@dataclass(slots=True)
+class InternalDocumentTask:
+    """队列内部使用的任务对象，字段与 DocumentTask 相同
+
+    队列和工作线程频繁创建、修改任务，使用 slots dataclass 避免 Pydantic 的校验开销，
+    只在返回给调用方时转换为 DocumentTask。
+    """
+
     user_token: str
     filename: str
     status: TaskStatus
     created_at: datetime
+    doc_id: Optional[str] = None
+    file_extension: Optional[str] = None
+    staged_path: Optional[str] = None
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
     err_msg: Optional[str] = None
 
+    def to_model(self) -> DocumentTask:
+        """转换为对外的 DocumentTask 模型
+
+        字段在队列内部已经是正确的类型，使用 model_construct 跳过重复校验。
+        """
+        return DocumentTask.model_construct(
+            doc_id=self.doc_id,
+            user_token=self.user_token,
+            filename=self.filename,
+            file_extension=self.file_extension,
+            staged_path=self.staged_path,
+            status=self.status,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            completed_at=self.completed_at,
+            err_msg=self.err_msg,
+        )
+
 
 class QueueStatus(BaseModel):
     """队列状态模型"""
@@ -60,19 +106,42 @@ class QueueStatus(BaseModel):
 class DocumentQueue:
     """文档处理队列接口（为升级 RabbitMQ 预留）"""
 
-    def add_task(self, task: DocumentTask) -> None:
+    def add_task(self, task: InternalDocumentTask) -> None:
         """添加任务到队列"""
         raise NotImplementedError
 
-    def get_next_task(self) -> Optional[DocumentTask]:
+    def get_next_task(self) -> Optional[InternalDocumentTask]:
         """获取下一个待处理任务"""
         raise NotImplementedError
 
+    def get_next_tasks(self, max_batch: int) -> List[InternalDocumentTask]:
+        """一次获取最多 max_batch 个待处理任务，默认逐个调用 get_next_task"""
+        tasks = []
+        for _ in range(max_batch):
+            task = self.get_next_task()
+            if task is None:
+                break
+            tasks.append(task)
+        return tasks
+
+    def wait_for_task(
+            self, timeout: float, stop_event: Optional[threading.Event] = None
+    ) -> None:
+        """队列为空时等待新任务到达，默认实现为定时轮询；stop_event 被设置时立即返回"""
+        if stop_event is not None:
+            stop_event.wait(min(timeout, 0.1))
+        else:
+            time.sleep(min(timeout, 0.1))
+
+    def wake_all(self) -> None:
+        """唤醒所有在 wait_for_task 中等待的工作线程（停止时调用）"""
+        pass
+
     def update_task_status(self, task_id: str, status: TaskStatus, **kwargs) -> None:
         """更新任务状态"""
         raise NotImplementedError
 
-    def get_task(self, task_id: str) -> Optional[DocumentTask]:
+    def get_task(self, task_id: str) -> Optional[InternalDocumentTask]:
         """根据ID获取任务"""
         raise NotImplementedError
 
@@ -80,44 +149,126 @@ class DocumentQueue:
         """获取队列状态"""
         raise NotImplementedError
 
-    def get_all_tasks(self) -> List[DocumentTask]:
+    def get_all_tasks(self) -> List[InternalDocumentTask]:
         """获取所有任务"""
         raise NotImplementedError
 
+    def get_user_tasks(self, user_token: str) -> List[InternalDocumentTask]:
+        """获取指定用户的所有任务，默认实现为遍历全部任务"""
+        return [
+            task for task in self.get_all_tasks() if task.user_token == user_token
+        ]
+
 
 class MemoryDocumentQueue(DocumentQueue):
     """基于内存的文档队列实现"""
 
-    def __init__(self):
-        self._task_queue = queue.Queue()
-        self._tasks: Dict[str, DocumentTask] = {}
-        self._processing_tasks: Dict[str, DocumentTask] = {}
-        self._completed_tasks: Dict[str, DocumentTask] = {}
-        self._failed_tasks: Dict[str, DocumentTask] = {}
+    def __init__(self, max_finished_tasks: int = 10000):
+        """
+        Args:
+            max_finished_tasks: 内存中保留的已完成和失败任务总数上限，超出后按 FIFO 淘汰，
+                历史记录以数据库为准
+        """
+        # 所有访问都在 self._queue_lock 内进行，无需 queue.Queue 自带的锁和条件变量
+        self._task_queue: deque = deque()
+        self._tasks: Dict[str, InternalDocumentTask] = {}
+        # 任务对象只保存在 _tasks 中，其余结构只记录ID
+        self._processing_ids: Set[str] = set()
+        # 终态任务ID按完成顺序排列，用于 FIFO 淘汰
+        self._finished_ids: deque = deque()
+        self._max_finished_tasks = max_finished_tasks
+        # 按用户索引任务ID（dict 作为有序集合，保持提交顺序且可 O(1) 删除）
+        self._user_task_ids: Dict[str, Dict[str, None]] = defaultdict(dict)
+        self._completed_count = 0
+        self._failed_count = 0
+        # _lock 保护任务记录和计数；待处理队列单独加锁，
+        # 工作线程出队时不会与状态查询、状态更新相互阻塞
         self._lock = threading.Lock()
-
-    def add_task(self, task: DocumentTask) -> None:
+        self._queue_lock = threading.Lock()
+        # 与 _queue_lock 共用同一把锁：入队时只唤醒一个等待中的工作线程
+        self._not_empty = threading.Condition(self._queue_lock)
+
+    def _mark_finished(self, task_id: str) -> None:
+        """记录终态任务，超出上限时从 _tasks 中淘汰最早完成的任务"""
+        self._processing_ids.discard(task_id)
+        self._finished_ids.append(task_id)
+        if len(self._finished_ids) > self._max_finished_tasks:
+            evicted_id = self._finished_ids.popleft()
+            evicted = self._tasks.pop(evicted_id, None)
+            if evicted is not None:
+                user_ids = self._user_task_ids.get(evicted.user_token)
+                if user_ids is not None:
+                    user_ids.pop(evicted_id, None)
+                    if not user_ids:
+                        del self._user_task_ids[evicted.user_token]
+
+    def add_task(self, task: InternalDocumentTask) -> None:
         """添加任务到队列"""
+        task.doc_id = task.doc_id or str(uuid.uuid4())
+        # 先登记任务再入队，出队时任务记录一定已经存在
         with self._lock:
-            task.doc_id = task.doc_id or str(uuid.uuid4())
             self._tasks[task.doc_id] = task
-            self._task_queue.put(task.doc_id)
+            self._user_task_ids[task.user_token][task.doc_id] = None
+        with self._not_empty:
+            self._task_queue.append(task.doc_id)
+            self._not_empty.notify()
 
-    def get_next_task(self) -> Optional[DocumentTask]:
+    def get_next_task(self) -> Optional[InternalDocumentTask]:
         """获取下一个待处理任务"""
-        try:
-            task_id = self._task_queue.get_nowait()
-            with self._lock:
-                if task_id in self._tasks:
-                    task = self._tasks[task_id]
-                    task.status = TaskStatus.PROCESSING
-                    task.started_at = datetime.now()
-                    self._processing_tasks[task_id] = task
-                    return task
-        except queue.Empty:
-            return None
+        with self._queue_lock:
+            try:
+                task_id = self._task_queue.popleft()
+            except IndexError:
+                return None
+        with self._lock:
+            if task_id in self._tasks:
+                task = self._tasks[task_id]
+                task.status = TaskStatus.PROCESSING
+                task.started_at = datetime.now()
+                self._processing_ids.add(task_id)
+                return task
         return None
 
+    def get_next_tasks(self, max_batch: int) -> List[InternalDocumentTask]:
+        """在一次加锁内取出最多 max_batch 个待处理任务"""
+        with self._queue_lock:
+            count = min(len(self._task_queue), max_batch)
+            task_ids = [self._task_queue.popleft() for _ in range(count)]
+        if not task_ids:
+            return []
+
+        tasks = []
+        started_at = datetime.now()
+        with self._lock:
+            for task_id in task_ids:
+                task = self._tasks.get(task_id)
+                if task is None:
+                    continue
+                task.status = TaskStatus.PROCESSING
+                task.started_at = started_at
+                self._processing_ids.add(task_id)
+                tasks.append(task)
+        return tasks
+
+    def wait_for_task(
+            self, timeout: float, stop_event: Optional[threading.Event] = None
+    ) -> None:
+        """
+        阻塞等待新任务入队、被 wake_all 唤醒或超时
+
+        Args:
+            timeout: 最长等待时间（秒）
+            stop_event: 停止信号，在持有锁时检查，设置后调用 wake_all 不会丢失唤醒
+        """
+        with self._not_empty:
+            if not self._task_queue and not (stop_event and stop_event.is_set()):
+                self._not_empty.wait(timeout)
+
+    def wake_all(self) -> None:
+        """唤醒所有等待中的工作线程"""
+        with self._not_empty:
+            self._not_empty.notify_all()
+
     def update_task_status(self, task_id: str, status: TaskStatus, **kwargs) -> None:
         """更新任务状态"""
         with self._lock:
@@ -126,17 +277,17 @@ class MemoryDocumentQueue(DocumentQueue):
                 task.status = status
 
                 if status == TaskStatus.COMPLETED:
-                    task.completed_at = datetime.now()
-                    self._processing_tasks.pop(task_id, None)
-                    self._completed_tasks[task_id] = task
+                    task.completed_at = kwargs.get("completed_at") or datetime.now()
+                    self._mark_finished(task_id)
+                    self._completed_count += 1
                 elif status == TaskStatus.FAILED:
-                    task.completed_at = datetime.now()
+                    task.completed_at = kwargs.get("completed_at") or datetime.now()
                     task.err_msg = kwargs.get("err_msg", "")
-                    self._processing_tasks.pop(task_id, None)
-                    self._failed_tasks[task_id] = task
+                    self._mark_finished(task_id)
+                    self._failed_count += 1
 
-    def get_task(self, task_id: str) -> Optional[DocumentTask]:
-        """根据ID获取任务"""
+    def get_task(self, task_id: str) -> Optional[InternalDocumentTask]:
+        """根据ID获取任务（已淘汰的终态任务返回None，需从数据库查询）"""
         with self._lock:
             return self._tasks.get(task_id)
 
@@ -144,17 +295,24 @@ class MemoryDocumentQueue(DocumentQueue):
         """获取队列状态"""
         with self._lock:
             return QueueStatus(
-                queue_size=self._task_queue.qsize(),
-                processing_tasks=list(self._processing_tasks.keys()),
-                completed_count=len(self._completed_tasks),
-                failed_count=len(self._failed_tasks),
+                queue_size=len(self._task_queue),
+                processing_tasks=list(self._processing_ids),
+                completed_count=self._completed_count,
+                failed_count=self._failed_count,
             )
 
-    def get_all_tasks(self) -> List[DocumentTask]:
+    def get_all_tasks(self) -> List[InternalDocumentTask]:
         """获取所有任务"""
         with self._lock:
             return list(self._tasks.values())
 
+    def get_user_tasks(self, user_token: str) -> List[InternalDocumentTask]:
+        """通过用户索引获取指定用户的所有任务"""
+        with self._lock:
+            task_ids = self._user_task_ids.get(user_token, ())
+            tasks = (self._tasks.get(task_id) for task_id in task_ids)
+            return [task for task in tasks if task is not None]
+
 
 class DocumentProcessingManager:
     """文档处理管理器 - 整合队列、数据库和文件管理"""
@@ -163,10 +321,13 @@ class DocumentProcessingManager:
             self,
             kb_database: KnowledgeBase,
             file_manager: UserFileManager,
-            convert_func: Callable[[str], str],
+            convert_func: Callable[[str], Union[str, Iterable[str]]],
             max_workers: int = 3,
             queue_impl: Optional[DocumentQueue] = None,
             enable_vector_store: bool = True,
+            max_batch: int = 1,
+            convert_in_process: bool = False,
+            max_cpu_concurrency: Optional[int] = None,
     ):
         """
         初始化文档处理管理器
@@ -174,21 +335,38 @@ class DocumentProcessingManager:
         Args:
             kb_database: 用户数据库实例
             file_manager: 文件管理器实例
-            convert_func: 文档转换函数，接收文件路径返回转换后的文本
+            convert_func: 文档转换函数，接收文件路径返回转换后的文本，
+                也可以返回逐块产出文本的迭代器，此时结果边转换边写入文件
             max_workers: 最大并发处理数
             queue_impl: 队列实现，默认使用内存队列
             enable_vector_store: 是否启用向量存储，默认为True
+            max_batch: 每个工作线程一次从队列取出的最大任务数。大量小文档集中上传时
+                调大可减少加锁次数；默认为1，保证任务在工作线程间均匀分配
+            convert_in_process: 是否在子进程池中运行 convert_func。适用于受 GIL 限制的
+                纯 Python 转换器；此时 convert_func 必须可被 pickle 且返回完整文本。
+                转换器本身会释放 GIL 时保持默认的 False 即可
+            max_cpu_concurrency: 同时执行 convert_func 的最大数量，默认为 CPU 核数且不超过 16。
+                与 max_workers 分开设置，max_workers 调得很大时转换也不会超额占用 CPU
         """
         self.kb_database = kb_database
         self.file_manager = file_manager
         self.convert_func = convert_func
         self.max_workers = max_workers
+        self.max_batch = max(1, max_batch)
         self.queue = queue_impl or MemoryDocumentQueue()
         self.enable_vector_store = enable_vector_store
 
-        self._executor = ThreadPoolExecutor(max_workers=max_workers)
-        self._worker_futures: List[Future] = []
-        self._running = False
+        # 限制同时进行的转换数量，避免工作线程过多时 CPU 争用反而变慢
+        if max_cpu_concurrency is None:
+            max_cpu_concurrency = min(os.cpu_count() or 4, 16)
+        self._convert_semaphore = threading.Semaphore(max(1, max_cpu_concurrency))
+        # CPU 密集的转换在独立进程中执行，绕开 GIL；进程池随工作线程启动和停止
+        self._convert_in_process = convert_in_process
+        self._convert_executor: Optional[ProcessPoolExecutor] = None
+        # 工作线程是常驻循环，直接使用线程而不经过线程池的任务队列
+        self._workers: List[threading.Thread] = []
+        # 停止信号：设置后空闲的工作线程被立即唤醒并退出
+        self._stop_event = threading.Event()
         self._lock = threading.Lock()
 
         # 使用 Semaphore 控制最大并发数
@@ -198,31 +376,93 @@ class DocumentProcessingManager:
         # 缓存用户的VDB管理器实例
         self._vdb_managers: Dict[str, UserKBVDBManager] = {}
 
-        # 启动工作线程
+        # 缓存用户的文档目录，避免每个任务都重复 mkdir
+        self._get_doc_dirs = functools.lru_cache(maxsize=512)(
+            self.file_manager.get_doc_dirs
+        )
+
         self.start_workers()
 
+    def requeue_unfinished_tasks(self) -> int:
+        """
+        将数据库中 pending/processing 状态的记录重新加入队列
+
+        内存队列在进程重启后为空，数据库的上传记录充当预写日志：处理中被中断的任务
+        同样视为待处理，从头重新执行。已在队列中的任务会被跳过，重复调用不会重复入队。
+        会访问数据库和文件系统，由应用启动钩子显式调用，不在构造时执行。
+
+        Returns:
+            int: 重新入队的任务数
+        """
+        try:
+            records = self.kb_database.get_uploads_by_statuses(
+                (TaskStatus.PENDING.value, TaskStatus.PROCESSING.value)
+            )
+        except Exception as e:
+            logging.error(f"Failed to load unfinished tasks: {e}")
+            return 0
+
+        requeued = 0
+        for record in records:
+            if self.queue.get_task(record.doc_id) is not None:
+                continue
+            staged_path = self.file_manager.find_staged_file(
+                record.user_token, record.doc_id
+            )
+            self.queue.add_task(
+                InternalDocumentTask(
+                    doc_id=record.doc_id,
+                    user_token=record.user_token,
+                    filename=record.filename,
+                    file_extension=Path(record.filename).suffix,
+                    staged_path=str(staged_path) if staged_path else None,
+                    status=TaskStatus.PENDING,
+                    created_at=record.upload_time,
+                )
+            )
+            requeued += 1
+
+        if requeued:
+            logging.info(f"Requeued {requeued} unfinished document tasks")
+        return requeued
+
     def start_workers(self):
         """启动工作线程"""
         with self._lock:
-            if not self._running:
-                self._running = True
+            if not self._workers:
+                self._stop_event.clear()
+                # stop_workers 会关闭进程池，重新启动时需要重建
+                if self._convert_in_process and self._convert_executor is None:
+                    self._convert_executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers
+                    )
                 for i in range(self.max_workers):
-                    future = self._executor.submit(self._worker_loop)
-                    self._worker_futures.append(future)
+                    worker = threading.Thread(
+                        target=self._worker_loop,
+                        name=f"document-worker-{i}",
+                        daemon=True,
+                    )
+                    worker.start()
+                    self._workers.append(worker)
 
     def stop_workers(self):
         """停止工作线程"""
+        self._stop_event.set()
+        # 唤醒在队列上等待的工作线程，使其立即看到停止信号
+        self.queue.wake_all()
+
         with self._lock:
-            self._running = False
+            workers, self._workers = self._workers, []
 
-        # 等待所有任务完成
-        for future in self._worker_futures:
-            try:
-                future.result(timeout=5)
-            except Exception as e:
-                logging.error(f"Worker thread error: {e}")
+        # 等待工作线程完成当前任务后退出
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                logging.error(f"Worker thread {worker.name} did not stop in time")
 
-        self._executor.shutdown(wait=True)
+        executor, self._convert_executor = self._convert_executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
 
     def _worker_loop(self):
         """工作线程循环"""
@@ -232,64 +472,105 @@ class DocumentProcessingManager:
         self._event_loop = loop
 
         try:
-            while self._running:
+            while not self._stop_event.is_set():
                 try:
-                    task = self.queue.get_next_task()
-                    if task:
-                        # 在事件循环中运行协程
-                        loop.run_until_complete(self._process_document_task(task))
+                    tasks = self.queue.get_next_tasks(self.max_batch)
+                    if tasks:
+                        # 在事件循环中依次处理本批任务，期间无需再访问队列
+                        for task in tasks:
+                            loop.run_until_complete(self._process_document_task(task))
                     else:
-                        time.sleep(0.1)  # 没有任务时短暂休眠
+                        # 没有任务时等待新任务入队或停止信号
+                        self.queue.wait_for_task(
+                            timeout=1.0, stop_event=self._stop_event
+                        )
                 except Exception as e:
                     logging.error(f"Worker loop error: {e}")
         finally:
             loop.close()
 
-    async def _process_document_task(self, task: DocumentTask):
-        """处理单个文档任务（协程版本）"""
+    async def _process_document_task(self, task: InternalDocumentTask):
+        """
+        处理单个文档任务（协程版本）
+
+        协程在工作线程自己的事件循环中逐个运行，数据库、文件和转换这些阻塞调用
+        直接在工作线程内执行，不再经 asyncio.to_thread 转交给另一个线程池。
+        """
         async with self._semaphore:  # 控制最大并发数
             try:
+                # 处理开始时间复用出队时记录的时间，只获取一次
+                start_time = task.started_at or datetime.now()
+
                 # 更新数据库状态为处理中
-                await asyncio.to_thread(
-                    self.kb_database.update_upload_record,
+                self.kb_database.update_upload_record(
                     task.doc_id,
                     status="processing",
-                    process_start_time=datetime.now(),
+                    process_start_time=start_time,
                 )
 
                 # 获取文件路径
-                upload_record = await asyncio.to_thread(
-                    self.kb_database.get_upload_record, task.doc_id
-                )
+                upload_record = self.kb_database.get_upload_record(task.doc_id)
 
                 if not upload_record:
                     raise Exception(
                         f"Upload record not found for doc_id: {task.doc_id}"
                     )
 
-                # 获取原始文件路径 - 注意save_uploaded_file时已经保存了文件
-                # 我们需要重构这里，根据文件名和用户token构建文件路径
-                original_dir, processed_dir = self.file_manager.get_doc_dirs(
-                    task.user_token
-                )
-
-                # 根据doc_id查找原始文件
-                file_extension = Path(task.filename).suffix
-                original_file_path = original_dir / f"{task.doc_id}{file_extension}"
+                # 根据文件名和用户token构建文件路径
+                original_dir, processed_dir = self._get_doc_dirs(task.user_token)
 
-                if not original_file_path.exists():
-                    raise Exception(f"Original file not found: {original_file_path}")
-
-                # 调用转换函数（在线程中运行，避免阻塞事件循环）
-                converted_text = await asyncio.to_thread(
-                    self.convert_func, str(original_file_path)
+                file_extension = (
+                    task.file_extension
+                    if task.file_extension is not None
+                    else Path(task.filename).suffix
                 )
 
-                # 保存转换后的文本（在线程中运行）
+                if task.staged_path:
+                    # 上传时文件只写入了暂存区，这里移动到原始文件目录；
+                    # 移动成功即说明文件存在，无需再检查
+                    original_file_path = self.file_manager.commit_staged_file(
+                        Path(task.staged_path),
+                        task.user_token,
+                        task.doc_id,
+                        file_extension,
+                    )
+                    task.staged_path = None
+                else:
+                    # 根据doc_id查找原始文件
+                    original_file_path = (
+                        original_dir / f"{task.doc_id}{file_extension}"
+                    )
+                    if not original_file_path.exists():
+                        raise Exception(
+                            f"Original file not found: {original_file_path}"
+                        )
+
                 processed_file_path = processed_dir / f"{task.doc_id}.txt"
-                await asyncio.to_thread(
-                    self._save_converted_text, processed_file_path, converted_text
-                )
+                # 重启后重新执行的任务可能已经写出了转换结果，直接复用
+                resumed = processed_file_path.exists()
+                if resumed:
+                    converted_text = (
+                        processed_file_path.read_text(encoding="utf-8")
+                        if self.enable_vector_store
+                        else ""
+                    )
+                else:
+                    # 调用转换函数
+                    with self._convert_semaphore:
+                        executor = self._convert_executor
+                        if executor is not None:
+                            converted = executor.submit(
+                                self.convert_func, str(original_file_path)
+                            ).result()
+                        else:
+                            converted = self.convert_func(str(original_file_path))
+
+                    # 保存转换后的文本，分块输出时边转换边写入
+                    converted_text = self._save_converted_text(
+                        processed_file_path,
+                        converted,
+                        self.enable_vector_store,
+                    )
 
                 # 如果启用了向量存储，将文档添加到向量库
                 if self.enable_vector_store and converted_text.strip():
@@ -303,17 +584,24 @@ class DocumentProcessingManager:
                         chunks = self._split_text_into_chunks(converted_text)
 
                         if chunks:
-                            # 生成元数据
+                            if resumed:
+                                # 清理中断前可能已写入的部分向量，避免重复添加
+                                vdb_manager.delete_document(collection_id, task.doc_id)
+
+                            # 生成元数据，文档级字段只构建一次
+                            base_metadata = {
+                                "doc_id": task.doc_id,
+                                "user_token": task.user_token,
+                                "collection_id": collection_id,
+                                "filename": task.filename,
+                                "created_at": datetime.now().isoformat(),
+                            }
                             metadata_list = [
-                                {
-                                    "doc_id": task.doc_id,
-                                    "chunk_index": i,
-                                    "user_token": task.user_token,
-                                    "collection_id": collection_id,
-                                    "filename": task.filename,
-                                    "text_length": len(chunk),
-                                    "created_at": datetime.now().isoformat(),
-                                }
+                                dict(
+                                    base_metadata,
+                                    chunk_index=i,
+                                    text_length=len(chunk),
+                                )
                                 for i, chunk in enumerate(chunks)
                             ]
 
@@ -335,15 +623,17 @@ class DocumentProcessingManager:
                             f"Failed to add document to vector store: {str(e)}"
                         )
 
-                # 更新任务状态为完成
-                self.queue.update_task_status(task.doc_id, TaskStatus.COMPLETED)
+                # 更新任务状态为完成，内存与数据库使用同一个完成时间
+                end_time = datetime.now()
+                self.queue.update_task_status(
+                    task.doc_id, TaskStatus.COMPLETED, completed_at=end_time
+                )
 
                 # 更新数据库状态为完成
-                await asyncio.to_thread(
-                    self.kb_database.update_upload_record,
+                self.kb_database.update_upload_record(
                     task.doc_id,
                     status="completed",
-                    process_end_time=datetime.now(),
+                    process_end_time=end_time,
                 )
 
                 logging.info(f"Successfully processed document: {task.doc_id}")
@@ -353,26 +643,78 @@ class DocumentProcessingManager:
                 logging.error(f"Failed to process document {task.doc_id}: {error_msg}")
 
                 # 更新任务状态为失败
+                end_time = datetime.now()
                 self.queue.update_task_status(
-                    task.doc_id, TaskStatus.FAILED, err_msg=error_msg
+                    task.doc_id,
+                    TaskStatus.FAILED,
+                    err_msg=error_msg,
+                    completed_at=end_time,
                 )
 
                 # 更新数据库状态为失败
-                await asyncio.to_thread(
-                    self._update_failed_record, task.doc_id, error_msg
-                )
+                self._update_failed_record(task.doc_id, error_msg, end_time)
+
+                # 失败任务不会再被重新执行，删除未移动的暂存文件
+                if task.staged_path:
+                    try:
+                        self.file_manager.discard_staged_file(
+                            task.user_token, task.doc_id
+                        )
+                    except OSError as cleanup_error:
+                        logging.warning(
+                            f"Failed to discard staged file for {task.doc_id}: {cleanup_error}"
+                        )
+                    task.staged_path = None
 
-    def _save_converted_text(self, file_path: Path, text: str):
-        """保存转换后的文本到文件"""
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(text)
+    def _save_converted_text(
+            self,
+            file_path: Path,
+            converted: Union[str, Iterable[str]],
+            keep_text: bool = True,
+    ) -> str:
+        """
+        保存转换后的文本到文件
+
+        Args:
+            file_path: 输出文件路径
+            converted: 转换结果，完整文本或逐块产出的文本
+            keep_text: 是否需要返回完整文本（向量化时需要）
 
-    def _update_failed_record(self, doc_id: str, error_msg: str):
+        Returns:
+            完整文本；分块输出且 keep_text 为 False 时返回空字符串，
+            此时文本不会在内存中完整保留
+        """
+        # 先写入临时文件再重命名，目标文件存在即说明转换结果完整，任务重新执行时可直接复用
+        tmp_path = file_path.with_name(file_path.name + ".tmp")
+        try:
+            # 以二进制写入：完整文本只编码一次，一次 write 落盘，不经过文本层的分块编码
+            with open(tmp_path, "wb", buffering=CONVERTED_WRITE_BUFFER_SIZE) as f:
+                if isinstance(converted, str):
+                    f.write(converted.encode("utf-8"))
+                    parts = None
+                else:
+                    parts = [] if keep_text else None
+                    for chunk in converted:
+                        f.write(chunk.encode("utf-8"))
+                        if parts is not None:
+                            parts.append(chunk)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        if isinstance(converted, str):
+            return converted
+        return "".join(parts) if parts is not None else ""
+
+    def _update_failed_record(
+            self, doc_id: str, error_msg: str, end_time: Optional[datetime] = None
+    ):
         """更新失败的记录"""
         self.kb_database.update_upload_record(
             doc_id,
             status="failed",
-            process_end_time=datetime.now(),
+            process_end_time=end_time or datetime.now(),
             err_msg=error_msg,
         )
 
@@ -395,48 +737,99 @@ class DocumentProcessingManager:
         Returns:
             文档ID
         """
-        # 生成或使用提供的文档ID
-        doc_id = doc_id or str(uuid.uuid4())
+        return self.submit_tasks(
+            user_token, [file], collection_id=collection_id, doc_ids=[doc_id]
+        )[0]
+
+    def submit_tasks(
+            self,
+            user_token: str,
+            files: List[UploadFile],
+            collection_id: Optional[str] = None,
+            doc_ids: Optional[List[Optional[str]]] = None,
+    ) -> List[str]:
+        """
+        批量提交文档处理任务，所有上传记录在一个事务中写入数据库
+
+        Args:
+            user_token: 用户令牌
+            files: 上传的文件列表
+            collection_id: 可选的集合ID，所有文件都加入该集合
+            doc_ids: 与 files 一一对应的文档ID，为None的项自动生成
+
+        Returns:
+            文档ID列表，顺序与 files 一致
+        """
+        if not files:
+            return []
+        doc_ids = [
+            doc_id or str(uuid.uuid4())
+            for doc_id in (doc_ids or [None] * len(files))
+        ]
 
         # 确保用户存在
         self.kb_database.create_user_if_not_exists(user_token)
 
-        # 保存上传的文件
-        self.file_manager.save_uploaded_file(file, user_token, doc_id)
-
-        # 创建上传记录
-        upload_record = KBUploadRecord(
-            doc_id=doc_id,
-            user_token=user_token,
-            collection_id=collection_id,
-            filename=file.filename,
-            status="pending",
-            upload_time=datetime.now(),
-            mime_type=file.content_type,
-        )
-        self.kb_database.add_upload_record(upload_record)
+        # 上传文件先写入暂存区，移动到原始文件目录由工作线程完成；
+        # 暂存或创建上传记录任一步失败（如 doc_id 重复）时删除已暂存的文件，避免残留
+        staged_paths = []
+        try:
+            for file, doc_id in zip(files, doc_ids):
+                staged_paths.append(
+                    self.file_manager.stage_uploaded_file(file, user_token, doc_id)
+                )
+
+            # 创建上传记录
+            upload_time = datetime.now()
+            self.kb_database.add_upload_records(
+                [
+                    KBUploadRecord(
+                        doc_id=doc_id,
+                        user_token=user_token,
+                        collection_id=collection_id,
+                        filename=file.filename,
+                        status="pending",
+                        upload_time=upload_time,
+                        mime_type=file.content_type,
+                    )
+                    for file, doc_id in zip(files, doc_ids)
+                ]
+            )
+        except Exception:
+            for doc_id in doc_ids[: len(staged_paths)]:
+                self.file_manager.discard_staged_file(user_token, doc_id)
+            raise
 
         # 创建任务并添加到队列
-        task = DocumentTask(
-            doc_id=doc_id,
-            user_token=user_token,
-            filename=file.filename,
-            status=TaskStatus.PENDING,
-            created_at=datetime.now(),
-        )
-        self.queue.add_task(task)
+        for file, doc_id, staged_path in zip(files, doc_ids, staged_paths):
+            task = InternalDocumentTask(
+                doc_id=doc_id,
+                user_token=user_token,
+                filename=file.filename,
+                file_extension=Path(file.filename).suffix,
+                staged_path=str(staged_path),
+                status=TaskStatus.PENDING,
+                created_at=upload_time,
+            )
+            self.queue.add_task(task)
 
-        logging.info(
-            f"Submitted task for document: {doc_id}, collection: {collection_id}"
-        )
-        return doc_id
+            logging.info(
+                f"Submitted task for document: {doc_id}, collection: {collection_id}"
+            )
+        return doc_ids
 
     def get_task_status(self, doc_id: str) -> Optional[DocumentTask]:
-        """获取任务状态"""
+        """获取任务状态，优先使用内存中的任务，已淘汰或重启前的任务再查询数据库"""
+        task = self.queue.get_task(doc_id)
+        if task is not None:
+            # 转换为新的模型对象，调用方修改不会影响工作线程正在使用的任务
+            return task.to_model()
+
         rsp: KBUploadRecord = self.kb_database.get_upload_record(doc_id)
         if not rsp:
             raise ValueError(f"Document with ID {doc_id} not found")
-        return DocumentTask(
+        # 数据库记录已解析为正确的类型，跳过 Pydantic 校验
+        return DocumentTask.model_construct(
             doc_id=rsp.doc_id,
             user_token=rsp.user_token,
             filename=rsp.filename,
@@ -453,12 +846,11 @@ class DocumentProcessingManager:
 
     def get_user_tasks(self, user_token: str) -> List[DocumentTask]:
         """获取用户的所有任务"""
-        all_tasks = self.queue.get_all_tasks()
-        return [task for task in all_tasks if task.user_token == user_token]
+        return [task.to_model() for task in self.queue.get_user_tasks(user_token)]
 
     def get_all_tasks(self) -> List[DocumentTask]:
         """获取所有任务"""
-        return self.queue.get_all_tasks()
+        return [task.to_model() for task in self.queue.get_all_tasks()]
 
     def get_vdb_manager(self, user_token: str) -> UserKBVDBManager:
         """获取用户的VDB管理器（公共接口）"""
@@ -567,21 +959,20 @@ class DocumentProcessingManager:
         if not text:
             return []
 
-        chunks = []
-        start = 0
-        text_len = len(text)
-
-        while start < text_len:
-            end = min(start + chunk_size, text_len)
-            chunk = text[start:end]
-            chunks.append(chunk)
-
-            if end >= text_len:
-                break
+        step = chunk_size - overlap
+        if step <= 0:
+            raise ValueError(
+                f"chunk_size ({chunk_size}) must be greater than overlap ({overlap})"
+            )
 
-            start = end - overlap
+        # 直接计算最后一块的起点，每块只做一次切片
+        text_len = len(text)
+        last_start = max(0, -(-(text_len - chunk_size) // step) * step)
 
-        return chunks
+        return [
+            text[start: start + chunk_size]
+            for start in range(0, last_start + 1, step)
+        ]
 
     def __enter__(self):
         return self
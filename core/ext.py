@@ -1,7 +1,33 @@
+from functools import lru_cache
+
+from config import OLLAMA_API_URL, OLLAMA_MODEL_NAME
+from utils.embedding import AsyncOllamaEmbeddingModel
 from utils.user_database import SQLiteUserDatabase, SQLiteKnowledgeBaseDB
 from utils.user_file_manager import LocalUserFileManager
 
-# 默认数据库实例
+# 默认文件管理器实例
 file_manager = LocalUserFileManager("data")
-default_user_db = SQLiteUserDatabase(file_manager.user_root_dir / "user.db")
-default_kb_db = SQLiteKnowledgeBaseDB(file_manager.user_root_dir / "user.db")
+
+
+# 默认数据库实例在首次使用时创建，仅导入本模块不会打开数据库或执行建表
+@lru_cache(maxsize=None)
+def get_default_kb_db() -> SQLiteKnowledgeBaseDB:
+    """获取默认知识库数据库实例"""
+    return SQLiteKnowledgeBaseDB(file_manager.user_root_dir / "user.db")
+
+
+def get_default_user_db() -> SQLiteUserDatabase:
+    """获取默认用户数据库实例
+
+    与知识库共用同一个数据库文件，直接复用知识库实例，两者共享连接和用户缓存。
+    """
+    return get_default_kb_db()
+
+
+@lru_cache(maxsize=None)
+def get_default_embedding_model() -> AsyncOllamaEmbeddingModel:
+    """获取默认嵌入模型实例
+
+    API 层与各用户的向量数据库管理器共用同一个实例，启动时只需检查一次连接。
+    """
+    return AsyncOllamaEmbeddingModel(OLLAMA_API_URL, OLLAMA_MODEL_NAME)
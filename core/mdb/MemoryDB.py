@@ -1,5 +1,24 @@
 import abc
-from typing import List, Dict, Any
+from typing import Iterator, List, NamedTuple, Tuple
+
+
+class Layer1Row(NamedTuple):
+    """layer1 表记录"""
+
+    id: int
+    apikey: str
+    content: str
+    timestamp: str
+
+
+class Layer3Row(NamedTuple):
+    """layer3 表记录"""
+
+    id: int
+    apikey: str
+    behavior: str
+    instruction: str
+    timestamp: str
 
 
 class MemoryDatabaseInterface(abc.ABC):
@@ -31,12 +50,32 @@ class MemoryDatabaseInterface(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def get_layer1_records_by_apikey(self, apikey: str) -> List[Dict[str, Any]]:
+    def add_layer1_records(self, rows: List[Tuple[str, str]]) -> int:
+        """批量添加 layer1 记录"""
+        pass
+
+    @abc.abstractmethod
+    def add_layer3_records(self, rows: List[Tuple[str, str, str]]) -> int:
+        """批量添加 layer3 记录"""
+        pass
+
+    @abc.abstractmethod
+    def iter_layer1_records_by_apikey(self, apikey: str) -> Iterator[Layer1Row]:
+        """根据 apikey 流式迭代 layer1 记录"""
+        pass
+
+    @abc.abstractmethod
+    def iter_layer3_records_by_apikey(self, apikey: str) -> Iterator[Layer3Row]:
+        """根据 apikey 流式迭代 layer3 记录"""
+        pass
+
+    @abc.abstractmethod
+    def get_layer1_records_by_apikey(self, apikey: str) -> List[Layer1Row]:
         """根据 apikey 获取 layer1 记录"""
         pass
 
     @abc.abstractmethod
-    def get_layer3_records_by_apikey(self, apikey: str) -> List[Dict[str, Any]]:
+    def get_layer3_records_by_apikey(self, apikey: str) -> List[Layer3Row]:
         """根据 apikey 获取 layer3 记录"""
         pass
 
@@ -1,8 +1,96 @@
-import datetime
+import atexit
+import functools
 import sqlite3
-from typing import List, Dict, Any
+import threading
+import weakref
+from typing import Dict, Iterator, List, Tuple
+
+from .MemoryDB import Layer1Row, Layer3Row, MemoryDatabaseInterface
+
+# 预定义 SQL 语句，保证相同字面量命中 sqlite3 的语句缓存
+# 时间戳由 SQLite 生成（本地时间，格式与 "%Y-%m-%d %H:%M:%S" 一致）
+_SQL_NOW = "datetime('now', 'localtime')"
+_SQL_INSERT_L1 = (
+    "INSERT INTO layer1 (apikey, content, timestamp) "
+    f"VALUES (?, ?, {_SQL_NOW})"
+)
+_SQL_INSERT_L3 = (
+    "INSERT INTO layer3 (apikey, behavior, instruction, timestamp) "
+    f"VALUES (?, ?, ?, {_SQL_NOW})"
+)
+# 查询列顺序与 Layer1Row / Layer3Row 字段顺序一致
+_SQL_SELECT_L1_BY_APIKEY = (
+    "SELECT id, apikey, content, timestamp FROM layer1 "
+    "WHERE apikey = ? ORDER BY timestamp DESC"
+)
+_SQL_SELECT_L3_BY_APIKEY = (
+    "SELECT id, apikey, behavior, instruction, timestamp FROM layer3 "
+    "WHERE apikey = ? ORDER BY timestamp DESC"
+)
+_SQL_UPDATE_L1 = f"UPDATE layer1 SET content = ?, timestamp = {_SQL_NOW} WHERE id = ?"
+_SQL_UPDATE_L3 = (
+    "UPDATE layer3 SET behavior = ?, instruction = ?, "
+    f"timestamp = {_SQL_NOW} WHERE id = ?"
+)
+_SQL_DELETE_L1 = "DELETE FROM layer1 WHERE id = ?"
+_SQL_DELETE_L3 = "DELETE FROM layer3 WHERE id = ?"
+# 流式查询时每次 fetchmany 读取的行数
+_FETCH_BATCH_SIZE = 1000
+# 连接工作在自动提交模式，写操作显式开启事务并立即获取写锁
+_SQL_BEGIN = "BEGIN IMMEDIATE"
+
+# 每个线程按数据库路径缓存的持久连接，避免每次使用都重新打开；
+# 保存在线程本地存储中，线程结束后连接随之释放
+_local = threading.local()
+# 各线程的连接表，供进程退出时统一关闭；线程对象被回收后条目自动移除
+_thread_connections: "weakref.WeakKeyDictionary[threading.Thread, Dict[str, sqlite3.Connection]]" = (
+    weakref.WeakKeyDictionary()
+)
+_CONN_LOCK = threading.Lock()
+
+
+def _local_connections() -> Dict[str, sqlite3.Connection]:
+    """获取当前线程的连接表：数据库路径 -> 连接"""
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+        # 当前线程中已完成表结构初始化的数据库路径
+        _local.initialized = set()
+        with _CONN_LOCK:
+            _thread_connections[threading.current_thread()] = connections
+    return connections
+
+
+@atexit.register
+def _close_cached_connections() -> None:
+    """进程退出时更新统计信息并关闭缓存的连接"""
+    global _local
+    with _CONN_LOCK:
+        conns = [
+            conn
+            for connections in _thread_connections.values()
+            for conn in connections.values()
+        ]
+        _thread_connections.clear()
+    _local = threading.local()
+    for conn in conns:
+        try:
+            conn.execute("PRAGMA optimize")
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+def _ensures_conn(fn):
+    """确保调用前已建立数据库连接"""
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        if self.conn is None:
+            self.connect()
+        return fn(self, *args, **kwargs)
 
-from .MemoryDB import MemoryDatabaseInterface
+    return wrapper
 
 
 class MemoryDB(MemoryDatabaseInterface):
@@ -21,7 +109,10 @@ class MemoryDB(MemoryDatabaseInterface):
     def __enter__(self):
         """支持上下文管理器"""
         self.connect()
-        self.init_tables()
+        # 每个连接只需初始化一次表结构
+        if self.db_path not in _local.initialized:
+            self.init_tables()
+            _local.initialized.add(self.db_path)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -32,28 +123,54 @@ class MemoryDB(MemoryDatabaseInterface):
         return True
 
     def connect(self) -> None:
-        """连接到 SQLite 数据库"""
+        """连接到 SQLite 数据库，同一线程复用已打开的连接"""
+        connections = _local_connections()
+        conn = connections.get(self.db_path)
+        if conn is not None:
+            self.conn = conn
+            self.cursor = self.conn.cursor()
+            self.cursor.arraysize = _FETCH_BATCH_SIZE
+            return
+
         try:
-            self.conn = sqlite3.connect(self.db_path)
+            self.conn = sqlite3.connect(
+                self.db_path,
+                cached_statements=256,
+                check_same_thread=False,
+                isolation_level=None,
+            )
             # 设置行工厂，使查询结果以字典形式返回
             self.conn.row_factory = sqlite3.Row
+            # 使用 WAL 日志模式，提交时顺序追加写入且读写互不阻塞
+            if self.db_path != ":memory:":
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+                self.conn.execute("PRAGMA mmap_size=268435456")
+            self.conn.execute("PRAGMA temp_store=MEMORY")
+            self.conn.execute("PRAGMA cache_size=-20000")
+            # 限制 PRAGMA optimize 触发的 ANALYZE 扫描行数
+            self.conn.execute("PRAGMA analysis_limit=400")
+            # 连接长期复用，只在打开时按需更新一次统计信息，退出时再执行一次
+            self.conn.execute("PRAGMA optimize=0x10002")
             self.cursor = self.conn.cursor()
+            self.cursor.arraysize = _FETCH_BATCH_SIZE
         except sqlite3.Error as e:
             raise Exception(f"数据库连接失败: {e}")
 
+        connections[self.db_path] = self.conn
+
     def close(self) -> None:
-        """关闭数据库连接"""
+        """释放数据库连接（连接保留在线程级缓存中复用）"""
         if self.conn:
-            self.conn.close()
+            self.cursor.close()
             self.conn = None
             self.cursor = None
 
+    @_ensures_conn
     def init_tables(self) -> None:
         """初始化数据库表结构"""
-        if not self.conn:
-            self.connect()
-
         try:
+            self.cursor.execute(_SQL_BEGIN)
             # 创建 layer1 表
             self.cursor.execute(
                 """
@@ -79,19 +196,34 @@ class MemoryDB(MemoryDatabaseInterface):
             """
             )
 
-            # 为 apikey 创建索引，优化查询性能
+            # 为 (apikey, timestamp DESC) 创建复合索引，按 apikey 查询时直接按索引顺序
+            # 以时间倒序返回，省去额外排序；查询还需读取 content 等列，每行仍要回表。
+            # 旧的单列 apikey 索引是其前缀，予以删除以减少写放大
             self.cursor.execute(
-                "CREATE INDEX IF NOT EXISTS idx_layer1_apikey ON layer1 (apikey)"
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' "
+                "AND name IN ('idx_layer1_apikey_ts', 'idx_layer3_apikey_ts')"
             )
+            indexes_created = self.cursor.fetchone()[0] < 2
+            self.cursor.execute("DROP INDEX IF EXISTS idx_layer1_apikey")
+            self.cursor.execute("DROP INDEX IF EXISTS idx_layer3_apikey")
             self.cursor.execute(
-                "CREATE INDEX IF NOT EXISTS idx_layer3_apikey ON layer3 (apikey)"
+                "CREATE INDEX IF NOT EXISTS idx_layer1_apikey_ts "
+                "ON layer1 (apikey, timestamp DESC)"
             )
+            self.cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_layer3_apikey_ts "
+                "ON layer3 (apikey, timestamp DESC)"
+            )
+            # 新建索引后收集一次统计信息，让查询规划器选用新索引
+            if indexes_created:
+                self.cursor.execute("ANALYZE")
 
             self.conn.commit()
         except sqlite3.Error as e:
             self.conn.rollback()
             raise Exception(f"初始化表失败: {e}")
 
+    @_ensures_conn
     def add_layer1_record(self, apikey: str, content: str) -> int:
         """添加 layer1 记录
 
@@ -102,14 +234,11 @@ class MemoryDB(MemoryDatabaseInterface):
         Returns:
             新记录的 ID
         """
-        if not self.conn:
-            self.connect()
-
         try:
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.cursor.execute(_SQL_BEGIN)
             self.cursor.execute(
-                "INSERT INTO layer1 (apikey, content, timestamp) VALUES (?, ?, ?)",
-                (apikey, content, current_time),
+                _SQL_INSERT_L1,
+                (apikey, content),
             )
             self.conn.commit()
             return self.cursor.lastrowid
@@ -117,6 +246,7 @@ class MemoryDB(MemoryDatabaseInterface):
             self.conn.rollback()
             raise Exception(f"添加 layer1 记录失败: {e}")
 
+    @_ensures_conn
     def add_layer3_record(self, apikey: str, behavior: str, instruction: str) -> int:
         """添加 layer3 记录
 
@@ -128,14 +258,11 @@ class MemoryDB(MemoryDatabaseInterface):
         Returns:
             新记录的 ID
         """
-        if not self.conn:
-            self.connect()
-
         try:
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.cursor.execute(_SQL_BEGIN)
             self.cursor.execute(
-                "INSERT INTO layer3 (apikey, behavior, instruction, timestamp) VALUES (?, ?, ?, ?)",
-                (apikey, behavior, instruction, current_time),
+                _SQL_INSERT_L3,
+                (apikey, behavior, instruction),
             )
             self.conn.commit()
             return self.cursor.lastrowid
@@ -143,50 +270,122 @@ class MemoryDB(MemoryDatabaseInterface):
             self.conn.rollback()
             raise Exception(f"添加 layer3 记录失败: {e}")
 
-    def get_layer1_records_by_apikey(self, apikey: str) -> List[Dict[str, Any]]:
-        """根据 apikey 获取 layer1 记录
+    def _insert_many(self, sql: str, rows: List[tuple], batch_size: int) -> int:
+        """在单个事务中分批执行批量插入，返回插入的记录数"""
+        rows = list(rows)
+        self.cursor.execute(_SQL_BEGIN)
+        for start in range(0, len(rows), batch_size):
+            self.cursor.executemany(sql, rows[start : start + batch_size])
+        self.conn.commit()
+        return len(rows)
+
+    @_ensures_conn
+    def add_layer1_records(
+        self, rows: List[Tuple[str, str]], batch_size: int = 10000
+    ) -> int:
+        """批量添加 layer1 记录
 
         Args:
-            apikey: 用户标识
+            rows: (apikey, content) 元组列表
+            batch_size: 每次 executemany 的记录数
 
         Returns:
-            layer1 记录列表
+            插入的记录数
         """
-        if not self.conn:
-            self.connect()
-
         try:
-            self.cursor.execute(
-                "SELECT * FROM layer1 WHERE apikey = ? ORDER BY timestamp DESC",
-                (apikey,),
-            )
-            results = self.cursor.fetchall()
-            return [dict(row) for row in results]
+            return self._insert_many(_SQL_INSERT_L1, rows, batch_size)
         except sqlite3.Error as e:
-            raise Exception(f"查询 layer1 记录失败: {e}")
+            self.conn.rollback()
+            raise Exception(f"批量添加 layer1 记录失败: {e}")
 
-    def get_layer3_records_by_apikey(self, apikey: str) -> List[Dict[str, Any]]:
-        """根据 apikey 获取 layer3 记录
+    @_ensures_conn
+    def add_layer3_records(
+        self, rows: List[Tuple[str, str, str]], batch_size: int = 10000
+    ) -> int:
+        """批量添加 layer3 记录
 
         Args:
-            apikey: 用户标识
+            rows: (apikey, behavior, instruction) 元组列表
+            batch_size: 每次 executemany 的记录数
 
         Returns:
-            layer3 记录列表
+            插入的记录数
         """
-        if not self.conn:
-            self.connect()
+        try:
+            return self._insert_many(_SQL_INSERT_L3, rows, batch_size)
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            raise Exception(f"批量添加 layer3 记录失败: {e}")
 
+    @staticmethod
+    def _iter_rows(
+        cursor: sqlite3.Cursor, sql: str, params: tuple, row_type, table: str
+    ) -> Iterator[tuple]:
+        """执行查询并按批次 fetchmany，逐行产出 row_type 实例"""
         try:
-            self.cursor.execute(
-                "SELECT * FROM layer3 WHERE apikey = ? ORDER BY timestamp DESC",
-                (apikey,),
-            )
-            results = self.cursor.fetchall()
-            return [dict(row) for row in results]
+            cursor.execute(sql, params)
+            while rows := cursor.fetchmany(_FETCH_BATCH_SIZE):
+                yield from map(row_type._make, rows)
         except sqlite3.Error as e:
-            raise Exception(f"查询 layer3 记录失败: {e}")
+            raise Exception(f"查询 {table} 记录失败: {e}")
+        finally:
+            cursor.close()
+
+    @_ensures_conn
+    def iter_layer1_records_by_apikey(self, apikey: str) -> Iterator[Layer1Row]:
+        """根据 apikey 流式迭代 layer1 记录，每次从 SQLite 读取一批行
+
+        Args:
+            apikey: 用户标识
+
+        Returns:
+            layer1 记录迭代器
+        """
+        # 使用独立游标，迭代期间不影响其他查询
+        cursor = self.conn.cursor()
+        return self._iter_rows(
+            cursor, _SQL_SELECT_L1_BY_APIKEY, (apikey,), Layer1Row, "layer1"
+        )
+
+    def get_layer1_records_by_apikey(self, apikey: str) -> List[Layer1Row]:
+        """根据 apikey 获取 layer1 记录
+
+        Args:
+            apikey: 用户标识
 
+        Returns:
+            layer1 记录列表，可用 ``_asdict()`` 转为字典
+        """
+        return list(self.iter_layer1_records_by_apikey(apikey))
+
+    @_ensures_conn
+    def iter_layer3_records_by_apikey(self, apikey: str) -> Iterator[Layer3Row]:
+        """根据 apikey 流式迭代 layer3 记录，每次从 SQLite 读取一批行
+
+        Args:
+            apikey: 用户标识
+
+        Returns:
+            layer3 记录迭代器
+        """
+        # 使用独立游标，迭代期间不影响其他查询
+        cursor = self.conn.cursor()
+        return self._iter_rows(
+            cursor, _SQL_SELECT_L3_BY_APIKEY, (apikey,), Layer3Row, "layer3"
+        )
+
+    def get_layer3_records_by_apikey(self, apikey: str) -> List[Layer3Row]:
+        """根据 apikey 获取 layer3 记录
+
+        Args:
+            apikey: 用户标识
+
+        Returns:
+            layer3 记录列表，可用 ``_asdict()`` 转为字典
+        """
+        return list(self.iter_layer3_records_by_apikey(apikey))
+
+    @_ensures_conn
     def update_layer1_content(self, record_id: int, content: str) -> bool:
         """更新 layer1 记录内容
 
@@ -197,14 +396,11 @@ class MemoryDB(MemoryDatabaseInterface):
         Returns:
             更新是否成功
         """
-        if not self.conn:
-            self.connect()
-
         try:
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.cursor.execute(_SQL_BEGIN)
             self.cursor.execute(
-                "UPDATE layer1 SET content = ?, timestamp = ? WHERE id = ?",
-                (content, current_time, record_id),
+                _SQL_UPDATE_L1,
+                (content, record_id),
             )
             self.conn.commit()
             return self.cursor.rowcount > 0
@@ -212,6 +408,7 @@ class MemoryDB(MemoryDatabaseInterface):
             self.conn.rollback()
             raise Exception(f"更新 layer1 记录失败: {e}")
 
+    @_ensures_conn
     def update_layer3_record(
         self, record_id: int, behavior: str, instruction: str
     ) -> bool:
@@ -225,14 +422,11 @@ class MemoryDB(MemoryDatabaseInterface):
         Returns:
             更新是否成功
         """
-        if not self.conn:
-            self.connect()
-
         try:
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.cursor.execute(_SQL_BEGIN)
             self.cursor.execute(
-                "UPDATE layer3 SET behavior = ?, instruction = ?, timestamp = ? WHERE id = ?",
-                (behavior, instruction, current_time, record_id),
+                _SQL_UPDATE_L3,
+                (behavior, instruction, record_id),
             )
             self.conn.commit()
             return self.cursor.rowcount > 0
@@ -240,6 +434,7 @@ class MemoryDB(MemoryDatabaseInterface):
             self.conn.rollback()
             raise Exception(f"更新 layer3 记录失败: {e}")
 
+    @_ensures_conn
     def delete_layer1_record(self, record_id: int) -> bool:
         """删除 layer1 记录
 
@@ -249,17 +444,16 @@ class MemoryDB(MemoryDatabaseInterface):
         Returns:
             删除是否成功
         """
-        if not self.conn:
-            self.connect()
-
         try:
-            self.cursor.execute("DELETE FROM layer1 WHERE id = ?", (record_id,))
+            self.cursor.execute(_SQL_BEGIN)
+            self.cursor.execute(_SQL_DELETE_L1, (record_id,))
             self.conn.commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
             self.conn.rollback()
             raise Exception(f"删除 layer1 记录失败: {e}")
 
+    @_ensures_conn
     def delete_layer3_record(self, record_id: int) -> bool:
         """删除 layer3 记录
 
@@ -269,11 +463,9 @@ class MemoryDB(MemoryDatabaseInterface):
         Returns:
             删除是否成功
         """
-        if not self.conn:
-            self.connect()
-
         try:
-            self.cursor.execute("DELETE FROM layer3 WHERE id = ?", (record_id,))
+            self.cursor.execute(_SQL_BEGIN)
+            self.cursor.execute(_SQL_DELETE_L3, (record_id,))
             self.conn.commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
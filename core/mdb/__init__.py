@@ -1,3 +1,4 @@
+from .MemoryDB import Layer1Row, Layer3Row
 from .MemoryDBImpl import MemoryDB
 
-__all__ = ["MemoryDB"]
+__all__ = ["MemoryDB", "Layer1Row", "Layer3Row"]
@@ -1,13 +1,41 @@
 import asyncio
+import hashlib
+import itertools
+import threading
+import weakref
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
 
-from config import OLLAMA_API_URL, OLLAMA_MODEL_NAME
-from utils.embedding import EmbeddingModel, AsyncOllamaEmbeddingModel
+import numpy as np
+
+from utils.embedding import EmbeddingModel
 from utils.user_file_manager import default_file_manager
 from utils.vector_store import VectorStore
-from .ext import default_kb_db, default_user_db
+from .ext import get_default_embedding_model, get_default_kb_db, get_default_user_db
+
+
+# 同步接口共用的后台事件循环，首次使用时启动
+_sync_loop: asyncio.AbstractEventLoop | None = None
+_sync_loop_lock = threading.Lock()
+
+
+def _run_sync(coro):
+    """在后台事件循环中运行协程并阻塞等待结果"""
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_sync_loop.run_forever, name="vdb-sync-loop", daemon=True
+            ).start()
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop).result()
+
+
+# 同一用户、同一集合的向量存储实例在各管理器之间共享
+# 键为 (user_token, collection_id)
+_shared_vector_stores = weakref.WeakValueDictionary()
 
 
 class UserVectorStore(VectorStore):
@@ -87,14 +115,17 @@ class VDBManager(ABC):
 class UserKBVDBManager(VDBManager):
     """用户知识库向量数据库管理器实现"""
 
+    # 查询嵌入缓存的最大条目数
+    QUERY_EMBEDDING_CACHE_SIZE = 512
+
     def __init__(
             self,
             user_token: str,
-            embedding_model: EmbeddingModel = AsyncOllamaEmbeddingModel(
-                ollama_api_url=OLLAMA_API_URL, model_name=OLLAMA_MODEL_NAME
-            ),
-            user_db=default_user_db,
+            embedding_model: Optional[EmbeddingModel] = None,
+            user_db=None,
             file_manager=default_file_manager,
+            embedding_batch_size: int = 32,
+            embedding_concurrency: int = 8,
     ):
         """
         初始化用户知识库向量数据库管理器
@@ -102,24 +133,87 @@ class UserKBVDBManager(VDBManager):
         Args:
             user_token: 用户ID
             embedding_model: 嵌入模型，如果为None则使用默认模型
+            embedding_batch_size: 生成嵌入时每个微批次的分块数量
+            embedding_concurrency: 同时进行的微批次数量上限
         """
         self.user_token = user_token
         self.base_data_dir = file_manager.get_user_directories(user_token).root
-        self.embedding_model = embedding_model
+        self.embedding_model = (
+            embedding_model
+            if embedding_model is not None
+            else get_default_embedding_model()
+        )
         # 初始化用户数据库和文件管理器
-        self.user_db = user_db
+        self.user_db = user_db if user_db is not None else get_default_user_db()
         self.file_manager = file_manager
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_concurrency = embedding_concurrency
         # 用于缓存向量存储实例
         self._vector_stores: Dict[str, UserVectorStore] = {}
+        # 查询文本嵌入缓存（LRU）及进行中的嵌入请求
+        self._query_embedding_cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._pending_query_embeddings: Dict[str, asyncio.Task] = {}
 
     def _get_vector_store(self, collection_id: str) -> UserVectorStore:
         """获取或创建指定集合的向量存储实例"""
-        if collection_id not in self._vector_stores:
-            self._vector_stores[collection_id] = UserVectorStore(
+        try:
+            return self._vector_stores[collection_id]
+        except KeyError:
+            pass
+
+        key = (self.user_token, collection_id)
+        vector_store = _shared_vector_stores.get(key)
+        if vector_store is None:
+            vector_store = UserVectorStore(
                 collection_id=collection_id,
                 user_token=self.user_token,
             )
-        return self._vector_stores[collection_id]
+            _shared_vector_stores[key] = vector_store
+        self._vector_stores[collection_id] = vector_store
+        return vector_store
+
+    async def _get_query_embedding(self, query_text: str) -> np.ndarray:
+        """获取查询文本的嵌入向量，相同查询复用缓存结果或进行中的请求"""
+        key = hashlib.blake2b(query_text.encode("utf-8"), digest_size=16).hexdigest()
+        cached = self._query_embedding_cache.get(key)
+        if cached is not None:
+            self._query_embedding_cache.move_to_end(key)
+            return cached
+
+        # 进行中的请求只能在创建它的事件循环内等待
+        loop = asyncio.get_running_loop()
+        pending = self._pending_query_embeddings.get(key)
+        if pending is None or pending.get_loop() is not loop:
+            pending = loop.create_task(self.embedding_model.get_embedding(query_text))
+            self._pending_query_embeddings[key] = pending
+        try:
+            embedding = np.asarray(await pending, dtype=np.float32)
+        finally:
+            if self._pending_query_embeddings.get(key) is pending:
+                del self._pending_query_embeddings[key]
+
+        # 嵌入失败时返回的是零向量，不缓存
+        if embedding.any():
+            self._query_embedding_cache[key] = embedding
+            if len(self._query_embedding_cache) > self.QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_embedding_cache.popitem(last=False)
+        return embedding
+
+    async def _embed_chunks(self, document_chunks: List[str]) -> List[List[float]]:
+        """将分块拆分为微批次并发生成嵌入向量（每个微批次一次请求），结果顺序与输入一致"""
+        batch_size = self.embedding_batch_size
+        batches = [
+            document_chunks[i: i + batch_size]
+            for i in range(0, len(document_chunks), batch_size)
+        ]
+        semaphore = asyncio.Semaphore(self.embedding_concurrency)
+
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self.embedding_model.embed_many(batch)
+
+        results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+        return list(itertools.chain.from_iterable(results))
 
     async def add_chunks(
             self,
@@ -147,18 +241,17 @@ class UserKBVDBManager(VDBManager):
         vector_store = self._get_vector_store(collection_id)
 
         # 生成嵌入向量
-        embeddings = await self.embedding_model.get_embeddings_batch(document_chunks)
+        embeddings = await self._embed_chunks(document_chunks)
 
         # 生成元数据
         if metadata_list is None:
+            base_metadata = {
+                "doc_id": doc_id,
+                "user_token": self.user_token,
+                "collection_id": collection_id,
+            }
             metadata_list = [
-                {
-                    "doc_id": doc_id,
-                    "chunk_index": i,
-                    "user_token": self.user_token,
-                    "collection_id": collection_id,
-                    "text_length": len(chunk),
-                }
+                dict(base_metadata, chunk_index=i, text_length=len(chunk))
                 for i, chunk in enumerate(document_chunks)
             ]
 
@@ -180,13 +273,15 @@ class UserKBVDBManager(VDBManager):
             metadata_list: List[dict] = None,
     ) -> List[str]:
         """同步版本的添加文档分块方法"""
-        loop = asyncio.get_event_loop()
-        return loop.run_until_complete(
+        return _run_sync(
             self.add_chunks(collection_id, document_chunks, doc_id, metadata_list)
         )
 
     async def search_by_embedding(
-            self, collection_id: str, embedding: List[float], top_k: int = 5
+            self,
+            collection_id: str,
+            embedding: Union[np.ndarray, List[float]],
+            top_k: int = 5,
     ) -> Dict[str, Any]:
         """基于嵌入向量搜索相关文档"""
         vector_store = self._get_vector_store(collection_id)
@@ -214,17 +309,59 @@ class UserKBVDBManager(VDBManager):
             搜索结果
         """
         # 生成查询文本的嵌入向量
-        query_embedding = await self.embedding_model.get_embedding(query_text)
+        query_embedding = await self._get_query_embedding(query_text)
         return await self.search_by_embedding(collection_id, query_embedding, top_k)
 
+    async def search_by_texts(
+            self, collection_id: str, query_texts: List[str], top_k: int = 5
+    ) -> List[Dict[str, Any]]:
+        """
+        批量基于文本查询搜索相关文档
+
+        未缓存的查询文本在一次请求中生成嵌入，向量检索也合并为一次查询。
+
+        Args:
+            collection_id: 集合ID
+            query_texts: 查询文本列表
+            top_k: 每个查询返回的结果数量
+
+        Returns:
+            与查询顺序一致的搜索结果列表
+        """
+        if not query_texts:
+            return []
+
+        keys = [
+            hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+            for text in query_texts
+        ]
+        embeddings = [self._query_embedding_cache.get(key) for key in keys]
+        for key, embedding in zip(keys, embeddings):
+            if embedding is not None:
+                self._query_embedding_cache.move_to_end(key)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            # embed_many 与 get_embedding 走同一个嵌入接口，可与单条查询共用缓存
+            vectors = await self.embedding_model.embed_many(
+                [query_texts[i] for i in missing]
+            )
+            for i, vector in zip(missing, vectors):
+                embedding = np.asarray(vector, dtype=np.float32)
+                embeddings[i] = embedding
+                # 嵌入失败时返回的是零向量，不缓存
+                if embedding.any():
+                    self._query_embedding_cache[keys[i]] = embedding
+            while len(self._query_embedding_cache) > self.QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_embedding_cache.popitem(last=False)
+
+        vector_store = self._get_vector_store(collection_id)
+        return vector_store.search_by_embeddings(np.stack(embeddings), top_k)
+
     def search_by_text_sync(
             self, collection_id: str, query_text: str, top_k: int = 5
     ) -> Dict[str, Any]:
         """同步版本的基于文本搜索方法"""
-        loop = asyncio.get_event_loop()
-        return loop.run_until_complete(
-            self.search_by_text(collection_id, query_text, top_k)
-        )
+        return _run_sync(self.search_by_text(collection_id, query_text, top_k))
 
     def list_all_documents(
             self, collection_id: str, limit: int = None
@@ -244,13 +381,13 @@ class UserKBVDBManager(VDBManager):
         return vector_store.get_document_count()
 
     def check_document_exists(self, collection_id: str, doc_id: str) -> bool:
-        """检查文档是否存在"""
+        """检查文档是否存在（向量存储维护进程内的分块索引，无需再额外缓存）"""
         vector_store = self._get_vector_store(collection_id)
         return vector_store.check_document_exists(doc_id)
 
     def list_collections(self) -> List[str]:
         """列出用户的所有集合"""
-        collections_info = default_kb_db.list_collections(self.user_token)
+        collections_info = get_default_kb_db().list_collections(self.user_token)
         return [collection["collection_id"] for collection in collections_info]
 
     def get_user_vdb_path(self) -> str:
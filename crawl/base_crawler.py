@@ -4,24 +4,35 @@
 """
 
 import asyncio
+import copy
 import csv
 import functools
 import hashlib
 import os
+import re
 import time
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set
 
 import diskcache
 from crawl4ai import AsyncWebCrawler
 from lxml import etree
 
+# 设置环境变量 CRAWL_DEBUG 后输出缓存命中等调试信息
+_DEBUG = bool(os.environ.get("CRAWL_DEBUG"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
 
 class CacheManager:
     """缓存管理器"""
 
-    def __init__(self, cache_dir: str = ".cache"):
-        self.cache = diskcache.Cache(cache_dir)
+    def __init__(self, cache_dir: str = ".cache", debug: bool = _DEBUG):
+        # 分片缓存：不同键落在不同的 SQLite 数据库中，降低并发写锁竞争
+        self.cache = diskcache.FanoutCache(cache_dir, shards=8, timeout=1)
+        self.debug = debug
+        # 进行中的请求，键为 (事件循环, 缓存键)，相同请求并发时只执行一次
+        self._inflight: Dict[tuple, asyncio.Future] = {}
 
     def cache_decorator(self, expire_time: int = 86400 * 7):
         """
@@ -38,45 +49,83 @@ class CacheManager:
                 cache_key = self._generate_cache_key(func.__name__, args, kwargs)
 
                 # 显示缓存键用于调试
-                print(f"[CACHE] Key: {cache_key[:16]}... for {func.__name__}")
+                if self.debug:
+                    print(f"[CACHE] Key: {cache_key.hex()} for {func.__name__}")
 
                 # 尝试从缓存获取结果
                 cached_result = self.cache.get(cache_key)
                 if cached_result is not None:
-                    print(
-                        f"[CACHE HIT] ✓ {func.__name__}: {args[0] if args else 'N/A'}"
-                    )
+                    if self.debug:
+                        print(
+                            f"[CACHE HIT] ✓ {func.__name__}: {args[0] if args else 'N/A'}"
+                        )
                     # 只有字典类型才添加 _from_cache 标记
                     if isinstance(cached_result, dict):
                         cached_result["_from_cache"] = True
                     return cached_result
 
-                # 缓存未命中，执行原函数
-                print(f"[CACHE MISS] ✗ {func.__name__}: {args[0] if args else 'N/A'}")
-                result = await func(*args, **kwargs)
-
-                # 将结果保存到缓存
-                if result is not None:
-                    # 只有字典类型才添加 _from_cache 标记
-                    if isinstance(result, dict):
-                        result["_from_cache"] = False
-                    self.cache.set(cache_key, result, expire=expire_time)
-                    print(f"[CACHE SAVE] ✓ Saved result for {func.__name__}")
-                else:
-                    print(f"[CACHE SKIP] ✗ No result to cache for {func.__name__}")
+                # 相同请求正在执行时，等待其结果而不是重复执行
+                loop = asyncio.get_running_loop()
+                inflight_key = (loop, cache_key)
+                pending = self._inflight.get(inflight_key)
+                if pending is not None:
+                    return await asyncio.shield(pending)
 
-                return result
+                # 缓存未命中，执行原函数
+                if self.debug:
+                    print(
+                        f"[CACHE MISS] ✗ {func.__name__}: {args[0] if args else 'N/A'}"
+                    )
+                future = loop.create_future()
+                self._inflight[inflight_key] = future
+                try:
+                    result = await func(*args, **kwargs)
+
+                    # 将结果保存到缓存
+                    if result is not None:
+                        # 只有字典类型才添加 _from_cache 标记
+                        if isinstance(result, dict):
+                            result["_from_cache"] = False
+                        self.cache.set(cache_key, result, expire=expire_time)
+                        if self.debug:
+                            print(f"[CACHE SAVE] ✓ Saved result for {func.__name__}")
+                    elif self.debug:
+                        print(
+                            f"[CACHE SKIP] ✗ No result to cache for {func.__name__}"
+                        )
+
+                    future.set_result(result)
+                    return result
+                except BaseException as e:
+                    if isinstance(e, asyncio.CancelledError):
+                        future.cancel()
+                    else:
+                        future.set_exception(e)
+                        # 标记异常已被获取，避免无等待者时产生警告
+                        future.exception()
+                    raise
+                finally:
+                    self._inflight.pop(inflight_key, None)
 
             return wrapper
 
         return decorator
 
-    def _generate_cache_key(self, func_name: str, args: tuple, kwargs: dict) -> str:
-        """生成缓存键"""
+    def _generate_cache_key(self, func_name: str, args: tuple, kwargs: dict) -> bytes:
+        """生成缓存键（8 字节 BLAKE2b 摘要，diskcache 可直接使用 bytes 键）"""
         # 排除 self 参数以避免对象实例影响缓存键
         filtered_args = args[1:] if args and hasattr(args[0], "__dict__") else args
-        key_data = f"{func_name}:{str(filtered_args)}:{str(sorted(kwargs.items()))}"
-        return hashlib.md5(key_data.encode()).hexdigest()
+        hasher = hashlib.blake2b(func_name.encode(), digest_size=8)
+        # 常见情况：只有一个 URL 字符串参数，直接哈希其字节，跳过 repr 与格式化
+        if not kwargs and len(filtered_args) == 1 and isinstance(filtered_args[0], str):
+            hasher.update(b"\0")
+            hasher.update(filtered_args[0].encode())
+            return hasher.digest()
+        # 无关键字参数时跳过排序
+        kw_str = str(sorted(kwargs.items())) if kwargs else "[]"
+        key_data = f":{str(filtered_args)}:{kw_str}"
+        hasher.update(key_data.encode())
+        return hasher.digest()
 
     def clear_cache(self):
         """清空缓存"""
@@ -97,6 +146,27 @@ cache_manager = CacheManager(".cache")
 class HttpRequester:
     """HTTP请求器"""
 
+    def __init__(self):
+        # 长期复用的爬虫实例，首次请求时创建，避免每个 URL 都重新启动浏览器
+        self._crawler: Optional[AsyncWebCrawler] = None
+        self._lock = asyncio.Lock()
+
+    async def _ensure_crawler(self) -> AsyncWebCrawler:
+        """获取共享的爬虫实例，不存在时创建并启动"""
+        if self._crawler is None:
+            async with self._lock:
+                if self._crawler is None:
+                    crawler = AsyncWebCrawler()
+                    await crawler.__aenter__()
+                    self._crawler = crawler
+        return self._crawler
+
+    async def aclose(self):
+        """关闭共享的爬虫实例"""
+        crawler, self._crawler = self._crawler, None
+        if crawler is not None:
+            await crawler.__aexit__(None, None, None)
+
     @cache_manager.cache_decorator(expire_time=36000)
     async def request(self, url: str, output_form: str = "html", **kwargs) -> str:
         """
@@ -109,16 +179,152 @@ class HttpRequester:
         Returns:
             响应HTML内容
         """
-        async with AsyncWebCrawler() as crawler:
-            result = await crawler.arun(url=url, **kwargs)
-            if output_form == "html":
-                return result.html
-            elif output_form == "markdown":
-                return result.markdown
-            else:
-                raise ValueError(
-                    f"Unsupported output format: {output_form}. Use 'html', 'json', or 'text'."
-                )
+        crawler = await self._ensure_crawler()
+        result = await crawler.arun(url=url, **kwargs)
+        if output_form == "html":
+            return result.html
+        elif output_form == "markdown":
+            return result.markdown
+        else:
+            raise ValueError(
+                f"Unsupported output format: {output_form}. Use 'html', 'json', or 'text'."
+            )
+
+
+def url_digest(url: str) -> int:
+    """计算URL的 64 位摘要，用于去重时代替完整的URL字符串"""
+    return int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), "big")
+
+
+class UrlDigestSet:
+    """
+    只保存URL 64 位摘要的集合
+
+    与保存完整URL字符串的 set 相比内存占用小得多，适合在断点续爬时记录大量已爬取的URL。
+    摘要冲突的概率约为 n²/2⁶⁵，对百万级URL可以忽略。
+    """
+
+    def __init__(self, urls=()):
+        self._digests: Set[int] = {url_digest(url) for url in urls}
+
+    def __contains__(self, url: str) -> bool:
+        return url_digest(url) in self._digests
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+    def add(self, url: str):
+        self._digests.add(url_digest(url))
+
+    def update(self, urls):
+        self._digests.update(map(url_digest, urls))
+
+
+def simhash(text: str, shingle_size: int = 4) -> int:
+    """
+    计算文本的 64 位 SimHash 指纹
+
+    以字符 n-gram 作为特征（适用于中文等不以空格分词的文本），
+    内容相近的文本指纹之间的汉明距离较小。
+
+    Args:
+        text: 文本内容
+        shingle_size: 字符 n-gram 长度
+
+    Returns:
+        64 位指纹
+    """
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    shingles = {
+        text[i : i + shingle_size]
+        for i in range(max(len(text) - shingle_size + 1, 1))
+    }
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+        for s in shingles
+    ]
+    threshold = len(hashes) / 2
+    fingerprint = 0
+    for bit in range(64):
+        if sum((h >> bit) & 1 for h in hashes) > threshold:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+class SimHashIndex:
+    """
+    SimHash 指纹索引，用于检测近似重复的页面内容
+
+    指纹按 4 个 16 位分段建立索引：汉明距离不超过 3 的两个指纹至少有一个分段完全相同，
+    因此只需与分段相同的候选指纹比较。指纹可以追加保存到文件，供断点续爬时加载。
+    """
+
+    BANDS = 4
+    BAND_BITS = 16
+
+    def __init__(self, max_distance: int = 3, path: Optional[str] = None):
+        if max_distance >= self.BANDS:
+            raise ValueError(f"max_distance must be less than {self.BANDS}")
+        self.max_distance = max_distance
+        self.path = path
+        self._bands: List[Dict[int, List[int]]] = [{} for _ in range(self.BANDS)]
+        self._count = 0
+        self._unsaved: List[int] = []
+
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            self._insert(int(line, 16))
+            except FileNotFoundError:
+                pass
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _band_keys(self, fingerprint: int):
+        mask = (1 << self.BAND_BITS) - 1
+        for band in range(self.BANDS):
+            yield band, (fingerprint >> (band * self.BAND_BITS)) & mask
+
+    def _insert(self, fingerprint: int):
+        for band, key in self._band_keys(fingerprint):
+            self._bands[band].setdefault(key, []).append(fingerprint)
+        self._count += 1
+
+    def is_near_duplicate(self, fingerprint: int) -> bool:
+        """判断索引中是否已有与该指纹相近的指纹"""
+        for band, key in self._band_keys(fingerprint):
+            for candidate in self._bands[band].get(key, ()):
+                if (candidate ^ fingerprint).bit_count() <= self.max_distance:
+                    return True
+        return False
+
+    def add(self, fingerprint: int):
+        """添加指纹"""
+        self._insert(fingerprint)
+        self._unsaved.append(fingerprint)
+
+    def save(self):
+        """将新增的指纹追加写入文件"""
+        if not self.path or not self._unsaved:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(f"{fp:016x}\n" for fp in self._unsaved)
+        self._unsaved.clear()
+
+    def discard_unsaved(self):
+        """撤销上次保存后新增的指纹，用于对应结果未能写入的情况"""
+        for fingerprint in self._unsaved:
+            for band, key in self._band_keys(fingerprint):
+                candidates = self._bands[band][key]
+                candidates.remove(fingerprint)
+                if not candidates:
+                    del self._bands[band][key]
+            self._count -= 1
+        self._unsaved.clear()
 
 
 class DataParser(ABC):
@@ -151,10 +357,40 @@ class DataParser(ABC):
         pass
 
 
+# CSV 写入缓冲区大小（1 MiB），整批数据合并为少量系统调用
+CSV_WRITE_BUFFER_SIZE = 1 << 20
+# 将换行符替换为空格的转换表
+_NL_TRANS = str.maketrans({"\n": " ", "\r": " "})
+
+
 class DataExporter:
     """数据导出器"""
 
-    def get_existing_urls(self, filename: str) -> set:
+    def __init__(self):
+        # 已确认存在且写有表头的 CSV 文件
+        self._headered: Set[str] = set()
+        # 按文件名缓存自动推断的 CSV 字段名
+        self._fieldnames_cache: Dict[str, List[str]] = {}
+
+    @staticmethod
+    def _clean_rows(
+        results: List[Dict[str, Any]], fieldnames: List[str]
+    ) -> List[Dict[str, str]]:
+        """清理结果数据，只保留指定字段并去除换行符"""
+        cleaned_rows = []
+        for result in results:
+            if result and isinstance(result, dict):
+                cleaned_row = {}
+                for field in fieldnames:
+                    value = str(result.get(field, ""))
+                    # 清理换行符（多数字段不含换行符，直接跳过替换）
+                    if "\n" in value or "\r" in value:
+                        value = value.translate(_NL_TRANS)
+                    cleaned_row[field] = value.strip()
+                cleaned_rows.append(cleaned_row)
+        return cleaned_rows
+
+    def get_existing_urls(self, filename: str) -> UrlDigestSet:
         """
         获取CSV文件中已存在的URL
 
@@ -162,19 +398,27 @@ class DataExporter:
             filename: CSV文件名
 
         Returns:
-            已存在的URL集合
+            已存在的URL集合（只保存URL摘要）
         """
-        existing_urls = set()
-        if os.path.exists(filename):
-            try:
-                with open(filename, "r", encoding="utf-8") as csvfile:
-                    reader = csv.DictReader(csvfile)
-                    for row in reader:
-                        url = row.get("url", "").strip()
+        existing_urls = UrlDigestSet()
+        # 直接打开文件，不存在时跳过，省去额外的 stat 调用
+        try:
+            with open(filename, "r", encoding="utf-8") as csvfile:
+                # 只读取 url 列，避免为每行构造字典
+                reader = csv.reader(csvfile)
+                header = next(reader, None)
+                if not header or "url" not in header:
+                    return existing_urls
+                idx = header.index("url")
+                for row in reader:
+                    if len(row) > idx:
+                        url = row[idx].strip()
                         if url:
                             existing_urls.add(url)
-            except Exception as e:
-                print(f"Error reading existing URLs from {filename}: {e}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error reading existing URLs from {filename}: {e}")
         return existing_urls
 
     def append_to_csv(
@@ -197,7 +441,9 @@ class DataExporter:
         if not results:
             return 0
 
-        # 确保URL字段包含在fieldnames中
+        # 确保URL字段包含在fieldnames中，推断结果按文件缓存
+        if not fieldnames:
+            fieldnames = self._fieldnames_cache.get(filename)
         if not fieldnames and results:
             sample_result = results[0]
             fieldnames = [
@@ -207,43 +453,43 @@ class DataExporter:
             if "url" in fieldnames:
                 fieldnames.remove("url")
             fieldnames.insert(0, "url")
-
-        # 确保保存目录存在
-        os.makedirs(
-            (
-                os.path.dirname(os.path.abspath(filename))
-                if os.path.dirname(filename)
-                else "."
-            ),
-            exist_ok=True,
-        )
-
-        # 检查文件是否存在，如果不存在则创建并写入表头
-        file_exists = os.path.exists(filename)
-        saved_count = 0
+            self._fieldnames_cache[filename] = fieldnames
+
+        # 首次写入该文件时确保保存目录存在，并检查是否需要写入表头；
+        # 之后的批次直接追加，不再重复检查
+        file_exists = filename in self._headered
+        if not file_exists:
+            os.makedirs(
+                (
+                    os.path.dirname(os.path.abspath(filename))
+                    if os.path.dirname(filename)
+                    else "."
+                ),
+                exist_ok=True,
+            )
+            file_exists = os.path.exists(filename)
 
         try:
-            with open(filename, "a", newline="", encoding="utf-8") as csvfile:
+            with open(
+                filename,
+                "a",
+                newline="",
+                encoding="utf-8",
+                buffering=CSV_WRITE_BUFFER_SIZE,
+            ) as csvfile:
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
 
                 # 如果文件不存在，写入表头
                 if not file_exists:
                     writer.writeheader()
 
-                # 写入数据
-                for result in results:
-                    if result and isinstance(result, dict):
-                        # 清理数据，只保留指定字段
-                        cleaned_row = {}
-                        for field in fieldnames:
-                            value = str(result.get(field, ""))
-                            # 清理换行符
-                            value = value.replace("\n", " ").replace("\r", " ").strip()
-                            cleaned_row[field] = value
-                        writer.writerow(cleaned_row)
-                        saved_count += 1
-
-            return saved_count
+                # 整批写入数据
+                cleaned_rows = self._clean_rows(results, fieldnames)
+                writer.writerows(cleaned_rows)
+
+            self._headered.add(filename)
+
+            return len(cleaned_rows)
 
         except Exception as e:
             print(f"Error appending to CSV: {e}")
@@ -296,20 +542,20 @@ class DataExporter:
         )
 
         try:
-            with open(filename, "w", newline="", encoding="utf-8") as csvfile:
+            with open(
+                filename,
+                "w",
+                newline="",
+                encoding="utf-8",
+                buffering=CSV_WRITE_BUFFER_SIZE,
+            ) as csvfile:
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
                 writer.writeheader()
 
-                for result in results:
-                    if result and isinstance(result, dict):
-                        # 清理数据，只保留指定字段
-                        cleaned_row = {}
-                        for field in fieldnames:
-                            value = str(result.get(field, ""))
-                            # 清理换行符
-                            value = value.replace("\n", " ").replace("\r", " ").strip()
-                            cleaned_row[field] = value
-                        writer.writerow(cleaned_row)
+                writer.writerows(self._clean_rows(results, fieldnames))
+
+            # 文件已被覆盖，之前推断的字段名不再适用
+            self._fieldnames_cache.pop(filename, None)
 
             print(f"Results saved to: {os.path.abspath(filename)}")
             print(f"Total records saved: {len(results)}")
@@ -320,7 +566,10 @@ class DataExporter:
             return None
 
     def save_to_json(
-        self, results: List[Dict[str, Any]], filename: Optional[str] = None
+        self,
+        results: List[Dict[str, Any]],
+        filename: Optional[str] = None,
+        inplace: bool = False,
     ) -> Optional[str]:
         """
         将结果保存到JSON文件
@@ -328,6 +577,7 @@ class DataExporter:
         Args:
             results: 结果列表
             filename: 文件名
+            inplace: 为 True 时直接从结果中移除内部字段，不复制记录
 
         Returns:
             保存的文件名，失败时返回None
@@ -344,12 +594,18 @@ class DataExporter:
 
         try:
             # 清理内部字段
-            cleaned_results = []
-            for result in results:
-                clean_result = {
-                    k: v for k, v in result.items() if k not in ["_from_cache"]
-                }
-                cleaned_results.append(clean_result)
+            if inplace:
+                for result in results:
+                    result.pop("_from_cache", None)
+                cleaned_results = results
+            else:
+                # 只复制带有内部字段的记录
+                cleaned_results = []
+                for result in results:
+                    if "_from_cache" in result:
+                        result = dict(result)
+                        del result["_from_cache"]
+                    cleaned_results.append(result)
 
             with open(filename, "w", encoding="utf-8") as jsonfile:
                 json.dump(cleaned_results, jsonfile, ensure_ascii=False, indent=2)
@@ -366,9 +622,11 @@ class DataExporter:
 class BatchCrawler:
     """批量爬虫管理器"""
 
-    def __init__(self, batch_size: int = 20, delay: float = 2):
+    def __init__(self, batch_size: int = 20, delay: float = 2, quiet: bool = False):
         self.batch_size = batch_size
         self.delay = delay
+        # 静默模式下不输出每个批次的进度信息
+        self.quiet = quiet
 
     async def batch_crawl_and_save(
         self,
@@ -376,7 +634,8 @@ class BatchCrawler:
         crawl_func,
         exporter,
         filename: str,
-        existing_urls: set = None,
+        existing_urls: Optional[UrlDigestSet] = None,
+        dedup_index: Optional[SimHashIndex] = None,
     ) -> List[Dict[str, Any]]:
         """
         批量爬取URL并分批保存，支持URL去重
@@ -387,6 +646,7 @@ class BatchCrawler:
             exporter: 数据导出器实例
             filename: 保存文件名
             existing_urls: 已存在的URL集合
+            dedup_index: SimHash 指纹索引，提供时跳过内容近似重复的页面
 
         Returns:
             所有爬取结果列表
@@ -394,10 +654,14 @@ class BatchCrawler:
         if existing_urls is None:
             existing_urls = exporter.get_existing_urls(filename)
 
-        # 过滤已存在的URL
-        filtered_urls = [url for url in urls if url not in existing_urls]
-        skipped_count = len(urls) - len(filtered_urls)
+        # 保持顺序去除重复的输入URL，再过滤已存在的URL
+        unique_urls = dict.fromkeys(urls)
+        duplicate_count = len(urls) - len(unique_urls)
+        filtered_urls = [url for url in unique_urls if url not in existing_urls]
+        skipped_count = len(unique_urls) - len(filtered_urls)
 
+        if duplicate_count > 0:
+            print(f"Skipped {duplicate_count} duplicate URLs")
         if skipped_count > 0:
             print(f"Skipped {skipped_count} URLs that already exist in {filename}")
 
@@ -408,60 +672,75 @@ class BatchCrawler:
         print(f"Will crawl {len(filtered_urls)} new URLs")
 
         all_results = []
-        total_batches = (len(filtered_urls) + self.batch_size - 1) // self.batch_size
         cache_hits = 0
         new_crawls = 0
         total_saved = 0
-
-        for i in range(0, len(filtered_urls), self.batch_size):
-            batch_urls = filtered_urls[i : i + self.batch_size]
-            current_batch = i // self.batch_size + 1
-
-            print(
-                f"Processing batch {current_batch}/{total_batches} ({len(batch_urls)} URLs)"
-            )
-
-            # 并发处理当前批次的URL
-            batch_tasks = [crawl_func(url) for url in batch_urls]
-            batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
-
-            # 处理结果，过滤异常
-            batch_success_results = []
-            batch_cache_hits = 0
-            batch_new_crawls = 0
-            batch_errors = 0
-
-            for j, result in enumerate(batch_results):
-                if isinstance(result, Exception):
-                    print(f"Error crawling {batch_urls[j]}: {result}")
-                    batch_errors += 1
-                else:
-                    batch_success_results.append(result)
-                    all_results.append(result)
-                    if result.get("_from_cache", False):
-                        batch_cache_hits += 1
-                    else:
-                        batch_new_crawls += 1
-
-            cache_hits += batch_cache_hits
-            new_crawls += batch_new_crawls
-
-            # 保存当前批次的成功结果
-            if batch_success_results:
-                saved_count = exporter.append_to_csv(batch_success_results, filename)
+        near_duplicates = 0
+        current_batch = 0
+        pending_results = []
+        pending_errors = 0
+
+        def _flush():
+            # 保存已完成的一批成功结果
+            nonlocal total_saved, current_batch, pending_errors
+            current_batch += 1
+            if pending_results:
+                saved_count = exporter.append_to_csv(pending_results, filename)
                 total_saved += saved_count
+                # 将已保存的URL并入已存在集合
+                if saved_count:
+                    existing_urls.update(
+                        result["url"] for result in pending_results if result.get("url")
+                    )
+                if dedup_index is not None:
+                    # 只持久化已写入CSV的结果的指纹；写入失败时撤销，避免续爬时把这些页面当作重复跳过
+                    if saved_count == len(pending_results):
+                        dedup_index.save()
+                    else:
+                        dedup_index.discard_unsaved()
+                if not self.quiet:
+                    print(
+                        f"Batch {current_batch}: saved {saved_count} records to {filename}"
+                    )
+            if not self.quiet:
                 print(
-                    f"Batch {current_batch}: saved {saved_count} records to {filename}"
+                    f"Batch {current_batch} completed: {len(pending_results)} success, {pending_errors} errors"
                 )
+            pending_results.clear()
+            pending_errors = 0
+
+        # 所有URL在同一并发池中处理，按完成顺序每 batch_size 条保存一次
+        for completed in asyncio.as_completed(
+            self._paced_crawl_tasks(filtered_urls, crawl_func)
+        ):
+            url, result = await completed
+            if isinstance(result, Exception):
+                print(f"Error crawling {url}: {result}")
+                pending_errors += 1
+            else:
+                # 跳过内容与已保存页面近似重复的结果
+                content = result.get("content") if dedup_index is not None else None
+                if content:
+                    fingerprint = simhash(content)
+                    if dedup_index.is_near_duplicate(fingerprint):
+                        near_duplicates += 1
+                        if not self.quiet:
+                            print(f"Skipped near-duplicate content: {url}")
+                        continue
+                    dedup_index.add(fingerprint)
+
+                pending_results.append(result)
+                all_results.append(result)
+                if result.get("_from_cache", False):
+                    cache_hits += 1
+                else:
+                    new_crawls += 1
 
-            print(
-                f"Batch {current_batch} completed: {len(batch_success_results)} success, {batch_errors} errors"
-            )
+            if len(pending_results) + pending_errors >= self.batch_size:
+                _flush()
 
-            # 批次间等待
-            if i + self.batch_size < len(filtered_urls):
-                print(f"Waiting {self.delay} seconds before next batch...")
-                await asyncio.sleep(self.delay)
+        if pending_results or pending_errors:
+            _flush()
 
         # 显示统计信息
         print(f"\nCrawling statistics:")
@@ -471,6 +750,8 @@ class BatchCrawler:
         print(f"Cache hits: {cache_hits}")
         print(f"New crawls: {new_crawls}")
         print(f"Total saved: {total_saved}")
+        if dedup_index is not None:
+            print(f"Near-duplicates skipped: {near_duplicates}")
         print(
             f"Cache hit rate: {cache_hits / (cache_hits + new_crawls) * 100:.1f}%"
             if (cache_hits + new_crawls) > 0
@@ -479,6 +760,30 @@ class BatchCrawler:
 
         return all_results
 
+    def _paced_crawl_tasks(self, urls: List[str], crawl_func) -> List[asyncio.Task]:
+        """
+        为所有URL创建爬取任务，最多 batch_size 个同时进行
+
+        每个任务完成后继续占用并发名额等待 delay 秒，每个名额的请求间隔与原先按批次
+        等待 delay 秒时相同，整体请求速率不超过 batch_size / (请求耗时 + delay)，
+        但慢请求不会阻塞其他名额。
+
+        Returns:
+            任务列表，每个任务返回 (url, 结果或异常)
+        """
+        semaphore = asyncio.Semaphore(self.batch_size)
+
+        async def _crawl_one(url: str):
+            async with semaphore:
+                try:
+                    result = await crawl_func(url)
+                except Exception as e:
+                    result = e
+                await asyncio.sleep(self.delay)
+            return url, result
+
+        return [asyncio.ensure_future(_crawl_one(url)) for url in urls]
+
     async def batch_crawl_urls(
         self, urls: List[str], crawl_func
     ) -> List[Dict[str, Any]]:
@@ -492,47 +797,24 @@ class BatchCrawler:
         Returns:
             爬取结果列表
         """
+        if not self.quiet:
+            print(f"Crawling {len(urls)} URLs with concurrency {self.batch_size}")
+
+        crawled = await asyncio.gather(*self._paced_crawl_tasks(urls, crawl_func))
+
+        # 处理结果，保持输入顺序
         results = []
-        total_batches = (len(urls) + self.batch_size - 1) // self.batch_size
         cache_hits = 0
         new_crawls = 0
-
-        for i in range(0, len(urls), self.batch_size):
-            batch_urls = urls[i : i + self.batch_size]
-            current_batch = i // self.batch_size + 1
-
-            print(
-                f"Processing batch {current_batch}/{total_batches} ({len(batch_urls)} URLs)"
-            )
-
-            # 并发处理当前批次的URL
-            batch_tasks = [crawl_func(url) for url in batch_urls]
-            batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
-
-            # 处理结果
-            batch_cache_hits = 0
-            batch_new_crawls = 0
-            for j, result in enumerate(batch_results):
-                if isinstance(result, Exception):
-                    print(f"Error crawling {batch_urls[j]}: {result}")
+        for url, result in crawled:
+            if isinstance(result, Exception):
+                print(f"Error crawling {url}: {result}")
+            else:
+                results.append(result)
+                if result.get("_from_cache", False):
+                    cache_hits += 1
                 else:
-                    results.append(result)
-                    if result.get("_from_cache", False):
-                        batch_cache_hits += 1
-                    else:
-                        batch_new_crawls += 1
-
-            cache_hits += batch_cache_hits
-            new_crawls += batch_new_crawls
-
-            print(
-                f"Batch {current_batch} completed, got {len([r for r in batch_results if not isinstance(r, Exception)])} valid results"
-            )
-
-            # 批次间等待
-            if i + self.batch_size < len(urls):
-                print(f"Waiting {self.delay} seconds before next batch...")
-                await asyncio.sleep(self.delay)
+                    new_crawls += 1
 
         # 显示统计信息
         print(f"\nCrawling statistics:")
@@ -550,8 +832,18 @@ class BatchCrawler:
 class BaseCrawler(ABC):
     """爬虫基类"""
 
-    def __init__(self, batch_size: int = 20, delay: float = 2):
-        self.requester = HttpRequester()
+    # 内容近似重复判定的 SimHash 汉明距离阈值，设为 None 时不做内容去重
+    near_duplicate_distance: Optional[int] = 3
+
+    def __init__(
+        self,
+        batch_size: int = 20,
+        delay: float = 2,
+        requester: Optional[HttpRequester] = None,
+    ):
+        # 传入的请求器由调用方（如 CrawlerFactory）共享和关闭，否则由本爬虫自行创建和关闭
+        self._owns_requester = requester is None
+        self.requester = requester or HttpRequester()
         self.exporter = DataExporter()
         self.batch_crawler = BatchCrawler(batch_size, delay)
         self.parser = self.create_parser()
@@ -600,21 +892,32 @@ class BaseCrawler(ABC):
 
             print(f"Found {len(list_page_urls)} URL list pages to process")
 
-            # 遍历所有URL列表页面
-            for i, list_url in enumerate(list_page_urls, 1):
-                try:
+            # 并发获取所有URL列表页面，用信号量限制同时进行的请求数
+            semaphore = asyncio.Semaphore(self.batch_crawler.batch_size)
+
+            async def _fetch_list_page(i: int, list_url: str) -> str:
+                async with semaphore:
                     print(
                         f"Processing URL list page {i}/{len(list_page_urls)}: {list_url}"
                     )
-                    html = await self.requester.request(list_url)
+                    return await self.requester.request(list_url)
+
+            htmls = await asyncio.gather(
+                *(
+                    _fetch_list_page(i, list_url)
+                    for i, list_url in enumerate(list_page_urls, 1)
+                ),
+                return_exceptions=True,
+            )
+
+            # 按页面顺序解析
+            for i, (list_url, html) in enumerate(zip(list_page_urls, htmls), 1):
+                try:
+                    if isinstance(html, BaseException):
+                        raise html
                     page_urls = self.parser.parse_urls_list(html)
                     all_urls.extend(page_urls)
                     print(f"Got {len(page_urls)} URLs from page {i}")
-
-                    # 页面间等待，避免请求过于频繁
-                    if i < len(list_page_urls):
-                        await asyncio.sleep(1)
-
                 except Exception as e:
                     print(f"Error processing URL list page {i} ({list_url}): {e}")
                     continue
@@ -655,16 +958,22 @@ class BaseCrawler(ABC):
 
     async def run(self) -> List[Dict[str, Any]]:
         """运行爬虫"""
-        # 获取URL列表
-        urls = await self.get_urls()
-        print(f"Found {len(urls)} URLs")
+        try:
+            # 获取URL列表
+            urls = await self.get_urls()
+            print(f"Found {len(urls)} URLs")
 
-        # 显示缓存状态
-        cache_stats = cache_manager.get_cache_stats()
-        print(f"Cache size: {cache_stats['total_entries']} entries")
+            # 显示缓存状态
+            cache_stats = cache_manager.get_cache_stats()
+            print(f"Cache size: {cache_stats['total_entries']} entries")
 
-        # 批量爬取
-        results = await self.batch_crawler.batch_crawl_urls(urls, self.crawl_single_url)
+            # 批量爬取
+            results = await self.batch_crawler.batch_crawl_urls(
+                urls, self.crawl_single_url
+            )
+        finally:
+            if self._owns_requester:
+                await self.requester.aclose()
 
         print(f"\nCrawling completed!")
         print(f"Total URLs found: {len(urls)}")
@@ -687,22 +996,42 @@ class BaseCrawler(ABC):
             timestamp = time.strftime("%Y%m%d_%H%M%S")
             filename = f"crawl_results_{timestamp}.csv"
 
-        # 获取URL列表
-        urls = await self.get_urls()
-        print(f"Found {len(urls)} URLs")
-
-        # 显示缓存状态
-        cache_stats = cache_manager.get_cache_stats()
-        print(f"Cache size: {cache_stats['total_entries']} entries")
-
-        # 获取已存在的URL
-        existing_urls = self.exporter.get_existing_urls(filename)
-        print(f"Found {len(existing_urls)} existing URLs in {filename}")
+        try:
+            # 获取URL列表
+            urls = await self.get_urls()
+            print(f"Found {len(urls)} URLs")
+
+            # 显示缓存状态
+            cache_stats = cache_manager.get_cache_stats()
+            print(f"Cache size: {cache_stats['total_entries']} entries")
+
+            # 获取已存在的URL
+            existing_urls = self.exporter.get_existing_urls(filename)
+            print(f"Found {len(existing_urls)} existing URLs in {filename}")
+
+            # 加载已保存页面的内容指纹，用于跳过近似重复的页面
+            dedup_index = None
+            if self.near_duplicate_distance is not None:
+                simhash_path = f"{filename}.simhash"
+                # CSV 不存在时旧指纹对应的行已不存在（如删除 CSV 后重新爬取），丢弃旧指纹
+                if not os.path.exists(filename) and os.path.exists(simhash_path):
+                    os.remove(simhash_path)
+                dedup_index = SimHashIndex(
+                    self.near_duplicate_distance, path=simhash_path
+                )
 
-        # 批量爬取并保存
-        results = await self.batch_crawler.batch_crawl_and_save(
-            urls, self.crawl_single_url, self.exporter, filename, existing_urls
-        )
+            # 批量爬取并保存
+            results = await self.batch_crawler.batch_crawl_and_save(
+                urls,
+                self.crawl_single_url,
+                self.exporter,
+                filename,
+                existing_urls,
+                dedup_index,
+            )
+        finally:
+            if self._owns_requester:
+                await self.requester.aclose()
 
         print(f"\nCrawling completed!")
         print(f"Results saved to: {os.path.abspath(filename)}")
@@ -761,26 +1090,22 @@ class BaseCrawler(ABC):
             # 自定义页码参数
             generate_paginated_urls("https://example.com/list?p={}", 1, 5, "p")
         """
-        urls = []
-
         if max_pages is None:
             # 如果没有指定最大页数，至少返回第一页
             max_pages = 1
 
-        for page in range(start_page, start_page + max_pages):
-            if "{}" in base_url:
-                # 如果URL包含{}占位符，直接格式化
-                url = base_url.format(page)
-            elif page_param in base_url:
-                # 如果URL已经包含页码参数，替换它
-                import re
-
-                url = re.sub(f"{page_param}=\\d+", f"{page_param}={page}", base_url)
-            else:
-                # 如果URL不包含页码参数，添加它
-                separator = "&" if "?" in base_url else "?"
-                url = f"{base_url}{separator}{page_param}={page}"
-            urls.append(url)
+        pages = range(start_page, start_page + max_pages)
+        if "{}" in base_url:
+            # 如果URL包含{}占位符，直接格式化
+            urls = [base_url.format(page) for page in pages]
+        elif page_param in base_url:
+            # 如果URL已经包含页码参数，替换它（正则只编译一次）
+            pattern = re.compile(re.escape(page_param) + r"=\d+")
+            urls = [pattern.sub(f"{page_param}={page}", base_url) for page in pages]
+        else:
+            # 如果URL不包含页码参数，添加它
+            separator = "&" if "?" in base_url else "?"
+            urls = [f"{base_url}{separator}{page_param}={page}" for page in pages]
 
         return urls
 
@@ -799,82 +1124,76 @@ class BaseCrawler(ABC):
         """
         print(f"Auto-detecting max pages for: {base_url_template}")
 
-        for page in range(1, max_check_pages + 1):
+        async def _page_has_urls(page: int) -> bool:
             try:
                 url = base_url_template.format(page)
                 html = await self.requester.request(url)
                 urls = self.parser.parse_urls_list(html)
-
-                # 如果这一页没有找到任何URL，认为已经到了最后一页
-                if not urls:
-                    print(f"No URLs found on page {page}, stopping at page {page - 1}")
-                    return max(1, page - 1)
-
-                print(f"Page {page}: found {len(urls)} URLs")
-
-                # 添加小延迟避免请求过快
-                await asyncio.sleep(0.5)
-
             except Exception as e:
+                # 出错的页面按没有URL处理
                 print(f"Error checking page {page}: {e}")
-                # 如果出错，返回前一页作为最大页数
-                return max(1, page - 1)
+                return False
+
+            if not urls:
+                print(f"No URLs found on page {page}")
+                return False
+            print(f"Page {page}: found {len(urls)} URLs")
+            # 添加小延迟避免请求过快
+            await asyncio.sleep(0.5)
+            return True
+
+        if not await _page_has_urls(1):
+            return 1
+
+        # 指数探测：1, 2, 4, 8, ... 直到遇到空页或超出检查上限
+        last_full, first_empty = 1, 2
+        while first_empty <= max_check_pages and await _page_has_urls(first_empty):
+            last_full, first_empty = first_empty, first_empty * 2
+
+        if first_empty > max_check_pages:
+            if last_full == max_check_pages or await _page_has_urls(max_check_pages):
+                print(
+                    f"Reached max check limit ({max_check_pages}), using that as max pages"
+                )
+                return max_check_pages
+            first_empty = max_check_pages
+
+        # 二分查找最后一个有URL的页面
+        while first_empty - last_full > 1:
+            mid = (last_full + first_empty) // 2
+            if await _page_has_urls(mid):
+                last_full = mid
+            else:
+                first_empty = mid
 
-        print(f"Reached max check limit ({max_check_pages}), using that as max pages")
-        return max_check_pages
+        print(f"Detected max page: {last_full}")
+        return last_full
+
+
+# 需要整体移除的外部资源标签
+_REMOVED_TAGS = frozenset(
+    {"img", "svg", "link", "script", "style", "iframe", "object", "embed"}
+)
+# 清理属性时保留的属性（如果您想保留链接结构但不显示）
+_KEPT_ATTRS = frozenset({"href"})
 
 
 def clean_html_content(element):
     """清理HTML内容，移除所有外部资源"""
 
-    # 复制元素以避免修改原始DOM
-    import copy
-
+    # 复制元素以避免修改原始DOM（lxml 的 deepcopy 在 C 层完成）
     clean_element = copy.deepcopy(element)
 
-    # 移除所有img标签
-    for img in clean_element.xpath(".//img"):
-        img.getparent().remove(img)
-
-    # 移除所有svg标签
-    for svg in clean_element.xpath(".//svg"):
-        svg.getparent().remove(svg)
-
-    # 移除所有带有src属性的元素(视频、音频等)
-    for elem in clean_element.xpath(".//*[@src]"):
-        elem.getparent().remove(elem)
-
-    # 移除所有link标签(外部CSS等)
-    for link in clean_element.xpath(".//link"):
-        link.getparent().remove(link)
-
-    # 移除所有script标签
-    for script in clean_element.xpath(".//script"):
-        script.getparent().remove(script)
-
-    # 移除所有style标签
-    for style in clean_element.xpath(".//style"):
-        style.getparent().remove(style)
-
-    # 移除所有iframe
-    for iframe in clean_element.xpath(".//iframe"):
-        iframe.getparent().remove(iframe)
-
-    # 移除所有object和embed标签
-    for obj in clean_element.xpath(".//object | .//embed"):
-        obj.getparent().remove(obj)
-
-    # 清理所有元素的属性，只保留必要的结构属性
-    for elem in clean_element.xpath(".//*"):
-        # 保留的属性列表
-        keep_attrs = ["href"]  # 如果您想保留链接结构但不显示
-
-        # 移除除保留属性外的所有属性
-        attrs_to_remove = []
-        for attr in elem.attrib:
-            if attr not in keep_attrs:
-                attrs_to_remove.append(attr)
+    # 一次遍历完成清理：移除外部资源标签和所有带有src属性的元素(视频、音频等)，
+    # 其余元素只保留必要的结构属性
+    for elem in list(clean_element.iterdescendants(tag=etree.Element)):
+        if elem.tag in _REMOVED_TAGS or "src" in elem.attrib:
+            parent = elem.getparent()
+            if parent is not None:
+                parent.remove(elem)
+            continue
 
+        attrs_to_remove = [attr for attr in elem.attrib if attr not in _KEPT_ATTRS]
         for attr in attrs_to_remove:
             del elem.attrib[attr]
 
@@ -887,3 +1206,131 @@ def clean_html_content(element):
     #     parent.remove(link)
 
     return etree.tostring(clean_element, encoding="unicode")
+
+
+# 转换为 Markdown 时的块级标签，前后各空一行
+_MD_BLOCK_TAGS = frozenset(
+    {
+        "p",
+        "div",
+        "section",
+        "article",
+        "header",
+        "footer",
+        "blockquote",
+        "table",
+        "ul",
+        "ol",
+        "dl",
+        "figure",
+    }
+)
+# 转换为 Markdown 时跳过的标签（连同其内容）
+_MD_SKIPPED_TAGS = _REMOVED_TAGS | {"noscript", "head", "title", "meta"}
+_MD_HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_MD_EMPHASIS = {"strong": "**", "b": "**", "em": "_", "i": "_"}
+_EXTRA_NEWLINES_RE = re.compile(r"\n{3,}")
+
+
+def html_to_markdown(element) -> str:
+    """
+    将已解析的 lxml 元素直接转换为简单的 Markdown 文本
+
+    直接遍历已有的 DOM 树，无需序列化后再由纯 Python 的 HTML 解析器重新解析。
+    外部资源（图片、脚本、样式等）和带有src属性的元素会被忽略，链接只保留文字。
+
+    Args:
+        element: lxml 元素
+
+    Returns:
+        Markdown 文本
+    """
+    out: List[str] = []
+
+    def ends_with(suffix: str) -> bool:
+        return not out or "".join(out[-2:]).endswith(suffix)
+
+    def ensure_newlines(count: int):
+        if not out:
+            return
+        tail = "".join(out[-2:])
+        missing = count - (len(tail) - len(tail.rstrip("\n")))
+        if missing > 0:
+            out.append("\n" * missing)
+
+    def emit_text(text: Optional[str]):
+        if not text:
+            return
+        text = _WHITESPACE_RE.sub(" ", text)
+        if ends_with("\n") or ends_with(" "):
+            text = text.lstrip(" ")
+        if text:
+            out.append(text)
+
+    def walk(elem, list_stack: List[list]):
+        tag = elem.tag if isinstance(elem.tag, str) else None
+        if tag is None or tag in _MD_SKIPPED_TAGS or "src" in elem.attrib:
+            # 注释、处理指令和外部资源只保留其后的文本
+            emit_text(elem.tail)
+            return
+
+        tag = tag.lower()
+        if tag in _MD_HEADINGS:
+            ensure_newlines(2)
+            out.append("#" * _MD_HEADINGS[tag] + " ")
+            walk_children(elem, list_stack)
+            ensure_newlines(2)
+        elif tag == "li":
+            ensure_newlines(1)
+            indent = "  " * max(len(list_stack) - 1, 0)
+            if list_stack and list_stack[-1][0] == "ol":
+                list_stack[-1][1] += 1
+                out.append(f"{indent}{list_stack[-1][1]}. ")
+            else:
+                out.append(f"{indent}* ")
+            walk_children(elem, list_stack)
+            ensure_newlines(1)
+        elif tag in ("ul", "ol"):
+            # 嵌套列表紧跟上一项，顶层列表前后空一行
+            ensure_newlines(1 if list_stack else 2)
+            list_stack.append([tag, 0])
+            walk_children(elem, list_stack)
+            list_stack.pop()
+            ensure_newlines(1 if list_stack else 2)
+        elif tag == "br":
+            out.append("\n")
+        elif tag == "tr":
+            ensure_newlines(1)
+            walk_children(elem, list_stack)
+            ensure_newlines(1)
+            # 表头行之后添加分隔行
+            header_cells = sum(1 for cell in elem if cell.tag == "th")
+            if header_cells:
+                out.append("|".join(["---"] * header_cells) + "\n")
+        elif tag in ("td", "th"):
+            if not ends_with("\n"):
+                out.append(" | ")
+            walk_children(elem, list_stack)
+        elif tag in _MD_EMPHASIS:
+            mark = _MD_EMPHASIS[tag]
+            out.append(mark)
+            walk_children(elem, list_stack)
+            out.append(mark)
+        elif tag in _MD_BLOCK_TAGS:
+            ensure_newlines(2)
+            walk_children(elem, list_stack)
+            ensure_newlines(2)
+        else:
+            walk_children(elem, list_stack)
+
+        emit_text(elem.tail)
+
+    def walk_children(elem, list_stack: List[list]):
+        emit_text(elem.text)
+        for child in elem:
+            walk(child, list_stack)
+
+    walk_children(element, [])
+    markdown = "".join(out)
+    markdown = "\n".join(line.rstrip() for line in markdown.split("\n"))
+    return _EXTRA_NEWLINES_RE.sub("\n\n", markdown).strip() + "\n"
@@ -3,7 +3,7 @@
 基于通用爬虫框架的具体实现
 """
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 
 from lxml import etree
 
@@ -13,13 +13,33 @@ from base_crawler import BaseCrawler, DataParser
 class ChinaCDCParser(DataParser):
     """中国疾控中心数据解析器"""
 
+    # 共享的 HTML 解析器：容错解析，并跳过注释和处理指令节点
+    _PARSER = etree.HTMLParser(
+        encoding="utf-8",
+        recover=True,
+        huge_tree=True,
+        remove_comments=True,
+        remove_pis=True,
+    )
+
+    # 预编译的 XPath 表达式
+    _XP_TITLE = etree.XPath('//div[@class="left fl"]/h5//text()')
+    _XP_CONTENT = etree.XPath(
+        '//div[@class="left fl"]//div[@class="TRS_Editor"]//text()[not(ancestor::style)]'
+    )
+    _XP_LIST = etree.XPath('//p[@class="search-title-text"]/a/@href')
+
+    def _parse_html(self, html: Union[str, bytes]) -> etree._Element:
+        """以 UTF-8 字节解析 HTML，避免解析器重新探测编码"""
+        if isinstance(html, str):
+            html = html.encode("utf-8")
+        return etree.fromstring(html, self._PARSER)
+
     def parse_content(self, html: str) -> Dict[str, Any]:
         """解析内容页面"""
-        tree = etree.HTML(html)
-        title = tree.xpath('//div[@class="left fl"]/h5//text()')[0].strip()
-        content = tree.xpath(
-            '//div[@class="left fl"]//div[@class="TRS_Editor"]//text()[not(ancestor::style)]'
-        )
+        tree = self._parse_html(html)
+        title = self._XP_TITLE(tree)[0].strip()
+        content = self._XP_CONTENT(tree)
         return {
             "title": title,
             "content": "\n".join(content).strip(),
@@ -27,8 +47,8 @@ class ChinaCDCParser(DataParser):
 
     def parse_urls_list(self, html: str) -> List[str]:
         """解析URL列表页面"""
-        tree = etree.HTML(html)
-        urls = tree.xpath('//p[@class="search-title-text"]/a/@href')
+        tree = self._parse_html(html)
+        urls = self._XP_LIST(tree)
         return urls
 
 
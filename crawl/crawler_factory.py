@@ -3,19 +3,56 @@
 统一管理和创建不同类型的爬虫
 """
 
-from typing import Dict, Type, Optional, Any
+import asyncio
+import contextlib
+import logging
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Type, Optional, Any
 
-from base_crawler import BaseCrawler
+from base_crawler import BaseCrawler, HttpRequester
 from chinacdc_crawler import ChinaCDCCrawler
 
+_log = logging.getLogger(__name__)
+
 
 class CrawlerFactory:
     """爬虫工厂类"""
 
     def __init__(self):
         self._crawlers: Dict[str, Type[BaseCrawler]] = {}
+        # 由工厂创建的爬虫共用一个请求器，浏览器实例只启动一次；
+        # 请求器绑定创建它的事件循环，在新的事件循环中使用时重新创建
+        self._requester: Optional[HttpRequester] = None
+        self._requester_loop: Optional[asyncio.AbstractEventLoop] = None
+        # 正在进行的 run_* 调用数，最后一个结束时关闭共享请求器
+        self._active_runs = 0
         self._register_default_crawlers()
 
+    def _get_requester(self) -> HttpRequester:
+        """获取当前事件循环的共享请求器，不存在或属于其他事件循环时新建"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if self._requester is None or self._requester_loop is not loop:
+            # 旧事件循环已结束，其中的浏览器实例无法再关闭，直接丢弃
+            self._requester = HttpRequester()
+            self._requester_loop = loop
+            self._active_runs = 0
+        return self._requester
+
+    @contextlib.asynccontextmanager
+    async def _run_scope(self):
+        """run_* 入口的请求器生命周期，嵌套调用共用同一个浏览器实例"""
+        requester = self._get_requester()
+        self._active_runs += 1
+        try:
+            yield
+        finally:
+            self._active_runs -= 1
+            if self._active_runs == 0 and requester is self._requester:
+                await requester.aclose()
+
     def _register_default_crawlers(self):
         """注册默认爬虫"""
         self.register_crawler("chinacdc", ChinaCDCCrawler)
@@ -29,7 +66,7 @@ class CrawlerFactory:
             crawler_class: 爬虫类
         """
         self._crawlers[name] = crawler_class
-        print(f"Registered crawler: {name}")
+        _log.info("Registered crawler: %s", name)
 
     def create_crawler(self, name: str, **kwargs) -> Optional[BaseCrawler]:
         """
@@ -43,16 +80,19 @@ class CrawlerFactory:
             爬虫实例，如果未找到则返回None
         """
         if name not in self._crawlers:
-            print(
-                f"Crawler '{name}' not found. Available crawlers: {list(self._crawlers.keys())}"
+            _log.warning(
+                "Crawler '%s' not found. Available crawlers: %s",
+                name,
+                list(self._crawlers),
             )
             return None
 
         crawler_class = self._crawlers[name]
+        kwargs.setdefault("requester", self._get_requester())
         try:
             return crawler_class(**kwargs)
         except Exception as e:
-            print(f"Failed to create crawler '{name}': {e}")
+            _log.error("Failed to create crawler '%s': %s", name, e)
             return None
 
     def list_crawlers(self) -> Dict[str, str]:
@@ -67,6 +107,15 @@ class CrawlerFactory:
             for name, crawler_class in self._crawlers.items()
         }
 
+    async def aclose(self):
+        """
+        关闭工厂共享的请求器
+
+        run_* 入口结束时会自动关闭，直接使用 create_crawler 创建的爬虫需在用完后调用
+        """
+        if self._requester is not None:
+            await self._requester.aclose()
+
     async def run_crawler(
         self,
         name: str,
@@ -86,24 +135,25 @@ class CrawlerFactory:
         Returns:
             保存的文件名，失败时返回None
         """
-        crawler = self.create_crawler(name, **kwargs)
-        if not crawler:
-            return None
+        async with self._run_scope():
+            crawler = self.create_crawler(name, **kwargs)
+            if not crawler:
+                return None
 
-        try:
-            print(f"Running crawler: {name}")
-            results = await crawler.run()
+            try:
+                _log.info("Running crawler: %s", name)
+                results = await crawler.run()
 
-            if results:
-                saved_file = crawler.save_results(results, save_format, filename)
-                return saved_file
-            else:
-                print("No results to save.")
-                return None
+                if results:
+                    saved_file = crawler.save_results(results, save_format, filename)
+                    return saved_file
+                else:
+                    _log.info("No results to save.")
+                    return None
 
-        except Exception as e:
-            print(f"Error running crawler '{name}': {e}")
-            return None
+            except Exception as e:
+                _log.error("Error running crawler '%s': %s", name, e)
+                return None
 
     async def run_crawler_with_save(
         self,
@@ -122,24 +172,66 @@ class CrawlerFactory:
         Returns:
             保存的文件名，失败时返回None
         """
-        crawler = self.create_crawler(name, **kwargs)
-        if not crawler:
-            return None
+        async with self._run_scope():
+            crawler = self.create_crawler(name, **kwargs)
+            if not crawler:
+                return None
 
-        try:
-            print(f"Running crawler with batch save: {name}")
-            saved_file = await crawler.run_with_save(filename)
-            return saved_file
-        except Exception as e:
-            print(f"Error running crawler '{name}': {e}")
-            return None
+            try:
+                _log.info("Running crawler with batch save: %s", name)
+                saved_file = await crawler.run_with_save(filename)
+                return saved_file
+            except Exception as e:
+                _log.error("Error running crawler '%s': %s", name, e)
+                return None
+
+    async def run_crawlers(
+        self,
+        names: List[str],
+        concurrency: int = 4,
+        configs: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> Dict[str, Optional[str]]:
+        """
+        并发运行多个爬虫并分批保存结果
+
+        各爬虫自身的 batch_size/delay 仍然控制对目标站点的请求节奏，
+        这里只限制同时运行的爬虫数量。
+
+        Args:
+            names: 爬虫名称列表
+            concurrency: 同时运行的爬虫数量上限
+            configs: 爬虫名称到初始化参数的映射
+
+        Returns:
+            爬虫名称到保存文件名的字典，失败的爬虫对应None
+        """
+        configs = configs or {}
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run_one(name: str) -> Optional[str]:
+            async with semaphore:
+                return await self.run_crawler_with_save(
+                    name, **configs.get(name, {})
+                )
+
+        # 整批爬虫共用一个浏览器实例，全部结束后才关闭
+        async with self._run_scope():
+            results = await asyncio.gather(*(run_one(name) for name in names))
+        return dict(zip(names, results))
 
 
 class CrawlerConfig:
-    """爬虫配置管理"""
+    """爬虫配置管理
+
+    配置以只读视图保存，get_config 直接返回视图而不复制；
+    需要在此基础上修改时使用 get_mutable_config 取得副本。
+    """
+
+    _EMPTY_CONFIG: Mapping[str, Any] = MappingProxyType({})
 
     def __init__(self):
-        self.configs = {
+        self.configs: Dict[str, Mapping[str, Any]] = {}
+        for name, config in {
             "chinacdc": {
                 "cache_dir": "./crawl_cache/chinacdc",
                 "batch_size": 20,
@@ -155,21 +247,26 @@ class CrawlerConfig:
                 "batch_size": 15,
                 "delay": 2,
             },
-        }
+        }.items():
+            self.set_config(name, config)
 
-    def get_config(self, crawler_name: str) -> Dict[str, Any]:
-        """获取爬虫配置"""
-        return self.configs.get(crawler_name, {})
+    def get_config(self, crawler_name: str) -> Mapping[str, Any]:
+        """获取爬虫配置（只读视图）"""
+        return self.configs.get(crawler_name, self._EMPTY_CONFIG)
+
+    def get_mutable_config(self, crawler_name: str) -> Dict[str, Any]:
+        """获取爬虫配置的可修改副本，修改不会影响已保存的配置"""
+        return dict(self.get_config(crawler_name))
 
     def set_config(self, crawler_name: str, config: Dict[str, Any]):
         """设置爬虫配置"""
-        self.configs[crawler_name] = config
+        self.configs[crawler_name] = MappingProxyType(dict(config))
 
     def update_config(self, crawler_name: str, **kwargs):
         """更新爬虫配置"""
-        if crawler_name not in self.configs:
-            self.configs[crawler_name] = {}
-        self.configs[crawler_name].update(kwargs)
+        config = self.get_mutable_config(crawler_name)
+        config.update(kwargs)
+        self.set_config(crawler_name, config)
 
 
 # 全局工厂实例
@@ -196,7 +293,7 @@ async def main():
 
     # 如果需要运行其他爬虫，可以继续添加
     # print("\n=== Running News Crawler ===")
-    # news_config = crawler_config.get_config("generic_news")
+    # news_config = crawler_config.get_mutable_config("generic_news")
     # news_config.update({
     #     "base_url": "https://example.com",
     #     "list_url": "https://example.com/news"
@@ -209,6 +306,5 @@ async def main():
 
 
 if __name__ == "__main__":
-    import asyncio
-
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     asyncio.run(main())
@@ -1,48 +1,92 @@
-import pandas as pd
+import csv
+import sys
+from itertools import chain, islice
 
+# content 长度下限，小于该值的行会被删除
+MIN_CONTENT_LENGTH = 200
+# 写出缓冲区大小
+WRITE_BUFFER_SIZE = 1 << 20
 
-def clean_data():
-    # 读取原始数据
-    df = pd.read_csv("data/chinacdc_crawl_results.csv")
-    print(f"原始数据行数: {len(df)}")
-    print("原始数据前5行:")
-    print(df.head())
+# 爬取结果中的 content 可能远超 csv 模块默认的 128KB 字段上限
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
 
-    # 检查数据是否包含 content 列
-    if "content" not in df.columns:
-        print("错误: 数据中没有找到 'content' 列")
-        print(f"可用列: {list(df.columns)}")
-        return
 
-    # 删除 content 字数小于 100 的行
-    # 首先处理可能的 NaN 值
-    df = df.dropna(subset=["content"])
+def _print_rows(fieldnames, rows):
+    """打印表头和若干行，content 截断显示"""
+    print(fieldnames)
+    for row in rows:
+        print(
+            [
+                value[:50] + "..." if len(value) > 50 else value
+                for value in row
+            ]
+        )
 
-    # 计算每行content的字符数
-    df["content_length"] = df["content"].str.len()
-    print(f"\ncontent字符数统计:")
-    print(df["content_length"].describe())
 
-    # 筛选出字数大于等于100的行
-    df_cleaned = df[df["content_length"] >= 200].copy()
+def clean_data(show_stats: bool = True):
+    input_file = "data/chinacdc_crawl_results.csv"
+    output_file = "data/chinacdc_crawl_results_cleaned.csv"
 
-    # 删除临时添加的字符数列
-    df_cleaned = df_cleaned.drop("content_length", axis=1)
+    total_rows = 0
+    kept_rows = 0
+    lengths = []
+    preview = []
 
-    print(f"\n清洗后数据行数: {len(df_cleaned)}")
-    print(f"删除了 {len(df) - len(df_cleaned)} 行content字数小于100的数据")
+    # 用 csv 模块逐行流式处理，无需加载 pandas，内存占用与数据总量无关
+    with open(input_file, newline="", encoding="utf-8") as src:
+        reader = csv.reader(src)
+        fieldnames = next(reader, [])
+        head = list(islice(reader, 5))
 
-    # 保存清洗后的数据
-    output_file = "data/chinacdc_crawl_results_cleaned.csv"
-    df_cleaned.to_csv(output_file, index=False)
+        print("原始数据前5行:")
+        _print_rows(fieldnames, head)
+
+        # 检查数据是否包含 content 列；在打开输出文件之前检查，避免清空已有的清洗结果
+        if "content" not in fieldnames:
+            print("错误: 数据中没有找到 'content' 列")
+            print(f"可用列: {fieldnames}")
+            return
+        content_idx = fieldnames.index("content")
+
+        with open(
+            output_file, "w", newline="", encoding="utf-8", buffering=WRITE_BUFFER_SIZE
+        ) as out:
+            writer = csv.writer(out)
+            writer.writerow(fieldnames)
+
+            for row in chain(head, reader):
+                total_rows += 1
+                # 缺失或长度不足的 content 一并删除
+                length = len(row[content_idx]) if content_idx < len(row) else 0
+                if show_stats and length:
+                    lengths.append(length)
+                if length < MIN_CONTENT_LENGTH:
+                    continue
+
+                writer.writerow(row)
+                kept_rows += 1
+                # 保留清洗后数据的前5行用于展示
+                if len(preview) < 5:
+                    preview.append(row)
+
+    print(f"原始数据行数: {total_rows}")
+    if show_stats and lengths:
+        # 仅在需要统计信息时才导入 pandas
+        import pandas as pd
+
+        print(f"\ncontent字符数统计:")
+        print(pd.Series(lengths).describe())
+
+    print(f"\n清洗后数据行数: {kept_rows}")
+    print(f"删除了 {total_rows - kept_rows} 行content字数小于200的数据")
     print(f"\n清洗后的数据已保存到: {output_file}")
 
     # 显示清洗后数据的前几行
     print("\n清洗后数据前5行:")
-    print(df_cleaned.head())
+    _print_rows(fieldnames, preview)
 
-    return df_cleaned
+    return output_file
 
 
 if __name__ == "__main__":
-    cleaned_data = clean_data()
+    cleaned_file = clean_data()
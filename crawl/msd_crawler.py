@@ -13,14 +13,14 @@
 python msd_crawler.py
 """
 
-import xml.etree.ElementTree as ET
-from typing import List, Dict, Any
-from urllib.parse import urlparse
-
-import html2text
+import io
+import logging
+from typing import List, Dict, Any, Tuple
 from lxml import etree
 
-from .base_crawler import BaseCrawler, DataParser, clean_html_content
+from .base_crawler import BaseCrawler, DataParser, UrlDigestSet, html_to_markdown
+
+_log = logging.getLogger(__name__)
 
 attention_list = [
     "cancer",
@@ -51,6 +51,79 @@ attention_list = [
     "disorders-of-nutrition",
 ]
 
+# 关注的 URL 路径前缀，str.startswith 可直接接收元组一次完成匹配
+_ATTENTION_PREFIXES = tuple(f"/home/{attention}" for attention in attention_list)
+
+
+def _url_path_start(url: str) -> int:
+    """返回 URL 中路径部分的起始下标，没有路径时返回 -1
+
+    sitemap 中都是绝对 URL，跳过 "scheme://host" 后第一个 "/" 即为路径起点，
+    比 urlparse 构造完整的解析结果更轻量。
+    """
+    scheme_end = url.find("//")
+    if scheme_end == -1:
+        return 0
+    return url.find("/", scheme_end + 2)
+
+
+# sitemap 命名空间下的元素标签
+_SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+_SITEMAP_URL_TAG = f"{_SITEMAP_NS}url"
+_SITEMAP_LOC_TAG = f"{_SITEMAP_NS}loc"
+
+def filter_sitemap_urls(xml_content: bytes, prefixes: Tuple[str, ...]) -> List[str]:
+    """
+    流式解析 sitemap，返回路径以任一前缀开头的去重 URL（保持出现顺序）
+
+    逐个处理 <url> 元素，处理完即释放，不构建完整的树。循环中用到的方法
+    预先绑定为局部变量，减少每个 URL 的属性查找。
+
+    Args:
+        xml_content: sitemap XML 字节串
+        prefixes: URL 路径前缀元组
+
+    Returns:
+        List[str]: 符合条件的 URL 列表
+    """
+    filtered_urls: List[str] = []
+    append = filtered_urls.append
+    # 只记录URL摘要用于去重
+    seen = UrlDigestSet()
+    seen_add = seen.add
+    path_start_of = _url_path_start
+
+    for _, url_element in etree.iterparse(
+        io.BytesIO(xml_content), events=("end",), tag=_SITEMAP_URL_TAG
+    ):
+        url = url_element.findtext(_SITEMAP_LOC_TAG)
+        # 释放已处理的元素
+        url_element.clear()
+        while url_element.getprevious() is not None:
+            del url_element.getparent()[0]
+
+        if url is None:
+            continue
+
+        # 检查路径是否匹配 /home/{attention} 格式
+        path_start = path_start_of(url)
+        if (
+            path_start != -1
+            and url.startswith(prefixes, path_start)
+            and url not in seen
+        ):
+            seen_add(url)
+            append(url)
+    return filtered_urls
+
+
+# 预编译的内容页 XPath 表达式
+_MAIN_XP = etree.XPath('//div[@class="Topic_topicContainerRight__1T_vb false false"]')
+# string(...) 直接返回标题文本
+_TITLE_XP = etree.XPath(
+    'string(//div[starts-with(@class, "TopicHead_topic__header__container__")]//h1)'
+)
+
 
 class MSDParser(DataParser):
     """默沙东手册数据解析器"""
@@ -58,30 +131,16 @@ class MSDParser(DataParser):
     def parse_content(self, html: str) -> Dict[str, Any]:
         """解析内容页面"""
         tree = etree.HTML(html)
-        main_content = tree.xpath(
-            '//div[@class="Topic_topicContainerRight__1T_vb false false"]'
-        )
+        main_content = _MAIN_XP(tree)
         if not main_content:
-            print("未找到目标内容块")
+            _log.warning("未找到目标内容块")
             return None
 
         if main_content:
-            # 清理HTML
-            cleaned_html = clean_html_content(main_content[0])
-
-            # 配置html2text完全忽略外部资源
-            h = html2text.HTML2Text()
-            h.ignore_links = True  # 完全忽略链接
-            h.ignore_images = True  # 完全忽略图片
-            h.body_width = 0  # 不限制行宽
-            h.unicode_snob = True  # 处理中文
-
-            # 转换并清理
-            markdown = h.handle(cleaned_html)
+            # 直接从已解析的 DOM 生成 Markdown，忽略外部资源和链接地址
+            markdown = html_to_markdown(main_content[0])
             return {
-                "title": tree.xpath(
-                    '//div[@class="TopicHead_topic__header__container__sJqaX TopicHead_headerContainerMediaNone__s8aMz"]//h1//text()'
-                )[0].strip(),
+                "title": _TITLE_XP(tree).strip(),
                 "content": markdown,
             }
 
@@ -100,34 +159,9 @@ class MSDParser(DataParser):
             Returns:
                 list: 符合条件的 URL 列表
             """
-        xml_content = html
-        # 解析 XML
-        root = ET.fromstring(xml_content)
-
-        # 定义命名空间
-        namespace = {"sitemap": "http://www.sitemaps.org/schemas/sitemap/0.9"}
-
-        # 提取所有 URL
-        urls = []
-        for url_element in root.findall(".//sitemap:url", namespace):
-            loc_element = url_element.find("sitemap:loc", namespace)
-            if loc_element is not None:
-                urls.append(loc_element.text)
-
-        # 筛选符合条件的 URL
-        filtered_urls = []
-        for url in urls:
-            # 解析 URL 获取路径
-            parsed_url = urlparse(url)
-            path = parsed_url.path
-
-            # 检查是否匹配 /home/{attention} 格式
-            for attention in attention_list:
-                pattern = f"/home/{attention}"
-                if path.startswith(pattern):
-                    filtered_urls.append(url)
-                    break  # 找到匹配后跳出内层循环
-        print(len(filtered_urls), "符合条件的URL数量")
+        xml_content = html.encode("utf-8") if isinstance(html, str) else html
+        filtered_urls = filter_sitemap_urls(xml_content, _ATTENTION_PREFIXES)
+        _log.info("%d 符合条件的URL数量", len(filtered_urls))
         return filtered_urls
 
 
@@ -163,4 +197,5 @@ async def main():
 if __name__ == "__main__":
     import asyncio
 
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     asyncio.run(main())
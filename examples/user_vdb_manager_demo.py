@@ -27,12 +27,12 @@ async def demo_user_vdb_manager():
         embedding_model = AsyncOllamaEmbeddingModel(
             ollama_api_url="http://localhost:11434", model_name="bge-m3"
         )
-        vdb_manager = UserKBVDBManager(user_id=user_id, embedding_model=embedding_model)
+        vdb_manager = UserKBVDBManager(user_token=user_id, embedding_model=embedding_model)
         print("✓ 使用 Ollama BGE-M3 嵌入模型")
     except Exception as e:
         print(f"⚠ Ollama 服务不可用: {e}")
         print("⚠ 使用默认嵌入模型（需要配置）")
-        vdb_manager = UserKBVDBManager(user_id=user_id)
+        vdb_manager = UserKBVDBManager(user_token=user_id)
 
     print(f"✓ 用户向量数据库路径: {vdb_manager.get_user_vdb_path()}")
 
@@ -102,22 +102,23 @@ async def demo_user_vdb_manager():
     print(f"\n7. 执行语义搜索...")
     search_queries = ["什么是机器学习？", "深度学习的应用", "计算机视觉技术"]
 
-    for query in search_queries:
-        print(f"\n   查询: '{query}'")
-        try:
-            results = await vdb_manager.search_by_text(
-                collection_id=collection_id, query_text=query, top_k=2
-            )
-
-            if results and "documents" in results and results["documents"]:
-                print(f"   ✓ 找到 {len(results['documents'][0])} 个相关结果:")
-                for i, doc in enumerate(results["documents"][0]):
-                    print(f"     结果 {i+1}: {doc[:100]}...")
-            else:
-                print("   ⚠ 未找到相关结果")
+    try:
+        # 所有查询一次生成嵌入并合并为一次向量检索
+        all_results = await vdb_manager.search_by_texts(
+            collection_id=collection_id, query_texts=search_queries, top_k=2
+        )
+    except Exception as e:
+        print(f"   ✗ 搜索失败: {e}")
+        all_results = []
 
-        except Exception as e:
-            print(f"   ✗ 搜索失败: {e}")
+    for query, results in zip(search_queries, all_results):
+        print(f"\n   查询: '{query}'")
+        if results and "documents" in results and results["documents"]:
+            print(f"   ✓ 找到 {len(results['documents'][0])} 个相关结果:")
+            for i, doc in enumerate(results["documents"][0]):
+                print(f"     结果 {i+1}: {doc[:100]}...")
+        else:
+            print("   ⚠ 未找到相关结果")
 
     # 8. 列出所有文档
     print(f"\n8. 列出集合中的所有文档...")
@@ -160,7 +161,7 @@ def demo_sync_operations():
     collection_id = "sync_collection"
 
     # 初始化管理器
-    vdb_manager = UserKBVDBManager(user_id=user_id)
+    vdb_manager = UserKBVDBManager(user_token=user_id)
 
     print(f"✓ 初始化用户 '{user_id}' 的向量数据库管理器")
     print(f"✓ 向量数据库路径: {vdb_manager.get_user_vdb_path()}")
@@ -186,15 +187,24 @@ async def demo_multiple_collections():
     print("=" * 60)
 
     user_id = "demo_user_multi"
-    vdb_manager = UserKBVDBManager(user_id=user_id)
+    vdb_manager = UserKBVDBManager(user_token=user_id)
 
     collections = ["ai_basics", "ml_algorithms", "deep_learning", "nlp_techniques"]
 
     print(f"✓ 为用户 '{user_id}' 创建多个知识库集合...")
 
+    # 限制同时进行的集合初始化 / 计数查询数量
+    semaphore = asyncio.Semaphore(8)
+
+    async def in_thread(func, *args):
+        async with semaphore:
+            return await asyncio.to_thread(func, *args)
+
+    # 并发创建集合（通过获取向量存储实例）
+    await asyncio.gather(
+        *(in_thread(vdb_manager._get_vector_store, c) for c in collections)
+    )
     for collection in collections:
-        # 创建集合（通过获取向量存储实例）
-        vector_store = vdb_manager._get_vector_store(collection)
         print(f"   ✓ 创建集合: {collection}")
 
     # 列出所有集合
@@ -203,8 +213,10 @@ async def demo_multiple_collections():
 
     # 为每个集合获取文档数量
     print(f"\n各集合的文档数量:")
-    for collection in user_collections:
-        count = vdb_manager.get_document_count(collection)
+    counts = await asyncio.gather(
+        *(in_thread(vdb_manager.get_document_count, c) for c in user_collections)
+    )
+    for collection, count in zip(user_collections, counts):
         print(f"   {collection}: {count} 个文档")
 
 
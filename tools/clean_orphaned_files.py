@@ -1,27 +1,75 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-清理孤立的 processed 文件
-当 origin 文件被删除但 processed 文件仍然存在时，使用此工具清理
+清理孤立的 processed 文件和暂存文件
+当 origin 文件被删除但 processed 文件仍然存在，或上传暂存文件没有对应的
+待处理任务时，使用此工具清理
 """
 
+import asyncio
+import os
 import sys
+import threading
+import time
 from pathlib import Path
+from typing import Callable, List
 
 # 添加项目根目录到 Python 路径
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from utils.user_file_manager import LocalUserFileManager
-from utils.user_database import default_kb_db
+from core.ext import get_default_kb_db
 
+# 同时清理的用户数量上限
+CLEAN_CONCURRENCY = max(1, int(os.environ.get("CLEAN_CONCURRENCY", "8")))
 
-def clean_orphaned_processed_files(user_token: str, dry_run: bool = True):
+# 暂存文件在此时间内视为仍在上传中，不做清理（秒）
+STAGING_GRACE_SECONDS = 3600
+
+# 暂存文件仍会被工作线程处理的任务状态
+_ACTIVE_STATUSES = ("pending", "processing")
+
+
+def _unlink_files(
+    directory: Path, files: List[Path], log: Callable[[str], None] = print
+):
+    """批量删除同一目录下的文件
+
+    支持 dir_fd 的平台上先打开目录一次，再以文件名调用 unlinkat，
+    省去每个文件的完整路径解析；否则逐个按路径删除。
+    """
+    dir_fd = None
+    if os.unlink in os.supports_dir_fd:
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            dir_fd = None
+
+    try:
+        for file_path in files:
+            try:
+                if dir_fd is not None:
+                    os.unlink(file_path.name, dir_fd=dir_fd)
+                else:
+                    file_path.unlink()
+                log(f"✓ 已删除: {file_path}")
+            except Exception as e:
+                log(f"✗ 删除失败: {file_path} - {e}")
+    finally:
+        if dir_fd is not None:
+            os.close(dir_fd)
+
+
+def clean_orphaned_processed_files(
+    user_token: str, dry_run: bool = True, log: Callable[[str], None] = print
+):
     """清理孤立的 processed 文件
 
     Args:
         user_token: 用户令牌
         dry_run: 是否为试运行模式（仅显示会删除的文件，不实际删除）
+        log: 输出函数，默认直接打印
     """
     file_manager = LocalUserFileManager("data")
 
@@ -30,58 +78,124 @@ def clean_orphaned_processed_files(user_token: str, dry_run: bool = True):
         original_dir, processed_dir = file_manager.get_doc_dirs(user_token)
 
         if not original_dir.exists() or not processed_dir.exists():
-            print(f"用户 {user_token} 的目录不存在")
+            log(f"用户 {user_token} 的目录不存在")
             return
 
-        # 获取所有 origin 文件的 doc_id
-        origin_doc_ids = set()
-        for file_path in original_dir.iterdir():
-            if file_path.is_file():
-                origin_doc_ids.add(file_path.stem)
+        # 获取所有 origin 文件的 doc_id（scandir 的 is_file 多数情况下无需额外 stat）
+        with os.scandir(original_dir) as entries:
+            origin_doc_ids = {
+                os.path.splitext(entry.name)[0]
+                for entry in entries
+                if entry.is_file()
+            }
 
-        # 获取所有 processed 文件的 doc_id
-        processed_files = []
-        for file_path in processed_dir.iterdir():
-            if file_path.is_file() and file_path.suffix == ".txt":
-                processed_files.append(file_path)
+        # 获取所有 processed 文件的文件名（仅保留 .txt）
+        with os.scandir(processed_dir) as entries:
+            processed_names = [
+                entry.name
+                for entry in entries
+                if entry.is_file() and entry.name.endswith(".txt")
+            ]
 
-        # 找出孤立的 processed 文件
-        orphaned_files = []
-        for processed_file in processed_files:
-            doc_id = processed_file.stem
-            if doc_id not in origin_doc_ids:
-                # 检查数据库中是否还有记录
-                record = default_kb_db.get_upload_record(doc_id)
-                if not record:
-                    orphaned_files.append(processed_file)
-
-        print(f"\n=== 清理用户 {user_token} 的孤立 processed 文件 ===")
-        print(f"Origin 文件数量: {len(origin_doc_ids)}")
-        print(f"Processed 文件数量: {len(processed_files)}")
-        print(f"发现孤立文件数量: {len(orphaned_files)}")
+        # 找出孤立的 processed 文件：没有 origin 文件的候选一次性批量查库
+        candidates = [
+            (name, name[: -len(".txt")])
+            for name in processed_names
+            if name[: -len(".txt")] not in origin_doc_ids
+        ]
+        db_doc_ids = get_default_kb_db().existing_doc_ids(
+            doc_id for _, doc_id in candidates
+        )
+        orphaned_files = [
+            processed_dir / name
+            for name, doc_id in candidates
+            if doc_id not in db_doc_ids
+        ]
+
+        log(f"\n=== 清理用户 {user_token} 的孤立 processed 文件 ===")
+        log(f"Origin 文件数量: {len(origin_doc_ids)}")
+        log(f"Processed 文件数量: {len(processed_names)}")
+        log(f"发现孤立文件数量: {len(orphaned_files)}")
 
         if not orphaned_files:
-            print("✓ 没有发现孤立的 processed 文件")
+            log("✓ 没有发现孤立的 processed 文件")
             return
 
-        for orphaned_file in orphaned_files:
-            if dry_run:
-                print(f"[试运行] 会删除: {orphaned_file}")
-            else:
-                try:
-                    orphaned_file.unlink()
-                    print(f"✓ 已删除: {orphaned_file}")
-                except Exception as e:
-                    print(f"✗ 删除失败: {orphaned_file} - {e}")
+        if dry_run:
+            for orphaned_file in orphaned_files:
+                log(f"[试运行] 会删除: {orphaned_file}")
+        else:
+            _unlink_files(processed_dir, orphaned_files, log)
 
         if dry_run:
-            print(f"\n这是试运行模式，实际未删除任何文件。")
-            print(
+            log(f"\n这是试运行模式，实际未删除任何文件。")
+            log(
                 f"如需实际删除，请运行: clean_orphaned_processed_files('{user_token}', dry_run=False)"
             )
 
     except Exception as e:
-        print(f"清理过程中出现错误: {e}")
+        log(f"清理过程中出现错误: {e}")
+
+
+def clean_orphaned_staged_files(
+    user_token: str, dry_run: bool = True, log: Callable[[str], None] = print
+):
+    """清理孤立的暂存文件
+
+    暂存文件以 doc_id 命名，上传记录不存在或已不是待处理状态时不会再被
+    移动到原始文件目录。最近修改的文件可能属于正在提交的上传，暂不处理。
+
+    Args:
+        user_token: 用户令牌
+        dry_run: 是否为试运行模式（仅显示会删除的文件，不实际删除）
+        log: 输出函数，默认直接打印
+    """
+    file_manager = LocalUserFileManager("data")
+
+    try:
+        staging_dir = file_manager.get_staging_dir(user_token)
+        if not staging_dir.exists():
+            return
+
+        deadline = time.time() - STAGING_GRACE_SECONDS
+        with os.scandir(staging_dir) as entries:
+            staged_names = [
+                entry.name
+                for entry in entries
+                if entry.is_file() and entry.stat().st_mtime < deadline
+            ]
+
+        kb_db = get_default_kb_db()
+        orphaned_files = []
+        for doc_id in staged_names:
+            record = kb_db.get_upload_record(doc_id)
+            if record is None or record.status not in _ACTIVE_STATUSES:
+                orphaned_files.append(staging_dir / doc_id)
+
+        log(f"\n=== 清理用户 {user_token} 的孤立暂存文件 ===")
+        log(f"暂存文件数量: {len(staged_names)}")
+        log(f"发现孤立文件数量: {len(orphaned_files)}")
+
+        if not orphaned_files:
+            log("✓ 没有发现孤立的暂存文件")
+            return
+
+        if dry_run:
+            for orphaned_file in orphaned_files:
+                log(f"[试运行] 会删除: {orphaned_file}")
+        else:
+            _unlink_files(staging_dir, orphaned_files, log)
+
+    except Exception as e:
+        log(f"清理暂存文件过程中出现错误: {e}")
+
+
+def clean_user_orphaned_files(
+    user_token: str, dry_run: bool = True, log: Callable[[str], None] = print
+):
+    """清理单个用户的孤立 processed 文件和暂存文件"""
+    clean_orphaned_processed_files(user_token, dry_run, log)
+    clean_orphaned_staged_files(user_token, dry_run, log)
 
 
 def clean_all_users_orphaned_files(dry_run: bool = True):
@@ -92,21 +206,41 @@ def clean_all_users_orphaned_files(dry_run: bool = True):
         print("用户根目录不存在")
         return
 
-    user_tokens = []
-    for user_dir in user_root_dir.iterdir():
-        if user_dir.is_dir():
-            user_tokens.append(user_dir.name)
+    with os.scandir(user_root_dir) as entries:
+        user_tokens = [entry.name for entry in entries if entry.is_dir()]
 
     print(f"发现 {len(user_tokens)} 个用户目录")
 
-    for user_token in user_tokens:
-        clean_orphaned_processed_files(user_token, dry_run)
+    asyncio.run(_clean_users_concurrently(user_tokens, dry_run))
+
+
+async def _clean_users_concurrently(user_tokens: List[str], dry_run: bool):
+    """并发清理多个用户，用信号量限制同时进行的磁盘扫描和数据库查询数量
+
+    每个用户的输出先收集起来，该用户清理完成后在锁内一次性打印，避免多个线程的输出交错。
+    """
+    semaphore = asyncio.Semaphore(CLEAN_CONCURRENCY)
+    print_lock = threading.Lock()
+
+    def clean_and_report(user_token: str):
+        lines: List[str] = []
+        try:
+            clean_user_orphaned_files(user_token, dry_run, lines.append)
+        finally:
+            with print_lock:
+                print("\n".join(lines))
+
+    async def clean_one(user_token: str):
+        async with semaphore:
+            await asyncio.to_thread(clean_and_report, user_token)
+
+    await asyncio.gather(*(clean_one(user_token) for user_token in user_tokens))
 
 
 if __name__ == "__main__":
     import argparse
 
-    parser = argparse.ArgumentParser(description="清理孤立的 processed 文件")
+    parser = argparse.ArgumentParser(description="清理孤立的 processed 文件和暂存文件")
     parser.add_argument("--user", help="指定用户令牌")
     parser.add_argument("--all-users", action="store_true", help="清理所有用户")
     parser.add_argument(
@@ -122,12 +256,12 @@ if __name__ == "__main__":
         print("使用 --execute 参数来实际执行删除操作")
     else:
         print("=== 执行模式 ===")
-        print("将实际删除孤立的 processed 文件")
+        print("将实际删除孤立的 processed 文件和暂存文件")
 
     if args.user:
-        clean_orphaned_processed_files(args.user, dry_run)
+        clean_user_orphaned_files(args.user, dry_run)
     elif args.all_users:
         clean_all_users_orphaned_files(dry_run)
     else:
         # 默认清理 test 用户
-        clean_orphaned_processed_files("test", dry_run)
+        clean_user_orphaned_files("test", dry_run)
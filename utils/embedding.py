@@ -5,7 +5,6 @@ from asyncio import Semaphore, TaskGroup
 from typing import List
 
 import httpx
-import requests
 from loguru import logger
 from tqdm import tqdm  # 导入 tqdm 用于进度条
 
@@ -23,6 +22,10 @@ class EmbeddingModel(ABC):
         """批量获取嵌入向量"""
         pass
 
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """一次请求获取多个文本的嵌入向量，默认退化为 get_embeddings_batch"""
+        return await self.get_embeddings_batch(texts)
+
     @abstractmethod
     async def similarity(self, text1: str, text2: str) -> float:
         """计算两个文本之间的相似度"""
@@ -45,18 +48,21 @@ class AsyncOllamaEmbeddingModel(EmbeddingModel):
             model_name: 要使用的模型名称
         """
         self.ollama_api_base = ollama_api_url
-        self.api_url = f"{ollama_api_url.rstrip('/')}/api/embeddings"
+        # 单条与批量嵌入统一使用 /api/embed（返回 L2 归一化向量），
+        # 旧的 /api/embeddings 返回未归一化向量，混用会使距离无法比较
+        self.embed_api_url = f"{ollama_api_url.rstrip('/')}/api/embed"
         self.model_name = model_name
         self.embedding_dim = 1024
-        # logger.info(f"OllamaEmbeddingModel initialized with API URL: {self.api_url}, model: {model_name}")
-        self.check_connection()
+        # logger.info(f"OllamaEmbeddingModel initialized with API URL: {self.embed_api_url}, model: {model_name}")
+        # 连接检查不在构造时同步执行，由启动流程调用 check_connection 一次
 
-    def check_connection(self) -> bool:
+    async def check_connection(self) -> bool:
         """异步检查与 Ollama API 的连接"""
         try:
-            # 尝试获取一个简单文本的嵌入，验证连接
-            requests.get(self.ollama_api_base).raise_for_status()
-            logger.info(f"Successfully connected to Ollama API at {self.api_url}")
+            async with httpx.AsyncClient() as client:
+                response = await client.get(self.ollama_api_base, timeout=10.0)
+                response.raise_for_status()
+            logger.info(f"Successfully connected to Ollama API at {self.embed_api_url}")
             return True
         except Exception as e:
             logger.error(f"Failed to connect to Ollama API: {str(e)}")
@@ -76,10 +82,22 @@ class AsyncOllamaEmbeddingModel(EmbeddingModel):
                 return await func(*args, **kwargs)
             except (httpx.RequestError, httpx.HTTPStatusError) as e:
                 if attempt < max_retries - 1:
+                    wait_time = retry_delay
+                    # 服务端限流时优先遵循 Retry-After
+                    if (
+                            isinstance(e, httpx.HTTPStatusError)
+                            and e.response.status_code == 429
+                    ):
+                        try:
+                            wait_time = float(
+                                e.response.headers.get("retry-after", retry_delay)
+                            )
+                        except ValueError:
+                            wait_time = retry_delay
                     logger.warning(
-                        f"API request failed: {str(e)}. Retrying in {retry_delay} seconds..."
+                        f"API request failed: {str(e)}. Retrying in {wait_time} seconds..."
                     )
-                    await asyncio.sleep(retry_delay)
+                    await asyncio.sleep(wait_time)
                     retry_delay *= 2  # 指数退避
                 else:
                     logger.error(
@@ -103,12 +121,13 @@ class AsyncOllamaEmbeddingModel(EmbeddingModel):
             # 返回零向量作为默认值，维度为 1024（BGE-M3 的嵌入维度）
             return [0.0] * self.embedding_dim
 
-        payload = {"model": self.model_name, "prompt": text}
+        # 与 embed_many 使用同一接口，保证查询向量和分块向量的归一化一致
+        payload = {"model": self.model_name, "input": [text]}
 
         async def make_request():
             async with httpx.AsyncClient() as client:
                 response = await client.post(
-                    self.api_url,
+                    self.embed_api_url,
                     headers={"Content-Type": "application/json"},
                     json=payload,
                     timeout=30.0,  # 30秒超时
@@ -118,12 +137,62 @@ class AsyncOllamaEmbeddingModel(EmbeddingModel):
 
         try:
             result = await self._retry_request(make_request)
-            return result.get("embedding", [])
+            embeddings = result.get("embeddings") or [[]]
+            return embeddings[0]
         except Exception as e:
             logger.error(f"Error getting embedding for text: {str(e)}")
             # 返回零向量作为错误时的默认值
             return [0.0] * self.embedding_dim
 
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """
+        通过 /api/embed 在一次请求中获取多个文本的嵌入向量
+
+        空文本直接返回零向量；批量请求失败时退回逐条请求。
+
+        Args:
+            texts: 输入文本列表
+
+        Returns:
+            嵌入向量列表，顺序与输入一致
+        """
+        embeddings = [[0.0] * self.embedding_dim for _ in texts]
+        indices = [
+            i for i, text in enumerate(texts) if text and isinstance(text, str)
+        ]
+        if not indices:
+            return embeddings
+
+        payload = {"model": self.model_name, "input": [texts[i] for i in indices]}
+
+        async def make_request():
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    self.embed_api_url,
+                    headers={"Content-Type": "application/json"},
+                    json=payload,
+                    timeout=120.0,
+                )
+                response.raise_for_status()
+                return response.json()
+
+        try:
+            result = await self._retry_request(make_request)
+            vectors = result.get("embeddings", [])
+            if len(vectors) != len(indices):
+                raise ValueError(
+                    f"expected {len(indices)} embeddings, got {len(vectors)}"
+                )
+        except Exception as e:
+            logger.warning(
+                f"Batch embedding failed, falling back to per-text requests: {str(e)}"
+            )
+            return await self.get_embeddings_batch(texts)
+
+        for i, vector in zip(indices, vectors):
+            embeddings[i] = vector
+        return embeddings
+
     async def get_embeddings_batch(
             self, texts: List[str], batch_size: int = 10, concurrency_limit: int = 5
     ) -> List[List[float]]:
@@ -171,10 +240,6 @@ class AsyncOllamaEmbeddingModel(EmbeddingModel):
 
                 pbar.update(1)  # 更新进度条
 
-                # 添加小延迟，避免请求过于频繁
-                if i + batch_size < len(texts):
-                    await asyncio.sleep(0.5)
-
         return all_embeddings
 
     async def similarity(self, text1: str, text2: str) -> float:
@@ -5,15 +5,135 @@
 基于 SQLite 的用户管理系统
 """
 
+import atexit
+import functools
 import sqlite3
 import threading
+import weakref
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import (
+    Any,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from pydantic import BaseModel
 
+# 单条 IN 查询的最大参数数量（SQLite 旧版本默认上限为 999）
+_IN_CLAUSE_BATCH_SIZE = 900
+
+# 每个连接都需要设置的会话级 PRAGMA；journal_mode=WAL 会持久化到数据库文件，只在初始化时设置一次
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",  # WAL 模式下只在检查点时 fsync
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",  # 256 MiB
+    "PRAGMA cache_size = -20000",  # 约 20 MiB 页缓存
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA foreign_keys = ON",  # 启用外键约束
+)
+
+# 上传记录的查询语句：集中定义为常量，每种过滤条件对应同一条 SQL 文本，可命中连接的语句缓存
+_UPLOAD_COLUMNS = (
+    "doc_id, user_token, collection_id, filename, status, upload_time, "
+    "process_start_time, process_end_time, err_msg, mime_type"
+)
+_SELECT_UPLOADS_SQL = f"SELECT {_UPLOAD_COLUMNS} FROM user_upload_record"
+_SELECT_UPLOAD_BY_ID_SQL = f"{_SELECT_UPLOADS_SQL} WHERE doc_id = ?"
+_SELECT_USER_UPLOADS_SQL = (
+    f"{_SELECT_UPLOADS_SQL} WHERE user_token = ? ORDER BY upload_time DESC LIMIT ?"
+)
+_SELECT_USER_UPLOADS_BY_STATUS_SQL = (
+    f"{_SELECT_UPLOADS_SQL} WHERE user_token = ? AND status = ? "
+    "ORDER BY upload_time DESC LIMIT ?"
+)
+_SELECT_ALL_UPLOADS_SQL = f"{_SELECT_UPLOADS_SQL} ORDER BY upload_time DESC LIMIT ?"
+_SELECT_ALL_UPLOADS_BY_STATUS_SQL = (
+    f"{_SELECT_UPLOADS_SQL} WHERE status = ? ORDER BY upload_time DESC LIMIT ?"
+)
+_SELECT_COLLECTION_UPLOADS_SQL = (
+    f"{_SELECT_UPLOADS_SQL} WHERE collection_id = ? ORDER BY upload_time DESC"
+)
+_SELECT_COLLECTION_UPLOADS_EXCEPT_SQL = (
+    f"{_SELECT_UPLOADS_SQL} WHERE collection_id = ? AND doc_id != ? "
+    "ORDER BY upload_time DESC LIMIT ?"
+)
+_SELECT_COLLECTION_SUMMARIES_EXCEPT_SQL = (
+    "SELECT doc_id, filename, status, upload_time FROM user_upload_record "
+    "WHERE collection_id = ? AND doc_id != ? ORDER BY upload_time DESC LIMIT ?"
+)
+# update_upload_record 允许更新的字段
+_UPDATABLE_UPLOAD_FIELDS = frozenset(
+    {
+        "collection_id",
+        "filename",
+        "status",
+        "upload_time",
+        "process_start_time",
+        "process_end_time",
+        "err_msg",
+        "mime_type",
+    }
+)
+
+
+@functools.lru_cache(maxsize=64)
+def _update_upload_sql(fields: Tuple[str, ...]) -> str:
+    """返回按给定字段更新上传记录的 UPDATE 语句，同一字段组合只拼接一次"""
+    set_clause = ", ".join(f"{field} = ?" for field in fields)
+    return f"UPDATE user_upload_record SET {set_clause} WHERE doc_id = ?"
+
+
+# 每个连接缓存的预编译语句数量
+_CACHED_STATEMENTS = 512
+
+# 用户、集合存在性缓存的最大条目数
+_EXISTS_CACHE_SIZE = 1024
+
+# 本进程内已完成建表的 (数据库路径, 表结构名)，重复实例化同一数据库时跳过建目录和 DDL；
+# DDL 均为 IF NOT EXISTS，并发初始化时重复执行也无害
+_INITIALIZED_SCHEMAS: Set[Tuple[str, str]] = set()
+
+
+class _LRUCache:
+    """线程安全的 LRU 缓存
+
+    只缓存已确认存在的行，删除时显式失效，因此命中的结果不会过期。
+    """
+
+    def __init__(self, maxsize: int):
+        self._maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
 
 class KBUploadRecord(BaseModel):
     """用户上传记录模型"""
@@ -30,6 +150,15 @@ class KBUploadRecord(BaseModel):
     mime_type: Optional[str] = None
 
 
+class UploadSummary(NamedTuple):
+    """上传记录的轻量投影，直接由数据库行构建，不经过模型校验和时间解析"""
+
+    doc_id: str
+    filename: str
+    status: str
+    upload_time: str  # ISO 格式字符串
+
+
 class UserInfo(BaseModel):
     """用户信息模型"""
 
@@ -72,6 +201,10 @@ class KnowledgeBase(UserDatabase):
         """添加上传记录，返回doc_id"""
         pass
 
+    def add_upload_records(self, records: List[KBUploadRecord]) -> List[str]:
+        """批量添加上传记录，默认逐条调用 add_upload_record"""
+        return [self.add_upload_record(record) for record in records]
+
     @abstractmethod
     def update_upload_record(self, doc_id: str, **kwargs) -> bool:
         """更新上传记录"""
@@ -82,6 +215,16 @@ class KnowledgeBase(UserDatabase):
         """根据任务ID获取上传记录"""
         pass
 
+    @abstractmethod
+    def existing_doc_ids(self, doc_ids: Iterable[str]) -> Set[str]:
+        """返回给定doc_id中在上传记录里存在的部分"""
+        pass
+
+    @abstractmethod
+    def get_uploads_by_statuses(self, statuses: Iterable[str]) -> List[KBUploadRecord]:
+        """获取处于给定状态之一的全部上传记录，按上传时间升序"""
+        pass
+
     @abstractmethod
     def delete_upload_record(self, doc_id: str) -> bool:
         """删除上传记录"""
@@ -144,8 +287,9 @@ class SQLiteUserDatabase(UserDatabase):
     DEFAULT_COLLECTION_DESCRIPTION = "用户默认知识库集合，用于存储未指定集合的文档"
 
     @staticmethod
+    @functools.lru_cache(maxsize=4096)
     def get_user_default_collection_id(user_token: str) -> str:
-        """获取用户的默认集合ID"""
+        """获取用户的默认集合ID，同一用户始终返回同一个字符串对象"""
         return f"default_{user_token}"
 
     def __init__(self, db_path: str):
@@ -155,13 +299,35 @@ class SQLiteUserDatabase(UserDatabase):
             db_path: 数据库文件路径
         """
         self.db_path = Path(db_path)
-        self.db_path.parent.mkdir(parents=True, exist_ok=True)
         self._lock = threading.Lock()
+        # 每个线程复用一个长连接；另以线程为弱引用键登记，线程结束后随之释放
+        self._local = threading.local()
+        self._connections: "weakref.WeakKeyDictionary[threading.Thread, sqlite3.Connection]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._connections_lock = threading.Lock()
+        atexit.register(self.close)
+        # 已存在的用户 -> 创建时间、已存在的集合 -> 创建者，写路径上的存在性检查不必每次查库
+        self._user_cache = _LRUCache(_EXISTS_CACHE_SIZE)
+        self._collection_cache = _LRUCache(_EXISTS_CACHE_SIZE)
         self._init_user_table()
 
+    def _schema_key(self, schema: str) -> Tuple[str, str]:
+        """返回 _INITIALIZED_SCHEMAS 中标识本数据库某组表结构的键"""
+        return str(self.db_path.resolve()), schema
+
     def _init_user_table(self):
-        """初始化数据库表结构"""
-        with self._get_connection() as conn:
+        """初始化数据库表结构，同一进程内每个数据库文件只执行一次"""
+        schema_key = self._schema_key("user")
+        if schema_key in _INITIALIZED_SCHEMAS:
+            return
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # WAL 模式下读操作不再阻塞写操作，该设置持久保存在数据库文件中；不能在事务中设置
+        self._get_connection().execute("PRAGMA journal_mode = WAL")
+
+        # 所有 DDL 放在同一个事务中，只提交一次
+        with self._writer() as conn:
             cursor = conn.cursor()
 
             # 创建用户信息表
@@ -175,99 +341,174 @@ class SQLiteUserDatabase(UserDatabase):
                 """
             )
 
-            conn.commit()
+        _INITIALIZED_SCHEMAS.add(schema_key)
 
-    def _create_user_default_collection(self, user_token: str):
-        """为用户创建默认集合"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-
-            collection_id = self.get_user_default_collection_id(user_token)
-
-            # 检查用户的默认集合是否存在，不存在则创建
+    def _get_user_create_time(
+            self, cursor: sqlite3.Cursor, user_token: str
+    ) -> Optional[datetime]:
+        """返回用户的创建时间，用户不存在时返回 None；优先使用缓存"""
+        create_time = self._user_cache.get(user_token)
+        if create_time is None:
+            cursor.execute(
+                "SELECT create_time FROM user_info WHERE user_token = ?",
+                (user_token,),
+            )
+            row = cursor.fetchone()
+            if row:
+                create_time = datetime.fromisoformat(row[0])
+                self._user_cache.put(user_token, create_time)
+        return create_time
+
+    def _get_collection_owner(
+            self, cursor: sqlite3.Cursor, collection_id: str
+    ) -> Optional[str]:
+        """返回集合的创建者，集合不存在时返回 None；优先使用缓存"""
+        owner = self._collection_cache.get(collection_id)
+        if owner is None:
             cursor.execute(
-                "SELECT collection_id FROM kb_collections WHERE collection_id = ?",
+                "SELECT created_by FROM kb_collections WHERE collection_id = ?",
                 (collection_id,),
             )
-            if not cursor.fetchone():
-                create_time = datetime.now()
-                cursor.execute(
-                    """
-                    INSERT INTO kb_collections
-                        (collection_id, collection_name, description, create_time, created_by)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (
-                        collection_id,
-                        self.DEFAULT_COLLECTION_NAME,
-                        self.DEFAULT_COLLECTION_DESCRIPTION,
-                        create_time.isoformat(),
-                        user_token,
-                    ),
-                )
-                conn.commit()
-                return True
+            row = cursor.fetchone()
+            if row:
+                owner = row[0]
+                self._collection_cache.put(collection_id, owner)
+        return owner
+
+    def _create_user_default_collection(
+            self, conn: sqlite3.Connection, user_token: str
+    ) -> bool:
+        """为用户创建默认集合，在调用方 _writer() 的事务中执行"""
+        collection_id = self.get_user_default_collection_id(user_token)
+        if self._collection_cache.get(collection_id) is not None:
             return False
 
+        # 主键保证幂等：集合已存在时 INSERT OR IGNORE 不做任何修改，无需先查询
+        create_time = datetime.now()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO kb_collections
+                (collection_id, collection_name, description, create_time, created_by)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (
+                collection_id,
+                self.DEFAULT_COLLECTION_NAME,
+                self.DEFAULT_COLLECTION_DESCRIPTION,
+                create_time.isoformat(),
+                user_token,
+            ),
+        )
+        return cursor.rowcount > 0
+
     def _get_connection(self) -> sqlite3.Connection:
-        """获取数据库连接"""
-        conn = sqlite3.connect(str(self.db_path))
-        conn.execute("PRAGMA foreign_keys = ON")  # 启用外键约束
+        """获取当前线程的数据库连接
+
+        连接按线程缓存并复用，省去每次调用的打开文件和设置 PRAGMA 开销，语句缓存也能持续生效。
+        `with conn:` 仅提交或回滚事务，不会关闭连接。写操作通过 _writer() 串行化，
+        读操作在 WAL 模式下无需加锁。
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 连接只在创建它的线程中使用；关闭 check_same_thread 以便退出时由 close() 统一关闭
+            conn = sqlite3.connect(
+                str(self.db_path),
+                check_same_thread=False,
+                cached_statements=_CACHED_STATEMENTS,
+            )
+            for pragma in _CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections[threading.current_thread()] = conn
         return conn
 
+    def close(self):
+        """关闭所有线程缓存的数据库连接，进程退出时自动调用"""
+        with self._connections_lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    @contextmanager
+    def _writer(self) -> Iterator[sqlite3.Connection]:
+        """
+        写操作的统一入口：持有写锁并将代码块包裹在一个 BEGIN IMMEDIATE 事务中
+
+        正常退出时提交，异常时回滚。写锁与事务范围一致，锁内不会出现多个各自提交的隐式事务。
+        缓存失效应在代码块结束、事务提交之后进行，避免并发读取在提交前把旧数据重新写入缓存。
+        """
+        with self._lock:
+            conn = self._get_connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
     def _row_to_user_info(self, row: tuple) -> UserInfo:
         """将数据库行转换为UserInfo对象"""
         return UserInfo(user_token=row[0], create_time=datetime.fromisoformat(row[1]))
 
     def create_user_if_not_exists(self, user_token: str) -> UserInfo:
         """创建用户（如果不存在）"""
-        with self._lock:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
+        # 已知存在的用户直接返回，无需获取写锁
+        create_time = self._user_cache.get(user_token)
+        if create_time is not None:
+            return UserInfo(user_token=user_token, create_time=create_time)
 
-                # 首先检查用户是否存在
-                cursor.execute(
-                    "SELECT user_token, create_time FROM user_info WHERE user_token = ?",
-                    (user_token,),
-                )
-                row = cursor.fetchone()
-
-                if row:
-                    return self._row_to_user_info(row)
+        with self._writer() as conn:
+            cursor = conn.cursor()
 
-                # 用户不存在，创建新用户
-                create_time = datetime.now()
-                cursor.execute(
-                    "INSERT INTO user_info (user_token, create_time) VALUES (?, ?)",
-                    (user_token, create_time.isoformat()),
-                )
-                # 如果没有指定collection_id，创建并使用用户的默认集合
-                conn.commit()
-                self._create_user_default_collection(user_token)
+            # 直接尝试插入，用户已存在时不做任何修改，也不返回行
+            create_time = datetime.now()
+            cursor.execute(
+                """
+                INSERT INTO user_info (user_token, create_time)
+                VALUES (?, ?)
+                ON CONFLICT (user_token) DO NOTHING
+                RETURNING user_token
+                """,
+                (user_token, create_time.isoformat()),
+            )
+            created = bool(cursor.fetchall())
+            if created:
+                # 新用户与其默认集合在同一个事务中创建
+                self._create_user_default_collection(conn, user_token)
+            else:
+                create_time = self._get_user_create_time(cursor, user_token)
 
-                return UserInfo(user_token=user_token, create_time=create_time)
+        if created:
+            self._user_cache.put(user_token, create_time)
+            self._collection_cache.put(
+                self.get_user_default_collection_id(user_token), user_token
+            )
+        return UserInfo(user_token=user_token, create_time=create_time)
 
     def get_user_info(self, user_token: str) -> Optional[UserInfo]:
         """获取用户信息"""
         with self._get_connection() as conn:
+            create_time = self._get_user_create_time(conn.cursor(), user_token)
+            if create_time is None:
+                return None
+            return UserInfo(user_token=user_token, create_time=create_time)
+
+    def delete_user(self, user_token: str) -> bool:
+        """删除用户"""
+        with self._writer() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                "SELECT user_token, create_time FROM user_info WHERE user_token = ?",
-                (user_token,),
+                "DELETE FROM user_info WHERE user_token = ?", (user_token,)
             )
-            row = cursor.fetchone()
-            return self._row_to_user_info(row) if row else None
+            deleted = cursor.rowcount > 0
 
-    def delete_user(self, user_token: str) -> bool:
-        """删除用户"""
-        with self._lock:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "DELETE FROM user_info WHERE user_token = ?", (user_token,)
-                )
-                conn.commit()
-                return cursor.rowcount > 0
+        self._user_cache.pop(user_token)
+        return deleted
 
 
 class SQLiteKnowledgeBaseDB(SQLiteUserDatabase, KnowledgeBase):
@@ -283,8 +524,13 @@ class SQLiteKnowledgeBaseDB(SQLiteUserDatabase, KnowledgeBase):
         self._init_kb_table()
 
     def _init_kb_table(self):
-        """初始化知识库相关表结构"""
-        with self._get_connection() as conn:
+        """初始化知识库相关表结构，同一进程内每个数据库文件只执行一次"""
+        schema_key = self._schema_key("kb")
+        if schema_key in _INITIALIZED_SCHEMAS:
+            return
+
+        # 所有 DDL 放在同一个事务中，只提交一次
+        with self._writer() as conn:
             cursor = conn.cursor()
 
             # 创建知识库集合表
@@ -324,27 +570,49 @@ class SQLiteKnowledgeBaseDB(SQLiteUserDatabase, KnowledgeBase):
             )
 
             # 创建索引提高查询性能
+            # 按用户/集合查询时都按 upload_time 倒序分页，复合索引可按索引顺序读取并在 LIMIT 处停止
+            cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_upload_user_time
+                    ON user_upload_record (user_token, upload_time DESC)
+                """
+            )
+
             cursor.execute(
                 """
-                CREATE INDEX IF NOT EXISTS idx_upload_user_token
-                    ON user_upload_record (user_token)
+                CREATE INDEX IF NOT EXISTS idx_upload_user_status_time
+                    ON user_upload_record (user_token, status, upload_time DESC)
                 """
             )
 
             cursor.execute(
                 """
-                CREATE INDEX IF NOT EXISTS idx_upload_status
-                    ON user_upload_record (status)
+                CREATE INDEX IF NOT EXISTS idx_upload_coll_time
+                    ON user_upload_record (collection_id, upload_time DESC)
                 """
             )
 
+            # 按状态筛选全部记录时同样按 upload_time 倒序取前 N 条
             cursor.execute(
                 """
-                CREATE INDEX IF NOT EXISTS idx_upload_collection
-                    ON user_upload_record (collection_id)
+                CREATE INDEX IF NOT EXISTS idx_upload_status_time
+                    ON user_upload_record (status, upload_time DESC)
                 """
             )
 
+            # 不带筛选条件列出全部记录时按索引顺序读取，避免全表排序
+            cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_upload_time
+                    ON user_upload_record (upload_time DESC)
+                """
+            )
+
+            # 单列索引已被上面以相同列开头的复合索引覆盖
+            cursor.execute("DROP INDEX IF EXISTS idx_upload_user_token")
+            cursor.execute("DROP INDEX IF EXISTS idx_upload_collection")
+            cursor.execute("DROP INDEX IF EXISTS idx_upload_status")
+
             cursor.execute(
                 """
                 CREATE INDEX IF NOT EXISTS idx_kb_collections_created_by
@@ -352,165 +620,266 @@ class SQLiteKnowledgeBaseDB(SQLiteUserDatabase, KnowledgeBase):
                 """
             )
 
-            conn.commit()
+        _INITIALIZED_SCHEMAS.add(schema_key)
 
     def _row_to_upload_record(self, row: tuple) -> KBUploadRecord:
-        """将数据库行转换为KBUploadRecord对象"""
-        return KBUploadRecord(
-            doc_id=row[0],
-            user_token=row[1],
-            collection_id=row[2],
-            filename=row[3],
-            status=row[4],
-            upload_time=datetime.fromisoformat(row[5]),
-            process_start_time=datetime.fromisoformat(row[6]) if row[6] else None,
-            process_end_time=datetime.fromisoformat(row[7]) if row[7] else None,
-            err_msg=row[8],
-            mime_type=row[9],
+        """将数据库行转换为KBUploadRecord对象
+
+        时间字段用 datetime.fromisoformat（Python 3.11+ 为 C 实现）解析后，
+        以 model_construct 构建模型，跳过对可信数据库行的 Pydantic 校验。
+        """
+        (
+            doc_id,
+            user_token,
+            collection_id,
+            filename,
+            status,
+            upload_time,
+            process_start_time,
+            process_end_time,
+            err_msg,
+            mime_type,
+        ) = row
+        fromisoformat = datetime.fromisoformat
+        return KBUploadRecord.model_construct(
+            doc_id=doc_id,
+            user_token=user_token,
+            collection_id=collection_id,
+            filename=filename,
+            status=status,
+            upload_time=fromisoformat(upload_time),
+            process_start_time=(
+                fromisoformat(process_start_time) if process_start_time else None
+            ),
+            process_end_time=(
+                fromisoformat(process_end_time) if process_end_time else None
+            ),
+            err_msg=err_msg,
+            mime_type=mime_type,
+        )
+
+    @staticmethod
+    def _upload_record_params(record: KBUploadRecord) -> tuple:
+        """将上传记录转换为 INSERT 语句的参数"""
+        return (
+            record.doc_id,
+            record.user_token,
+            record.collection_id,
+            record.filename,
+            record.status,
+            record.upload_time.isoformat(),
+            (
+                record.process_start_time.isoformat()
+                if record.process_start_time
+                else None
+            ),
+            (
+                record.process_end_time.isoformat()
+                if record.process_end_time
+                else None
+            ),
+            record.err_msg,
+            record.mime_type,
         )
 
+    @staticmethod
+    def _check_upload_record(cursor: sqlite3.Cursor, record: KBUploadRecord):
+        """检查上传记录的约束，不满足时抛出 ValueError
+
+        正常路径依靠主键和外键约束由 INSERT 一次完成校验，
+        只有插入失败时才逐项查询以给出具体的错误信息。
+        """
+        # 检查doc_id是否已存在
+        cursor.execute(
+            "SELECT doc_id FROM user_upload_record WHERE doc_id = ?",
+            (record.doc_id,),
+        )
+        if cursor.fetchone():
+            raise ValueError(f"Document ID '{record.doc_id}' already exists")
+
+        # 检查user_token是否存在
+        cursor.execute(
+            "SELECT user_token FROM user_info WHERE user_token = ?",
+            (record.user_token,),
+        )
+        if not cursor.fetchone():
+            raise ValueError(f"User token '{record.user_token}' does not exist")
+
+        # 检查collection_id是否存在
+        cursor.execute(
+            "SELECT collection_id FROM kb_collections WHERE collection_id = ?",
+            (record.collection_id,),
+        )
+        if not cursor.fetchone():
+            raise ValueError(f"Collection '{record.collection_id}' does not exist")
+
     def add_upload_record(self, record: KBUploadRecord) -> str:
         """添加上传记录，返回doc_id"""
-        with self._lock:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
+        self.add_upload_records([record])
+        return record.doc_id
 
-                # 检查doc_id是否已存在
-                cursor.execute(
-                    "SELECT doc_id FROM user_upload_record WHERE doc_id = ?",
-                    (record.doc_id,),
-                )
-                if cursor.fetchone():
-                    raise ValueError(f"Document ID '{record.doc_id}' already exists")
+    def add_upload_records(self, records: List[KBUploadRecord]) -> List[str]:
+        """
+        在一个事务中批量添加上传记录
 
-                # 检查user_token是否存在
-                cursor.execute(
-                    "SELECT user_token FROM user_info WHERE user_token = ?",
-                    (record.user_token,),
-                )
-                if not cursor.fetchone():
-                    raise ValueError(f"User token '{record.user_token}' does not exist")
+        未指定 collection_id 的记录归入用户的默认集合（不存在时先创建），并回写到记录上。
+        全部记录通过一条 executemany 在同一个 BEGIN IMMEDIATE 事务中写入，只提交一次。
 
-                # 检查collection_id是否存在
-                cursor.execute(
-                    "SELECT collection_id FROM kb_collections WHERE collection_id = ?",
-                    (record.collection_id,),
+        Args:
+            records: 上传记录列表
+
+        Returns:
+            List[str]: 添加的doc_id列表
+
+        Raises:
+            ValueError: doc_id 重复、用户或集合不存在时抛出，此时不会写入任何记录
+        """
+        if not records:
+            return []
+
+        default_tokens = set()
+        for record in records:
+            if record.collection_id is None:
+                record.collection_id = self.get_user_default_collection_id(
+                    record.user_token
+                )
+                default_tokens.add(record.user_token)
+
+        # 每个用户只确保一次默认集合存在，已知存在的跳过；用户不存在时外键约束会拒绝创建。
+        # 默认集合单独提交，下面插入失败时的逐项检查才能看到它们
+        default_tokens = [
+            user_token
+            for user_token in default_tokens
+            if self._collection_cache.get(self.get_user_default_collection_id(user_token))
+            is None
+        ]
+        if default_tokens:
+            with self._writer() as conn:
+                for user_token in default_tokens:
+                    try:
+                        self._create_user_default_collection(conn, user_token)
+                    except sqlite3.IntegrityError:
+                        raise ValueError(f"User token '{user_token}' does not exist")
+            for user_token in default_tokens:
+                self._collection_cache.put(
+                    self.get_user_default_collection_id(user_token), user_token
                 )
-                if not cursor.fetchone():
-                    raise ValueError(
-                        f"Collection '{record.collection_id}' does not exist"
-                    )
 
-                # 插入上传记录
-                cursor.execute(
+        with self._writer() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany(
                     """
                     INSERT INTO user_upload_record
                     (doc_id, user_token, collection_id, filename, status, upload_time,
                      process_start_time, process_end_time, err_msg, mime_type)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                     """,
-                    (
-                        record.doc_id,
-                        record.user_token,
-                        record.collection_id,
-                        record.filename,
-                        record.status,
-                        record.upload_time.isoformat(),
-                        (
-                            record.process_start_time.isoformat()
-                            if record.process_start_time
-                            else None
-                        ),
-                        (
-                            record.process_end_time.isoformat()
-                            if record.process_end_time
-                            else None
-                        ),
-                        record.err_msg,
-                        record.mime_type,
-                    ),
+                    [self._upload_record_params(record) for record in records],
                 )
-                conn.commit()
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                for record in records:
+                    self._check_upload_record(cursor, record)
+                raise
 
-                return record.doc_id
+        return [record.doc_id for record in records]
 
     def update_upload_record(self, doc_id: str, **kwargs) -> bool:
         """更新上传记录"""
         if not kwargs:
             return False
 
-        with self._lock:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-
-                # 如果要更新collection_id，先验证其存在性
-                if "collection_id" in kwargs and kwargs["collection_id"]:
-                    cursor.execute(
-                        "SELECT collection_id FROM kb_collections WHERE collection_id = ?",
-                        (kwargs["collection_id"],),
+        with self._writer() as conn:
+            cursor = conn.cursor()
+
+            # 如果要更新collection_id，先验证其存在性
+            if "collection_id" in kwargs and kwargs["collection_id"]:
+                if self._get_collection_owner(cursor, kwargs["collection_id"]) is None:
+                    raise ValueError(
+                        f"Collection '{kwargs['collection_id']}' does not exist"
                     )
-                    if not cursor.fetchone():
-                        raise ValueError(
-                            f"Collection '{kwargs['collection_id']}' does not exist"
-                        )
-
-                # 构建SET子句
-                set_clauses = []
-                values = []
-
-                allowed_fields = {
-                    "collection_id",
-                    "filename",
-                    "status",
-                    "upload_time",
-                    "process_start_time",
-                    "process_end_time",
-                    "err_msg",
-                    "mime_type",
-                }
-
-                for key, value in kwargs.items():
-                    if key in allowed_fields:
-                        set_clauses.append(f"{key} = ?")
-                        if key.endswith("_time") and isinstance(value, datetime):
-                            values.append(value.isoformat())
-                        else:
-                            values.append(value)
-
-                if not set_clauses:
-                    return False
-
-                values.append(doc_id)
-
-                sql = f"UPDATE user_upload_record SET {', '.join(set_clauses)} WHERE doc_id = ?"
-                cursor.execute(sql, values)
-                conn.commit()
-                return cursor.rowcount > 0
+
+            # 按字段组合复用预先拼好的 UPDATE 语句，同一组合的 SQL 文本也能命中语句缓存
+            fields = tuple(key for key in kwargs if key in _UPDATABLE_UPLOAD_FIELDS)
+            if not fields:
+                return False
+
+            values = []
+            for field in fields:
+                value = kwargs[field]
+                values.append(
+                    value.isoformat() if isinstance(value, datetime) else value
+                )
+            values.append(doc_id)
+            cursor.execute(_update_upload_sql(fields), values)
+            return cursor.rowcount > 0
 
     def get_upload_record(self, doc_id: str) -> Optional[KBUploadRecord]:
         """根据doc_id获取上传记录"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                """
-                SELECT doc_id,
-                       user_token,
-                       collection_id,
-                       filename,
-                       status,
-                       upload_time,
-                       process_start_time,
-                       process_end_time,
-                       err_msg,
-                       mime_type
-                FROM user_upload_record
-                WHERE doc_id = ?
-                """,
+                _SELECT_UPLOAD_BY_ID_SQL,
                 (doc_id,),
             )
             row = cursor.fetchone()
             return self._row_to_upload_record(row) if row else None
 
+    def existing_doc_ids(self, doc_ids: Iterable[str]) -> Set[str]:
+        """批量检查doc_id是否存在上传记录
+
+        按 _IN_CLAUSE_BATCH_SIZE 分批拼接 IN 查询，保持在 SQLite 变量数上限以内。
+
+        Args:
+            doc_ids: 待检查的doc_id
+
+        Returns:
+            Set[str]: 存在上传记录的doc_id集合
+        """
+        doc_ids = list(dict.fromkeys(doc_ids))
+        found = set()
+        if not doc_ids:
+            return found
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            for i in range(0, len(doc_ids), _IN_CLAUSE_BATCH_SIZE):
+                batch = doc_ids[i: i + _IN_CLAUSE_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                cursor.execute(
+                    f"SELECT doc_id FROM user_upload_record WHERE doc_id IN ({placeholders})",
+                    batch,
+                )
+                found.update(row[0] for row in cursor)
+        return found
+
+    def get_uploads_by_statuses(self, statuses: Iterable[str]) -> List[KBUploadRecord]:
+        """获取处于给定状态之一的全部上传记录
+
+        不设数量上限，按上传时间升序返回，供重启后恢复未完成任务时按原顺序重新入队。
+
+        Args:
+            statuses: 记录状态，如 "pending"、"processing"
+
+        Returns:
+            List[KBUploadRecord]: 匹配的上传记录
+        """
+        statuses = list(dict.fromkeys(statuses))
+        if not statuses:
+            return []
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            placeholders = ", ".join("?" * len(statuses))
+            cursor.execute(
+                f"{_SELECT_UPLOADS_SQL} WHERE status IN ({placeholders}) "
+                "ORDER BY upload_time",
+                statuses,
+            )
+            # 直接迭代游标逐行构建记录，不再先物化一份行元组列表
+            return [self._row_to_upload_record(row) for row in cursor]
+
     def get_user_uploads(
             self, user_token: str, limit: int = 50, status: Optional[str] = None
     ) -> List[KBUploadRecord]:
@@ -520,48 +889,17 @@ class SQLiteKnowledgeBaseDB(SQLiteUserDatabase, KnowledgeBase):
 
             if status:
                 cursor.execute(
-                    """
-                    SELECT doc_id,
-                           user_token,
-                           collection_id,
-                           filename,
-                           status,
-                           upload_time,
-                           process_start_time,
-                           process_end_time,
-                           err_msg,
-                           mime_type
-                    FROM user_upload_record
-                    WHERE user_token = ?
-                      AND status = ?
-                    ORDER BY upload_time DESC
-                    LIMIT ?
-                    """,
+                    _SELECT_USER_UPLOADS_BY_STATUS_SQL,
                     (user_token, status, limit),
                 )
             else:
                 cursor.execute(
-                    """
-                    SELECT doc_id,
-                           user_token,
-                           collection_id,
-                           filename,
-                           status,
-                           upload_time,
-                           process_start_time,
-                           process_end_time,
-                           err_msg,
-                           mime_type
-                    FROM user_upload_record
-                    WHERE user_token = ?
-                    ORDER BY upload_time DESC
-                    LIMIT ?
-                    """,
+                    _SELECT_USER_UPLOADS_SQL,
                     (user_token, limit),
                 )
 
-            rows = cursor.fetchall()
-            return [self._row_to_upload_record(row) for row in rows]
+            # 直接迭代游标逐行构建记录，不再先物化一份行元组列表
+            return [self._row_to_upload_record(row) for row in cursor]
 
     def get_all_uploads(
             self, limit: int = 50, status: Optional[str] = None
@@ -572,46 +910,17 @@ class SQLiteKnowledgeBaseDB(SQLiteUserDatabase, KnowledgeBase):
 
             if status:
                 cursor.execute(
-                    """
-                    SELECT doc_id,
-                           user_token,
-                           collection_id,
-                           filename,
-                           status,
-                           upload_time,
-                           process_start_time,
-                           process_end_time,
-                           err_msg,
-                           mime_type
-                    FROM user_upload_record
-                    WHERE status = ?
-                    ORDER BY upload_time DESC
-                    LIMIT ?
-                    """,
+                    _SELECT_ALL_UPLOADS_BY_STATUS_SQL,
                     (status, limit),
                 )
             else:
                 cursor.execute(
-                    """
-                    SELECT doc_id,
-                           user_token,
-                           collection_id,
-                           filename,
-                           status,
-                           upload_time,
-                           process_start_time,
-                           process_end_time,
-                           err_msg,
-                           mime_type
-                    FROM user_upload_record
-                    ORDER BY upload_time DESC
-                    LIMIT ?
-                    """,
+                    _SELECT_ALL_UPLOADS_SQL,
                     (limit,),
                 )
 
-            rows = cursor.fetchall()
-            return [self._row_to_upload_record(row) for row in rows]
+            # 直接迭代游标逐行构建记录，不再先物化一份行元组列表
+            return [self._row_to_upload_record(row) for row in cursor]
 
     def query_documents(
             self, doc_id: str, collection_id: str, top_k: int = 5
@@ -623,27 +932,27 @@ class SQLiteKnowledgeBaseDB(SQLiteUserDatabase, KnowledgeBase):
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                """
-                SELECT doc_id,
-                       user_token,
-                       collection_id,
-                       filename,
-                       status,
-                       upload_time,
-                       process_start_time,
-                       process_end_time,
-                       err_msg,
-                       mime_type
-                FROM user_upload_record
-                WHERE collection_id = ?
-                  AND doc_id != ?
-                ORDER BY upload_time DESC
-                LIMIT ?
-                """,
+                _SELECT_COLLECTION_UPLOADS_EXCEPT_SQL,
                 (collection_id, doc_id, top_k),
             )
-            rows = cursor.fetchall()
-            return [self._row_to_upload_record(row) for row in rows]
+            # 直接迭代游标逐行构建记录，不再先物化一份行元组列表
+            return [self._row_to_upload_record(row) for row in cursor]
+
+    def query_documents_lite(
+            self, doc_id: str, collection_id: str, top_k: int = 5
+    ) -> List[UploadSummary]:
+        """查询指定集合中的文档，只返回轻量的 UploadSummary
+
+        与 query_documents 的筛选和排序相同，但只读取 4 列且不构建 KBUploadRecord，
+        适合只需要候选文档标识的场景。
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                _SELECT_COLLECTION_SUMMARIES_EXCEPT_SQL,
+                (collection_id, doc_id, top_k),
+            )
+            return list(map(UploadSummary._make, cursor))
 
     def create_collection(
             self,
@@ -653,49 +962,49 @@ class SQLiteKnowledgeBaseDB(SQLiteUserDatabase, KnowledgeBase):
             description: str = None,
     ) -> bool:
         """创建新的知识库集合"""
-        with self._lock:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
+        with self._writer() as conn:
+            cursor = conn.cursor()
 
-                # 检查集合ID是否已存在
-                cursor.execute(
-                    "SELECT collection_id FROM kb_collections WHERE collection_id = ?",
-                    (collection_id,),
-                )
-                if cursor.fetchone():
-                    raise ValueError(f"Collection ID '{collection_id}' already exists")
+            # 检查集合ID是否已存在
+            if self._get_collection_owner(cursor, collection_id) is not None:
+                raise ValueError(f"Collection ID '{collection_id}' already exists")
 
-                # 检查创建者是否存在
-                cursor.execute(
-                    "SELECT user_token FROM user_info WHERE user_token = ?",
-                    (created_by,),
-                )
-                if not cursor.fetchone():
-                    raise ValueError(f"User token '{created_by}' does not exist")
+            # 检查创建者是否存在
+            if self._get_user_create_time(cursor, created_by) is None:
+                raise ValueError(f"User token '{created_by}' does not exist")
 
-                # 创建集合
-                create_time = datetime.now()
-                cursor.execute(
-                    """
-                    INSERT INTO kb_collections
-                        (collection_id, collection_name, description, create_time, created_by)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (
-                        collection_id,
-                        collection_name,
-                        description,
-                        create_time.isoformat(),
-                        created_by,
-                    ),
-                )
-                conn.commit()
-                return True
+            # 创建集合
+            create_time = datetime.now()
+            cursor.execute(
+                """
+                INSERT INTO kb_collections
+                    (collection_id, collection_name, description, create_time, created_by)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (
+                    collection_id,
+                    collection_name,
+                    description,
+                    create_time.isoformat(),
+                    created_by,
+                ),
+            )
+
+        self._collection_cache.put(collection_id, created_by)
+        return True
+
+    @staticmethod
+    def _row_to_collection_info(row: sqlite3.Row) -> Dict[str, Any]:
+        """将集合查询的 sqlite3.Row 转换为字典，键即查询的列名"""
+        info = dict(row)
+        info["create_time"] = datetime.fromisoformat(info["create_time"])
+        return info
 
     def get_collection_info(self, collection_id: str) -> Optional[Dict[str, Any]]:
         """获取集合信息"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             cursor.execute(
                 """
                 SELECT collection_id, collection_name, description, create_time, created_by
@@ -707,19 +1016,13 @@ class SQLiteKnowledgeBaseDB(SQLiteUserDatabase, KnowledgeBase):
             row = cursor.fetchone()
             if not row:
                 return None
-
-            return {
-                "collection_id": row[0],
-                "collection_name": row[1],
-                "description": row[2],
-                "create_time": datetime.fromisoformat(row[3]),
-                "created_by": row[4],
-            }
+            return self._row_to_collection_info(row)
 
     def list_collections(self, user_token: str) -> List[Dict[str, Any]]:
         """获取用户创建的所有集合"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             cursor.execute(
                 """
                 SELECT collection_id, collection_name, description, create_time, created_by
@@ -729,52 +1032,44 @@ class SQLiteKnowledgeBaseDB(SQLiteUserDatabase, KnowledgeBase):
                 """,
                 (user_token,),
             )
-            rows = cursor.fetchall()
-            return [
-                {
-                    "collection_id": row[0],
-                    "collection_name": row[1],
-                    "description": row[2],
-                    "create_time": datetime.fromisoformat(row[3]),
-                    "created_by": row[4],
-                }
-                for row in rows
-            ]
+            return [self._row_to_collection_info(row) for row in cursor]
 
     def delete_upload_record(self, doc_id: str) -> bool:
         """删除上传记录"""
-        with self._lock:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "DELETE FROM user_upload_record WHERE doc_id = ?", (doc_id,)
-                )
-                conn.commit()
-                return cursor.rowcount > 0
+        with self._writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM user_upload_record WHERE doc_id = ?", (doc_id,)
+            )
+            return cursor.rowcount > 0
 
     def delete_user(self, user_token: str) -> bool:
-        """删除用户及其所有相关数据"""
-        with self._lock:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
+        """删除用户及其所有相关数据，三条 DELETE 在同一个事务中执行"""
+        with self._writer() as conn:
+            cursor = conn.cursor()
 
-                # 先删除用户的上传记录（因为它们引用集合）
-                cursor.execute(
-                    "DELETE FROM user_upload_record WHERE user_token = ?", (user_token,)
-                )
+            # 先删除用户的上传记录（因为它们引用集合）
+            cursor.execute(
+                "DELETE FROM user_upload_record WHERE user_token = ?", (user_token,)
+            )
 
-                # 然后删除用户创建的集合
-                cursor.execute(
-                    "DELETE FROM kb_collections WHERE created_by = ?", (user_token,)
-                )
+            # 然后删除用户创建的集合，RETURNING 给出被删除的集合以便精确清理缓存
+            cursor.execute(
+                "DELETE FROM kb_collections WHERE created_by = ? RETURNING collection_id",
+                (user_token,),
+            )
+            deleted_collections = [row[0] for row in cursor.fetchall()]
 
-                # 最后删除用户信息
-                cursor.execute(
-                    "DELETE FROM user_info WHERE user_token = ?", (user_token,)
-                )
+            # 最后删除用户信息，以这一条的影响行数判断用户是否存在
+            cursor.execute(
+                "DELETE FROM user_info WHERE user_token = ?", (user_token,)
+            )
+            affected = cursor.rowcount
 
-                conn.commit()
-                return cursor.rowcount > 0
+        self._user_cache.pop(user_token)
+        for collection_id in deleted_collections:
+            self._collection_cache.pop(collection_id)
+        return affected > 0
 
     def get_collection(
             self, user_token: str, collection_id: str
@@ -784,41 +1079,23 @@ class SQLiteKnowledgeBaseDB(SQLiteUserDatabase, KnowledgeBase):
             cursor = conn.cursor()
 
             # 检查用户是否有权限访问该集合（必须是集合的创建者）
-            cursor.execute(
-                "SELECT created_by FROM kb_collections WHERE collection_id = ?",
-                (collection_id,),
-            )
-            row = cursor.fetchone()
-            if not row:
+            owner = self._get_collection_owner(cursor, collection_id)
+            if owner is None:
                 raise ValueError(f"Collection '{collection_id}' does not exist")
 
             # 只有集合的创建者才能访问
-            if row[0] != user_token:
+            if owner != user_token:
                 raise PermissionError(
                     f"User '{user_token}' does not have permission to access collection '{collection_id}'"
                 )
 
             # 获取集合中的所有文档
             cursor.execute(
-                """
-                SELECT doc_id,
-                       user_token,
-                       collection_id,
-                       filename,
-                       status,
-                       upload_time,
-                       process_start_time,
-                       process_end_time,
-                       err_msg,
-                       mime_type
-                FROM user_upload_record
-                WHERE collection_id = ?
-                ORDER BY upload_time DESC
-                """,
+                _SELECT_COLLECTION_UPLOADS_SQL,
                 (collection_id,),
             )
-            rows = cursor.fetchall()
-            return [self._row_to_upload_record(row) for row in rows]
+            # 直接迭代游标逐行构建记录，不再先物化一份行元组列表
+            return [self._row_to_upload_record(row) for row in cursor]
 
     def add_document_to_collection(self, doc_id: str, collection_id: str) -> bool:
         """将文档添加到集合中"""
@@ -826,13 +1103,19 @@ class SQLiteKnowledgeBaseDB(SQLiteUserDatabase, KnowledgeBase):
 
     def remove_document_from_collection(self, doc_id: str, collection_id: str) -> bool:
         """从集合中移除文档"""
-        # 检查文档当前是否在指定集合中
-        record = self.get_upload_record(doc_id)
-        if not record or record.collection_id != collection_id:
-            return False
-
-        # 将collection_id设置为None来移除关联
-        return self.update_upload_record(doc_id, collection_id=None)
+        # 检查文档是否在指定集合中并将collection_id置为NULL，在一条UPDATE中完成
+        with self._writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                UPDATE user_upload_record
+                SET collection_id = NULL
+                WHERE doc_id = ?
+                  AND collection_id = ?
+                """,
+                (doc_id, collection_id),
+            )
+            return cursor.rowcount > 0
 
     def get_user_default_collection_info(
             self, user_token: str
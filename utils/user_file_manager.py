@@ -4,15 +4,61 @@
 用户文件管理器
 基于用户 token 的文件存储管理
 """
+import os
 import shutil
+import threading
+import time
 from abc import ABC, abstractmethod
 from datetime import datetime
 from pathlib import Path
-from typing import Tuple, Optional, List, Dict, IO
+from typing import Tuple, Optional, List, Dict
 
 from fastapi import UploadFile
 from pydantic import BaseModel
 
+# 上传文件流式写入磁盘时每次复制的字节数
+UPLOAD_COPY_BUFFER_SIZE = 1 << 20
+
+
+def _max_open_files() -> int:
+    """本类同时打开的文件数上限：进程文件描述符软限制的四分之一，至少 32 个"""
+    try:
+        import resource
+
+        soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft_limit == resource.RLIM_INFINITY:
+            soft_limit = 4096
+    except (ImportError, OSError, ValueError):
+        # Windows 没有 resource 模块，C 运行时默认最多同时打开 512 个文件
+        soft_limit = 512
+    return max(32, soft_limit // 4)
+
+
+# 所有文件管理器实例共享的打开文件配额，突发上传时排队等待而不是耗尽文件描述符（EMFILE），
+# 为向量库和数据库连接留出余量
+_open_file_slots = threading.BoundedSemaphore(_max_open_files())
+
+
+def _write_upload(file: UploadFile, path: Path):
+    """将上传文件流式写入指定路径，内存占用与文件大小无关
+
+    已知文件大小时先用 posix_fallocate 一次性分配磁盘空间，减少碎片；
+    不支持该调用的平台或文件系统上直接写入。
+    """
+    with _open_file_slots, open(path, "wb") as buffer:
+        size = getattr(file, "size", None)
+        preallocated = False
+        if size and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(buffer.fileno(), 0, size)
+                preallocated = True
+            except OSError:
+                pass
+        shutil.copyfileobj(file.file, buffer, UPLOAD_COPY_BUFFER_SIZE)
+        if preallocated:
+            # 预分配会把文件长度设为声明的大小，实际内容较短时截掉多余部分
+            buffer.truncate()
+
 
 class FilePath(BaseModel):
     root: Path
@@ -48,6 +94,11 @@ class UserFileManager(ABC):
         """获取文档的原始和处理目录"""
         pass
 
+    @abstractmethod
+    def get_staging_dir(self, user_token: str) -> Path:
+        """获取上传暂存目录"""
+        pass
+
     @abstractmethod
     def save_uploaded_file(
         self, file: UploadFile, user_token: str, doc_id: str
@@ -55,6 +106,30 @@ class UserFileManager(ABC):
         """保存用户上传的文件"""
         pass
 
+    @abstractmethod
+    def stage_uploaded_file(
+        self, file: UploadFile, user_token: str, doc_id: str
+    ) -> Path:
+        """将上传文件暂存到临时区域，返回暂存路径"""
+        pass
+
+    @abstractmethod
+    def commit_staged_file(
+        self, staged_path: Path, user_token: str, doc_id: str, file_extension: str
+    ) -> Path:
+        """将暂存文件移动到原始文件目录，返回最终路径"""
+        pass
+
+    @abstractmethod
+    def find_staged_file(self, user_token: str, doc_id: str) -> Optional[Path]:
+        """查找尚未移动到原始文件目录的暂存文件，不存在时返回 None"""
+        pass
+
+    @abstractmethod
+    def discard_staged_file(self, user_token: str, doc_id: str) -> None:
+        """删除文档的暂存文件，不存在时忽略"""
+        pass
+
     @abstractmethod
     def save_processed_content(
         self,
@@ -67,8 +142,8 @@ class UserFileManager(ABC):
         pass
 
     @abstractmethod
-    def get_origin_file_content(self, user_token: str, doc_id: str) -> Optional[str]:
-        """读取文件内容"""
+    def get_origin_file_content(self, user_token: str, doc_id: str) -> Optional[bytes]:
+        """读取原始文件内容"""
         pass
 
     @abstractmethod
@@ -99,6 +174,9 @@ class UserFileManager(ABC):
 class LocalUserFileManager(UserFileManager):
     """基于本地文件系统的用户文件管理器实现"""
 
+    # 用户存储统计的缓存有效期（秒）；向量库等不经本类写入的文件最多延迟这么久才计入
+    STORAGE_INFO_CACHE_TTL = 30.0
+
     def __init__(self, base_data_dir: str = "data"):
         """初始化文件管理器
 
@@ -112,10 +190,26 @@ class LocalUserFileManager(UserFileManager):
         self.user_root_dir = self.base_data_dir / "user"
         self.user_root_dir.mkdir(parents=True, exist_ok=True)
 
+        # 已确认目录结构存在的用户，之后的调用不再重复 mkdir
+        self._ensured_users: set = set()
+
+        # 原始文件索引：user_token -> {doc_id: 带扩展名的文件名}，首次查找时扫描目录构建
+        self._origin_names: Dict[str, Dict[str, str]] = {}
+
+        # 用户存储统计缓存：user_token -> (总字节数, 文档数, 统计时间)
+        self._storage_info_cache: Dict[str, Tuple[int, int, float]] = {}
+
     def _get_user_base_dir(self, user_token: str) -> Path:
-        """获取用户基础目录：data/user/{user_token}"""
+        """获取用户基础目录：data/user/{user_token}
+
+        首次访问某个用户时一次性创建其全部上传子目录，之后直接返回路径。
+        """
         user_dir = self.user_root_dir / user_token
-        user_dir.mkdir(parents=True, exist_ok=True)
+        if user_token not in self._ensured_users:
+            uploads_dir = user_dir / "uploads"
+            for name in ("origin", "processed", "staging"):
+                (uploads_dir / name).mkdir(parents=True, exist_ok=True)
+            self._ensured_users.add(user_token)
         return user_dir
 
     def get_doc_dirs(self, user_token: str) -> Tuple[Path, Path]:
@@ -128,25 +222,45 @@ class LocalUserFileManager(UserFileManager):
 
         # 原始文件目录：data/user/{user_token}/uploads/{doc_id}/origin/
         original_dir = user_base / "uploads" / "origin"
-        original_dir.mkdir(parents=True, exist_ok=True)
 
         # 处理后文件目录：data/user/{user_token}/uploads/{doc_id}/processed/
         processed_dir = user_base / "uploads" / "processed"
-        processed_dir.mkdir(parents=True, exist_ok=True)
 
         return original_dir, processed_dir
 
-    def _get_original_filename(self, user_token: str, doc_id: str) -> Path:
-        """获取原始文件的完整路径"""
+    def _load_origin_names(self, user_token: str) -> Dict[str, str]:
+        """扫描用户原始文件目录，重建 doc_id -> 文件名 索引"""
         original_dir, _ = self.get_doc_dirs(user_token)
+        origin_names = {}
+        with os.scandir(original_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    origin_names[os.path.splitext(entry.name)[0]] = entry.name
+        self._origin_names[user_token] = origin_names
+        return origin_names
+
+    def _record_origin_name(self, user_token: str, doc_id: str, filename: str):
+        """新写入原始文件后更新已加载的索引；未加载时留待首次查找时扫描"""
+        origin_names = self._origin_names.get(user_token)
+        if origin_names is not None:
+            origin_names[doc_id] = filename
 
-        # 查找以doc_id开头的文件（包含原始文件扩展名）
-        for file_path in original_dir.iterdir():
-            if file_path.is_file() and file_path.stem == doc_id:
-                return file_path
+    def _get_original_filename(self, user_token: str, doc_id: str) -> Path:
+        """获取原始文件的完整路径（包含原始文件扩展名）
 
-        # 如果没有找到匹配的文件，返回不带扩展名的路径（向后兼容）
-        raise FileNotFoundError("<UNK>")
+        Raises:
+            FileNotFoundError: 文档的原始文件不存在
+        """
+        original_dir, _ = self.get_doc_dirs(user_token)
+
+        origin_names = self._origin_names.get(user_token)
+        filename = origin_names.get(doc_id) if origin_names is not None else None
+        if filename is None:
+            # 索引未加载或未命中时重新扫描一次，兼容不经本类写入的文件
+            filename = self._load_origin_names(user_token).get(doc_id)
+        if filename is None:
+            raise FileNotFoundError(f"原始文件不存在: {user_token}/{doc_id}")
+        return original_dir / filename
 
     def get_user_directories(self, user_token: str) -> FilePath:
         """获取用户的原始文件和处理后文件目录"""
@@ -154,7 +268,6 @@ class LocalUserFileManager(UserFileManager):
 
         # 用户上传根目录
         uploads_dir = user_base / "uploads"
-        uploads_dir.mkdir(parents=True, exist_ok=True)
 
         return FilePath(root=user_base, original=uploads_dir, processed=uploads_dir)
 
@@ -171,9 +284,9 @@ class LocalUserFileManager(UserFileManager):
         original_file_path = original_dir / f"{doc_id}{file_extension}"
 
         try:
-            with open(original_file_path, "wb") as buffer:
-                content = file.file.read()
-                buffer.write(content)
+            _write_upload(file, original_file_path)
+            self._record_origin_name(user_token, doc_id, original_file_path.name)
+            self._invalidate_storage_info(user_token)
 
             return FilePath(
                 root=self._get_user_base_dir(user_token),
@@ -187,6 +300,47 @@ class LocalUserFileManager(UserFileManager):
                 original_file_path.unlink()
             raise e
 
+    def get_staging_dir(self, user_token: str) -> Path:
+        """获取上传暂存目录：data/user/{user_token}/uploads/staging"""
+        return self._get_user_base_dir(user_token) / "uploads" / "staging"
+
+    def stage_uploaded_file(
+        self, file: UploadFile, user_token: str, doc_id: str
+    ) -> Path:
+        """将上传文件流式复制到暂存目录，最终落盘由处理任务完成"""
+        staged_path = self.get_staging_dir(user_token) / doc_id
+
+        try:
+            _write_upload(file, staged_path)
+            self._invalidate_storage_info(user_token)
+            return staged_path
+
+        except Exception as e:
+            if staged_path.exists():
+                staged_path.unlink()
+            raise e
+
+    def commit_staged_file(
+        self, staged_path: Path, user_token: str, doc_id: str, file_extension: str
+    ) -> Path:
+        """将暂存文件移动到原始文件目录（同一文件系统内为原子重命名）"""
+        original_dir, _ = self.get_doc_dirs(user_token)
+        original_file_path = original_dir / f"{doc_id}{file_extension}"
+        os.replace(staged_path, original_file_path)
+        self._record_origin_name(user_token, doc_id, original_file_path.name)
+        self._invalidate_storage_info(user_token)
+        return original_file_path
+
+    def find_staged_file(self, user_token: str, doc_id: str) -> Optional[Path]:
+        """查找尚未移动到原始文件目录的暂存文件，不存在时返回 None"""
+        staged_path = self.get_staging_dir(user_token) / doc_id
+        return staged_path if staged_path.is_file() else None
+
+    def discard_staged_file(self, user_token: str, doc_id: str) -> None:
+        """删除文档的暂存文件，不存在时忽略"""
+        (self.get_staging_dir(user_token) / doc_id).unlink(missing_ok=True)
+        self._invalidate_storage_info(user_token)
+
     def save_processed_content(
         self,
         user_token: str,
@@ -201,8 +355,9 @@ class LocalUserFileManager(UserFileManager):
         # 保存处理后的内容
         processed_file_path = processed_dir / f"{doc_id}.txt"
 
-        with open(processed_file_path, "w", encoding="utf-8") as f:
+        with _open_file_slots, open(processed_file_path, "w", encoding="utf-8") as f:
             f.write(content)
+        self._invalidate_storage_info(user_token)
 
         return True
 
@@ -215,33 +370,73 @@ class LocalUserFileManager(UserFileManager):
             processed_file_path = processed_dir / f"{doc_id}.txt"
 
             if processed_file_path.exists():
-                with open(processed_file_path, "r", encoding="utf-8") as f:
+                with _open_file_slots, open(
+                    processed_file_path, "r", encoding="utf-8"
+                ) as f:
                     return f.read()
             return None
         except Exception as e:
             return f"Error reading file: {str(e)}"
 
-    def get_origin_file_content(self, user_token: str, doc_id: str) -> IO[bytes] | None:
-        # 如果处理后的文件不存在，尝试读取原始文件
+    def get_origin_file_content(self, user_token: str, doc_id: str) -> Optional[bytes]:
+        """读取原始文件内容
+
+        返回文件字节而不是文件对象，文件在返回前已关闭，调用方无需负责释放文件描述符。
+        """
         original_file_path = self._get_original_filename(user_token, doc_id)
 
         if original_file_path.exists():
-            # 根据文件类型尝试读取
-            with open(original_file_path, "rb") as f:
-                return f
+            with _open_file_slots, open(original_file_path, "rb") as f:
+                return f.read()
         return None
 
+    def _invalidate_storage_info(self, user_token: str):
+        """用户文件发生变化后使存储统计缓存失效"""
+        self._storage_info_cache.pop(user_token, None)
+
+    @staticmethod
+    def _scan_user_storage(user_base: Path) -> Tuple[int, int]:
+        """单次遍历用户目录，返回 (总字节数, 原始文档数)
+
+        os.scandir 的目录项自带文件类型，判断文件/目录无需额外 stat，每个文件只 stat 一次。
+        """
+        origin_dir = str(user_base / "uploads" / "origin")
+        total_size = 0
+        doc_count = 0
+        pending = [str(user_base)]
+        while pending:
+            current = pending.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if current == origin_dir:
+                            doc_count += 1
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file():
+                            total_size += entry.stat().st_size
+            except FileNotFoundError:
+                # 遍历期间目录被删除
+                continue
+        return total_size, doc_count
+
     def get_user_storage_info(self, user_token: str) -> UserFileStructure:
-        """获取用户存储信息"""
+        """获取用户存储信息，统计结果在有效期内缓存"""
         user_base = self._get_user_base_dir(user_token)
 
-        # 计算用户目录总大小
-        total_size = 0
-        if user_base.exists():
-            for file_path in user_base.rglob("*"):
-                if file_path.is_file():
-                    total_size += file_path.stat().st_size
-        doc_count = len(list(user_base.glob("uploads/origin/*")))
+        cached = self._storage_info_cache.get(user_token)
+        if cached is not None and (
+            time.monotonic() - cached[2] < self.STORAGE_INFO_CACHE_TTL
+        ):
+            total_size, doc_count, _ = cached
+        else:
+            # 计算用户目录总大小
+            total_size, doc_count = self._scan_user_storage(user_base)
+            self._storage_info_cache[user_token] = (
+                total_size,
+                doc_count,
+                time.monotonic(),
+            )
         return UserFileStructure(
             user_token=user_token,
             doc_id=f"total_docs_{doc_count}",
@@ -252,17 +447,21 @@ class LocalUserFileManager(UserFileManager):
     def delete_user_doc(self, user_token: str, doc_id: str) -> bool:
         """删除用户文档"""
         try:
-            # 删除原始文件
-            original_file_path = self._get_original_filename(user_token, doc_id)
-            if original_file_path.exists():
-                original_file_path.unlink()
-
-            # 删除处理后的文件
+            # 删除原始文件；原始文件已不存在时仍继续清理处理后的文件
+            try:
+                self._get_original_filename(user_token, doc_id).unlink(missing_ok=True)
+            except FileNotFoundError:
+                pass
+            self._origin_names.get(user_token, {}).pop(doc_id, None)
+
+            # 删除处理后的文件，文件名与 save_processed_content 一致
             _, processed_dir = self.get_doc_dirs(user_token)
-            processed_file_path = processed_dir / f"{doc_id}.txt"  # 修正文件命名格式
-            if processed_file_path.exists():
-                processed_file_path.unlink()
+            (processed_dir / f"{doc_id}.txt").unlink(missing_ok=True)
 
+            # 尚未处理的文档只有暂存文件
+            (self.get_staging_dir(user_token) / doc_id).unlink(missing_ok=True)
+
+            self._invalidate_storage_info(user_token)
             return True
 
         except Exception:
@@ -273,8 +472,11 @@ class LocalUserFileManager(UserFileManager):
         try:
             # 删除用户目录
             user_dir = self._get_user_base_dir(user_token)
+            self._ensured_users.discard(user_token)
+            self._origin_names.pop(user_token, None)
             if user_dir.exists():
                 shutil.rmtree(user_dir)
+            self._invalidate_storage_info(user_token)
             return True
 
         except Exception:
@@ -283,19 +485,23 @@ class LocalUserFileManager(UserFileManager):
     def list_user_docs(self, user_token: str) -> List[Dict]:
         """列出用户的所有文档"""
         docs = []
-        user_base = self._get_user_base_dir(user_token)
         original_dir, processed_dir = self.get_doc_dirs(user_token)
-        # 获取原始文件目录下的所有文件
-        for file_path in original_dir.iterdir():
-            if file_path.is_file():
-                doc_info = {
-                    "doc_id": file_path.stem,
-                    "file_name": file_path.name,
-                    "file_size": file_path.stat().st_size,
-                    "created_at": datetime.fromtimestamp(file_path.stat().st_ctime),
-                    "processed": (processed_dir / f"{file_path.stem}.txt").exists(),
-                }
-                docs.append(doc_info)
+        # 处理后文件名一次性读入集合，避免每个文档单独检查是否存在
+        processed_names = set(os.listdir(processed_dir))
+        # 获取原始文件目录下的所有文件，每个文件只 stat 一次
+        with os.scandir(original_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    doc_id = os.path.splitext(entry.name)[0]
+                    stat_result = entry.stat()
+                    doc_info = {
+                        "doc_id": doc_id,
+                        "file_name": entry.name,
+                        "file_size": stat_result.st_size,
+                        "created_at": datetime.fromtimestamp(stat_result.st_ctime),
+                        "processed": f"{doc_id}.txt" in processed_names,
+                    }
+                    docs.append(doc_info)
         return docs
 
 
@@ -1,53 +1,260 @@
+import copy
+import hashlib
 import os
-from typing import List
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, List, Tuple, Union
 
 import chromadb
+import numpy as np
+
+# Characters that may close a chunk in VectorStore.chunk_text
+SENTENCE_ENDERS = (".", "?", "!", "。", "？", "！", "\n")
+# Code points of the sentence enders, for a vectorized scan over the whole text
+_SENTENCE_ENDER_CODEPOINTS = np.array(
+    [ord(c) for c in SENTENCE_ENDERS], dtype=np.uint32
+)
+
+# 搜索结果缓存（LRU），键为 (集合作用域, 集合版本, 查询摘要, top_k)，
+# 值为 (过期时间, 结果)
+SEARCH_CACHE_SIZE = 2048
+# 集合版本号只在本进程内递增，其他进程写入同一集合后缓存最多在此时间内过期（秒）
+SEARCH_CACHE_TTL = 60.0
+_search_cache: OrderedDict = OrderedDict()
+# 每个集合的写入版本号，写入后递增使旧的缓存条目失效
+_search_generations: dict = {}
+_search_cache_lock = threading.Lock()
+# 每个集合的 doc_id -> 分块数量 索引，进程内首次使用时由 Chroma 中的分块ID构建；
+# 分块ID格式为 {doc_id}_{chunk_index}，已知分块数即可直接得到全部ID
+_doc_chunk_indexes: dict = {}
+_doc_chunk_indexes_lock = threading.Lock()
+# Chroma 查询结果中按查询分组的字段
+_PER_QUERY_FIELDS = frozenset(
+    ("ids", "embeddings", "documents", "uris", "data", "metadatas", "distances")
+)
 
 
 class VectorStore:
-    def __init__(self, collection, persist_directory="./data/chroma_db"):
+    # add_documents 每次调用 collection.add 写入的最大分块数
+    ADD_BATCH_SIZE = 512
+
+    def __init__(
+        self,
+        collection,
+        persist_directory="./data/chroma_db",
+        add_batch_size: int = ADD_BATCH_SIZE,
+    ):
         os.makedirs(persist_directory, exist_ok=True)
         assert isinstance(collection, str), "collection must be a string"
         self.chroma_client = chromadb.PersistentClient(path=persist_directory)
         self.collection = self.chroma_client.get_or_create_collection(collection)
+        self._cache_scope = (os.path.abspath(persist_directory), collection)
+        # 不超过 Chroma 客户端允许的单次写入上限
+        self.add_batch_size = max(
+            1, min(add_batch_size, self.chroma_client.get_max_batch_size())
+        )
+
+    def _make_key(self, kind: str, query_digest: bytes, top_k: int) -> tuple:
+        """生成搜索缓存键"""
+        generation = _search_generations.get(self._cache_scope, 0)
+        return self._cache_scope, generation, kind, query_digest, top_k
+
+    def _invalidate_search_cache(self):
+        """集合内容变化后使该集合的搜索缓存失效"""
+        with _search_cache_lock:
+            _search_generations[self._cache_scope] = (
+                _search_generations.get(self._cache_scope, 0) + 1
+            )
+
+    def _doc_chunk_counts(self) -> dict:
+        """返回本集合的 doc_id -> 分块数量 索引，首次使用时只取一次全部ID来构建"""
+        with _doc_chunk_indexes_lock:
+            counts = _doc_chunk_indexes.get(self._cache_scope)
+            if counts is None:
+                counts = {}
+                for chunk_id in self.collection.get(include=[])["ids"]:
+                    doc_id, _, chunk_index = chunk_id.rpartition("_")
+                    if doc_id and chunk_index.isdigit():
+                        counts[doc_id] = max(
+                            counts.get(doc_id, 0), int(chunk_index) + 1
+                        )
+                _doc_chunk_indexes[self._cache_scope] = counts
+            return counts
+
+    def _query_doc_chunk_ids(self, doc_id: str) -> List[str]:
+        """按元数据中的 doc_id 向 Chroma 查询分块ID，并同步到分块数量索引
+
+        索引只在进程内维护，其他进程写入的文档不在其中，未命中时以此兜底。
+        """
+        chunk_ids = self.collection.get(where={"doc_id": doc_id}, include=[])["ids"]
+        if chunk_ids:
+            counts = self._doc_chunk_counts()
+            prefix = f"{doc_id}_"
+            chunk_count = max(
+                (
+                    int(chunk_id[len(prefix):]) + 1
+                    for chunk_id in chunk_ids
+                    if chunk_id.startswith(prefix) and chunk_id[len(prefix):].isdigit()
+                ),
+                default=0,
+            )
+            with _doc_chunk_indexes_lock:
+                counts[doc_id] = max(counts.get(doc_id, 0), chunk_count)
+        return chunk_ids
+
+    @staticmethod
+    def _get_cached(key: tuple, now: float):
+        """读取未过期的缓存结果，调用方需持有 _search_cache_lock"""
+        entry = _search_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, cached = entry
+        if expires_at <= now:
+            del _search_cache[key]
+            return None
+        _search_cache.move_to_end(key)
+        return cached
+
+    def _cached_query(self, key: tuple, run_query):
+        """先查搜索缓存，未命中或已过期时执行查询并写入缓存"""
+        with _search_cache_lock:
+            cached = self._get_cached(key, time.monotonic())
+        if cached is not None:
+            return copy.deepcopy(cached)
+
+        results = run_query()
+        with _search_cache_lock:
+            _search_cache[key] = (
+                time.monotonic() + SEARCH_CACHE_TTL,
+                copy.deepcopy(results),
+            )
+            if len(_search_cache) > SEARCH_CACHE_SIZE:
+                _search_cache.popitem(last=False)
+        return results
 
     def add_documents(
         self,
         document_chunks: List,
-        embeddings: List[List],
+        embeddings: Union[np.ndarray, List[List]],
         metadata_list: List,
         doc_id: str,
     ):
         """
         添加文档到向量数据库
         :param document_chunks:
-        :param embeddings:
-        :param metadata_list:
+        :param embeddings: 嵌入向量，float32 连续矩阵可直接传给 Chroma 而无需复制
+        :param metadata_list: 每个分块的元数据，写入时复制并补充 doc_id 字段供按文档过滤
         :param doc_id:
         :return:
         """
-        ids = [f"{doc_id}_{i}" for i in range(len(document_chunks))]
-
-        self.collection.add(
-            documents=document_chunks,
-            embeddings=embeddings,
-            metadatas=metadata_list,
-            ids=ids,
-        )
+        prefix = f"{doc_id}_"
+        ids = [prefix + str(i) for i in range(len(document_chunks))]
+        # delete_document / check_document_exists 依赖元数据中的 doc_id 在 Chroma 内过滤
+        if metadata_list is None:
+            metadata_list = [{"doc_id": doc_id} for _ in document_chunks]
+        else:
+            # 复制后再补充 doc_id，不修改调用方传入的字典
+            metadata_list = [{**metadata, "doc_id": doc_id} for metadata in metadata_list]
+        # 一次性转换为 float32 连续矩阵，避免 Chroma 逐个转换 Python float
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+        # 分批写入，限制单次调用的内存峰值；切片 float32 矩阵只产生视图，不复制
+        counts = self._doc_chunk_counts()
+        batch_size = self.add_batch_size
+        attempted = 0
+        try:
+            for start in range(0, len(ids), batch_size):
+                end = start + batch_size
+                attempted = min(end, len(ids))
+                self.collection.add(
+                    documents=document_chunks[start:end],
+                    embeddings=embeddings[start:end],
+                    metadatas=metadata_list[start:end],
+                    ids=ids[start:end],
+                )
+        finally:
+            # 中途失败时已写入的分块也要登记，保证 delete_document 能清理干净
+            if attempted:
+                with _doc_chunk_indexes_lock:
+                    counts[doc_id] = max(counts.get(doc_id, 0), attempted)
+                self._invalidate_search_cache()
 
         return ids
 
     def search_by_embedding(self, embedding, top_k=5):
         """基于文本搜索相关文档"""
-        results = self.collection.query(query_embeddings=[embedding], n_results=top_k)
+        digest = hashlib.blake2b(
+            np.asarray(embedding, dtype=np.float32).tobytes(), digest_size=16
+        ).digest()
+        return self._cached_query(
+            self._make_key("embedding", digest, top_k),
+            lambda: self.collection.query(
+                query_embeddings=[embedding], n_results=top_k
+            ),
+        )
 
+    def search_by_embeddings(self, embeddings, top_k=5) -> List[dict]:
+        """
+        批量基于嵌入向量搜索，未命中缓存的查询合并为一次 Chroma 查询
+
+        :param embeddings: 多个查询向量
+        :param top_k: 每个查询返回的结果数量
+        :return: 与输入顺序一致的结果列表，每项与 search_by_embedding 的返回格式相同
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings[np.newaxis, :]
+
+        keys = [
+            self._make_key(
+                "embedding",
+                hashlib.blake2b(row.tobytes(), digest_size=16).digest(),
+                top_k,
+            )
+            for row in embeddings
+        ]
+        results: List = [None] * len(keys)
+        with _search_cache_lock:
+            now = time.monotonic()
+            for i, key in enumerate(keys):
+                cached = self._get_cached(key, now)
+                if cached is not None:
+                    results[i] = copy.deepcopy(cached)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        batch = self.collection.query(
+            query_embeddings=embeddings[missing], n_results=top_k
+        )
+        # 将批量结果拆分为单查询格式：每个列表字段只保留对应查询的那一项
+        for pos, i in enumerate(missing):
+            results[i] = {
+                field: (
+                    [value[pos]]
+                    if field in _PER_QUERY_FIELDS and value is not None
+                    else value
+                )
+                for field, value in batch.items()
+            }
+
+        with _search_cache_lock:
+            expires_at = time.monotonic() + SEARCH_CACHE_TTL
+            for i in missing:
+                _search_cache[keys[i]] = (expires_at, copy.deepcopy(results[i]))
+            while len(_search_cache) > SEARCH_CACHE_SIZE:
+                _search_cache.popitem(last=False)
         return results
 
     def search_by_keyword(self, keyword, top_k=5):
         """基于关键字搜索文档"""
-        results = self.collection.query(query_texts=[keyword], n_results=top_k)
-
-        return results
+        digest = hashlib.blake2b(keyword.encode("utf-8"), digest_size=16).digest()
+        return self._cached_query(
+            self._make_key("keyword", digest, top_k),
+            lambda: self.collection.query(query_texts=[keyword], n_results=top_k),
+        )
 
     def list_all_documents(self, limit=None):
         """
@@ -76,20 +283,21 @@ class VectorStore:
             int: 删除的文档条目数量
         """
         try:
-            # 获取所有文档
-            all_documents = self.collection.get()
-
-            # 找到所有以doc_id开头的ID
-            ids_to_delete = []
-            if all_documents["ids"]:
-                for doc_id_in_db in all_documents["ids"]:
-                    # 检查ID是否以指定的doc_id开头，格式为 {doc_id}_{chunk_index}
-                    if doc_id_in_db.startswith(f"{doc_id}_"):
-                        ids_to_delete.append(doc_id_in_db)
+            # 由分块数量直接生成ID，无需先查询 Chroma；索引未命中时按 doc_id 查询
+            counts = self._doc_chunk_counts()
+            chunk_count = counts.get(doc_id, 0)
+            if chunk_count:
+                prefix = f"{doc_id}_"
+                ids_to_delete = [prefix + str(i) for i in range(chunk_count)]
+            else:
+                ids_to_delete = self._query_doc_chunk_ids(doc_id)
 
             # 如果找到要删除的ID，执行删除操作
             if ids_to_delete:
                 self.collection.delete(ids=ids_to_delete)
+                with _doc_chunk_indexes_lock:
+                    counts.pop(doc_id, None)
+                self._invalidate_search_cache()
                 print(f"成功删除 {len(ids_to_delete)} 个与文档ID '{doc_id}' 相关的条目")
                 return len(ids_to_delete)
             else:
@@ -125,14 +333,10 @@ class VectorStore:
             bool: 如果存在返回True，否则返回False
         """
         try:
-            # 获取所有文档ID
-            all_documents = self.collection.get()
-
-            if all_documents["ids"]:
-                for doc_id_in_db in all_documents["ids"]:
-                    if doc_id_in_db.startswith(f"{doc_id}_"):
-                        return True
-            return False
+            if self._doc_chunk_counts().get(doc_id, 0):
+                return True
+            # 索引只覆盖本进程已知的写入，未命中时再向 Chroma 确认
+            return bool(self._query_doc_chunk_ids(doc_id))
 
         except Exception as e:
             print(f"检查文档存在性时发生错误: {str(e)}")
@@ -142,6 +346,7 @@ class VectorStore:
     def chunk_text(text: str, chunk_size: int = 3000, overlap: int = 500) -> list[str]:
         """
         Splits a text into overlapping chunks, ensuring each chunk ends with a sentence-ending punctuation mark.
+        See iter_chunks for a lazy variant that does not materialize the list.
 
         Args:
             text (str): The input text to be chunked.
@@ -154,17 +359,68 @@ class VectorStore:
         Raises:
             ValueError: If chunk_size is less than or equal to overlap, as this prevents meaningful progress.
         """
+        return list(VectorStore.iter_chunks(text, chunk_size, overlap))
+
+    @staticmethod
+    def iter_chunks(
+        text: str, chunk_size: int = 3000, overlap: int = 500
+    ) -> Iterator[str]:
+        """
+        Lazily yields the chunks produced by chunk_text, one at a time.
+
+        Args:
+            text (str): The input text to be chunked.
+            chunk_size (int): The maximum desired size (in characters) for each chunk.
+            overlap (int): The desired number of overlapping characters between consecutive chunks.
+
+        Yields:
+            str: The next text chunk.
+
+        Raises:
+            ValueError: If chunk_size is less than or equal to overlap.
+        """
+        for start, end in VectorStore.iter_chunk_offsets(text, chunk_size, overlap):
+            yield text[start:end]
+
+    @staticmethod
+    def iter_chunk_offsets(
+        text: str, chunk_size: int = 3000, overlap: int = 500
+    ) -> Iterator[Tuple[int, int]]:
+        """
+        Lazily yields the (start, end) boundaries of the chunks produced by chunk_text.
+
+        Callers that only need positions (or want to slice later, in batches) can use
+        this to avoid materializing every chunk string up front.
+
+        Args:
+            text (str): The input text to be chunked.
+            chunk_size (int): The maximum desired size (in characters) for each chunk.
+            overlap (int): The desired number of overlapping characters between consecutive chunks.
+
+        Yields:
+            Tuple[int, int]: Start (inclusive) and end (exclusive) index of the next chunk.
+
+        Raises:
+            ValueError: If chunk_size is less than or equal to overlap.
+        """
         actual_end_index = 0
-        sentence_enders = {".", "?", "!", "。", "？", "！", "\n"}
         if not text:
-            return []
+            return
 
         if chunk_size <= overlap:
             raise ValueError(
                 f"chunk_size ({chunk_size}) must be greater than overlap ({overlap})"
             )
 
-        chunks = []
+        # Locate every sentence ender once; each window then needs only a binary search.
+        # UTF-32 gives one element per code point, so array indices equal str indices.
+        codepoints = np.frombuffer(
+            text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+        )
+        ender_positions = np.flatnonzero(
+            np.isin(codepoints, _SENTENCE_ENDER_CODEPOINTS)
+        )
+
         start_index = 0
         text_length = len(text)
 
@@ -173,25 +429,16 @@ class VectorStore:
             if ideal_end_index == text_length:
                 actual_end_index = text_length
             else:
-                found_ender = False
-                for i in range(ideal_end_index - 1, start_index - 1, -1):
-
-                    if text[i] in sentence_enders:
-
-                        if (
-                            i >= start_index
-                        ):  # Ensure the ender is within the current theoretical chunk slice
-                            actual_end_index = i + 1  # Include the punctuation mark
-                            found_ender = True
-                            break
-                        else:
-                            continue
-                if not found_ender:
+                # Last sentence ender in [start_index, ideal_end_index)
+                idx = int(np.searchsorted(ender_positions, ideal_end_index)) - 1
+                if idx >= 0 and ender_positions[idx] >= start_index:
+                    # Include the punctuation mark
+                    actual_end_index = int(ender_positions[idx]) + 1
+                else:
                     actual_end_index = ideal_end_index
 
-            chunk = text[start_index:actual_end_index]
-            if chunk:  # Avoid adding empty chunks
-                chunks.append(chunk)
+            if actual_end_index > start_index:  # Avoid yielding empty chunks
+                yield start_index, actual_end_index
 
             if actual_end_index >= text_length:
                 break
@@ -208,5 +455,3 @@ class VectorStore:
 
             # Safety clamp (though the loop condition `start_index < text_length` should suffice)
             start_index = min(start_index, text_length)
-
-        return chunks